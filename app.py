@@ -2,6 +2,43 @@ import streamlit as st
 
 st.set_page_config(page_title="影響力平台", page_icon="✨", layout="wide")
 
+# 啟動預熱：預先編譯報告模板、背景啟動圖表 / PDF worker（失敗不影響導引頁）
+try:
+    from src.services.report_templates import precompile_templates
+    precompile_templates()
+except Exception:
+    pass
+try:
+    import threading
+    from src.services.reports_pdf import warm_chart_pool, HAS_WEASY
+    threading.Thread(target=warm_chart_pool, daemon=True).start()
+    if HAS_WEASY:
+        from src.services.pdf_renderer import warm_up
+        threading.Thread(target=warm_up, daemon=True).start()
+except Exception:
+    pass
+
+# 背景封存超過保留期的事件（失敗不影響導引頁）
+try:
+    from src.services import event_retention
+    event_retention.start()
+except Exception:
+    pass
+
+# 背景更新轉換漏斗（失敗不影響導引頁）
+try:
+    from src.services import funnel
+    funnel.start()
+except Exception:
+    pass
+
+# 背景封存過期的分享連結（失敗不影響導引頁）
+try:
+    from src.services import share_sweeper
+    share_sweeper.start()
+except Exception:
+    pass
+
 st.title("傳承您的影響力")
 st.write("請從左側選單進入功能頁：首頁、診斷、結果、案件總表（管理）、預約。")
 
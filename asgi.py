@@ -0,0 +1,9 @@
+# asgi.py
+# ASGI 入口：streamlit run asgi.py（或 uvicorn asgi:app）。頁面與 app.py 相同，
+# 另外掛上報告串流下載路由（見 src/services/report_files.py）
+
+import streamlit as st
+
+from src.services.report_files import download_routes
+
+app = st.App("app.py", routes=download_routes())
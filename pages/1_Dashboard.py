@@ -1,23 +1,70 @@
 import streamlit as st
+import pandas as pd
+
+from src.repos.case_repo import CaseRepo
+from src.services import strategy_writer
+from src.services.auth import is_logged_in
 
 st.set_page_config(page_title="顧問 Dashboard", page_icon="📊", layout="wide")
 
 # 檢查是否登入
-if "user" not in st.session_state:
+if not is_logged_in():
     st.warning("請先登入")
     st.stop()
 
-st.title(f"📊 顧問 Dashboard - 歡迎 {st.session_state['user']}")
+advisor_id = st.session_state["advisor_id"]
+st.title(f"📊 顧問 Dashboard - 歡迎 {st.session_state.get('advisor_name') or advisor_id}")
+
+PAGE_SIZE = 20
+STATUSES = ["", "Prospect", "Diagnosed", "Shared", "Unlocked", "Won"]
+
+st.subheader("📋 最近案件")
+status = st.selectbox("狀態", STATUSES, format_func=lambda v: v or "全部")
+
+# keyset 分頁：session 內保存各頁起點游標；篩選條件變更就回到第一頁
+if st.session_state.get("cases_filter") != status:
+    st.session_state["cases_filter"] = status
+    st.session_state["cases_cursors"] = [None]
+cursors = st.session_state["cases_cursors"]
+
+rows = CaseRepo.list_by_advisor(advisor_id, status=status or None, limit=PAGE_SIZE + 1, after=cursors[-1])
+has_next = len(rows) > PAGE_SIZE
+rows = rows[:PAGE_SIZE]
+
+if not rows:
+    st.info("尚無案件。可到診斷頁建立第一個案件。")
+else:
+    st.dataframe(pd.DataFrame([{
+        "案件碼": r["id"],
+        "客戶": r.get("client_alias") or "",
+        "狀態": r.get("status") or "",
+        "淨遺產": r.get("net_estate"),
+        "估算稅額": r.get("tax_estimate"),
+        "更新時間": (r.get("updated_at") or "")[:16].replace('T',' '),
+    } for r in rows]), use_container_width=True, hide_index=True)
 
-# 模擬顧問資料
-clients = [
-    {"姓名": "王小明", "狀態": "問卷完成", "提案進度": "50%"},
-    {"姓名": "李小華", "狀態": "等待填寫問卷", "提案進度": "0%"},
-    {"姓名": "張美麗", "狀態": "提案已送出", "提案進度": "100%"},
-]
+p1, p2, p3 = st.columns([1, 1, 4])
+if p1.button("⬅️ 上一頁", disabled=len(cursors) == 1):
+    cursors.pop(); st.rerun()
+if p2.button("下一頁 ➡️", disabled=not has_next):
+    cursors.append(CaseRepo.cursor(rows[-1])); st.rerun()
+p3.caption(f"第 {len(cursors)} 頁（每頁 {PAGE_SIZE} 筆）")
 
-st.subheader("📋 客戶清單")
-st.table(clients)
+st.subheader("⚠️ 需要關注的案件")
+ATTENTION_SCAN = 500   # 最近更新的案件數（一次向量化評估）
+recent = CaseRepo.list_by_advisor(advisor_id, limit=ATTENTION_SCAN)
+flagged = strategy_writer.needs_attention(pd.DataFrame(recent)) if recent else pd.DataFrame()
+if flagged.empty:
+    st.caption("目前沒有需要特別關注的案件。")
+else:
+    st.caption(f"最近 {len(recent)} 件案件中有 {len(flagged)} 件命中關注規則")
+    st.dataframe(pd.DataFrame({
+        "案件碼": flagged["id"],
+        "客戶": flagged["client_alias"].fillna(""),
+        "狀態": flagged["status"].fillna(""),
+        "關注原因": flagged["attention"].map(lambda cs: "、".join(strategy_writer.LABELS[c] for c in cs)),
+        "估算稅額": flagged["tax_estimate"],
+    }).head(PAGE_SIZE), use_container_width=True, hide_index=True)
 
 st.subheader("🚀 快速操作")
 col1, col2, col3 = st.columns(3)
@@ -6,6 +6,7 @@ from datetime import datetime
 from math import inf
 import streamlit as st
 from src.utils.nav import goto
+from src.services.auth import remember_case
 
 st.set_page_config(page_title="遺產稅診斷", page_icon="💡", layout="wide")
 st.title("📊 遺產稅診斷（單位：萬元）")
@@ -21,6 +22,7 @@ DISABLED_DEDUCTION = 693.0
 OTHER_DEPENDENTS_DEDUCTION = 56.0
 TAX_BRACKETS = [(5621.0, 0.10), (11242.0, 0.15), (inf, 0.20)]
 WAN = 10_000
+RULES_VERSION = "estate-tax-app-v1"  # 同 src/domain/tax_rules.TaxConstants.VERSION
 
 def fmt_wan(x: float) -> str:
     return f"{float(x):,.1f} 萬元"
@@ -96,7 +98,18 @@ if submitted:
         "tax_estimate": _wan_to_yuan(tax_wan),
         "liquidity_needed": _wan_to_yuan(tax_wan),
         "status": "Prospect",
-        "payload_json": None,
+        "payload": {
+            "rules_version": RULES_VERSION,
+            "taxable_base_wan": float(taxable_base_wan),
+            "deductions_wan": float(total_deductions_wan),
+            "params": {
+                "has_spouse": bool(has_spouse),
+                "adult_children": int(adult_children),
+                "parents": int(parents),
+                "disabled_people": int(disabled_people),
+                "other_dependents": int(other_dependents),
+            },
+        },
         "created_at": datetime.utcnow().isoformat(),
         "updated_at": datetime.utcnow().isoformat(),
     }
@@ -105,6 +118,7 @@ if submitted:
         try:
             if hasattr(CaseRepo, "upsert"): CaseRepo.upsert(case_payload)
             else: CaseRepo.create(case_payload)
+            remember_case(case_payload["id"])   # 未登入的訪客也能在結果頁看到自己剛建立的案件
             try:
                 log_safe(case_payload["id"], "CASE_CREATED", {
                     "source": "Diagnostic",
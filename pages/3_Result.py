@@ -12,12 +12,12 @@ if str(ROOT) not in sys.path:
 _HAS_CHARTS = False
 try:
     from src.services.charts import (
-        tax_breakdown_bar, asset_pie, savings_compare_bar, simple_sankey,
+        tax_breakdown_bar, asset_pie, savings_compare_bar, simple_sankey, render_png,
     )
     _HAS_CHARTS = True
 except Exception:
     def _noop(*a, **k): return None
-    tax_breakdown_bar = asset_pie = savings_compare_bar = simple_sankey = _noop
+    tax_breakdown_bar = asset_pie = savings_compare_bar = simple_sankey = render_png = _noop
 
 try:
     from src.services.reports_pdf import build_pdf_report
@@ -29,6 +29,19 @@ try:
 except Exception:
     build_full_report_html = None
 
+from src.services.report_files import download_widget, reports_dir, write_atomic
+from src.services.auth import can_view_case
+
+try:
+    from src.domain.tax_rules import EstateTaxCalculator, TaxConstants
+except Exception:
+    EstateTaxCalculator = None
+
+try:
+    from src.services.coverage_optimizer import optimize as optimize_coverage, OPTION_COLUMNS
+except Exception:
+    optimize_coverage = None
+
 try:
     from src.repos.case_repo import CaseRepo
 except Exception:
@@ -47,17 +60,26 @@ def _fmt_money(x: float) -> str:
     try: return f"{float(x):,.0f}"
     except: return "—"
 
-def _safe_pyplot(fig):
-    if _HAS_CHARTS and fig is not None:
-        st.pyplot(fig, use_container_width=True)
+def _safe_chart(func_name: str, *args):
+    """圖表以 PNG 顯示（共用快取：同參數的圖各 worker 只畫一次）"""
+    if not _HAS_CHARTS:
+        return
+    try:
+        png = render_png(func_name, *args)
+    except Exception:
+        png = None
+    if png:
+        st.image(png, use_container_width=True)
 
 def _load_case(case_id: str | None):
+    """指定的案件（須有權限，見 auth.can_view_case）；沒指定時為登入顧問自己最近的案件"""
     if CaseRepo is None: return None
-    if case_id:
-        row = CaseRepo.get(case_id)
-        if row: return row
     try:
-        rows = CaseRepo.list_latest(limit=1)
+        if case_id:
+            row = CaseRepo.get(case_id)
+            return row if can_view_case(row) else None
+        advisor_id = st.session_state.get("advisor_id")
+        rows = CaseRepo.list_by_advisor(advisor_id, limit=1) if advisor_id else []   # 走 idx_cases_adv_upd
         return rows[0] if rows else None
     except Exception:
         return None
@@ -72,13 +94,12 @@ def _build_and_link_report(case: dict):
     if build_full_report_html:
         try:
             html = build_full_report_html(case)
-            out = pathlib.Path("data/reports"); out.mkdir(parents=True, exist_ok=True)
-            p = out / f"{case.get('id','report')}.html"
-            p.write_text(html, encoding="utf-8"); return str(p), "下載報告（HTML）"
+            p = reports_dir() / f"{case.get('id','report')}.html"
+            write_atomic(p, lambda tmp: tmp.write_text(html, encoding="utf-8"))
+            return str(p), "下載報告（HTML）"
         except Exception:
             pass
-    out = pathlib.Path("data/reports"); out.mkdir(parents=True, exist_ok=True)
-    p = out / f"{case.get('id','report')}.html"
+    p = reports_dir() / f"{case.get('id','report')}.html"
     html = f"""<!doctype html><meta charset="utf-8">
     <h2>規劃報告（簡版）</h2>
     <div>案件：{case.get('id','')}</div>
@@ -89,7 +110,8 @@ def _build_and_link_report(case: dict):
       <li>建議預留稅源：{_fmt_money(case.get('liquidity_needed',0))}</li>
     </ul>
     <small>本報告為教育性質示意，不構成保險或法律建議。</small>"""
-    p.write_text(html, encoding="utf-8"); return str(p), "下載報告（HTML）"
+    write_atomic(p, lambda tmp: tmp.write_text(html, encoding="utf-8"))
+    return str(p), "下載報告（HTML）"
 
 st.set_page_config(page_title="結果與報告", page_icon="📄", layout="wide")
 st.title("📄 結果與報告")
@@ -143,17 +165,14 @@ with st.expander("解鎖並下載完整報告", expanded=True):
     if admin_unlock or credit_unlock:
         path, label = _build_and_link_report(case)
         st.success("已解鎖。您可以下載完整報告。")
-        with open(path, "rb") as fh:
-            st.download_button(label, data=fh.read(), file_name=pathlib.Path(path).name, mime="application/octet-stream")
+        download_widget(st, pathlib.Path(path), label)
 
 st.divider()
 
 left, right = st.columns(2)
 with left:
-    if _HAS_CHARTS:
-        tax = case.get("tax_estimate") or 0.0
-        fig1 = tax_breakdown_bar(tax)  # 若你的 charts 吃「萬」，改 tax/10_000
-        _safe_pyplot(fig1)
+    if _HAS_CHARTS and EstateTaxCalculator is not None:
+        _safe_chart("tax_breakdown_bar", EstateTaxCalculator().case_taxable_base_wan(case))
     else:
         st.info("圖表模組未載入，略過稅額圖。")
 
@@ -163,9 +182,50 @@ with right:
         re_ = case.get("assets_realestate") or 0.0
         biz = case.get("assets_business") or 0.0
         if any([fin, re_, biz]):
-            fig2 = asset_pie(fin, re_, biz)
-            _safe_pyplot(fig2)
+            _safe_chart("asset_pie", fin, re_, biz)
     else:
         st.info("圖表模組未載入，略過資產配置圖。")
 
+# 預留稅源方案試算：從保單 / 信託選項中找保費最低、且稅後資金缺口在目標內的組合
+# （選項過多時改用啟發式，結果標示為近似解）
+_DEFAULT_OPTIONS = [
+    {"name": "終身壽險 A", "premium": 1_000_000, "sum_assured": 1_800_000, "min_units": 0, "max_units": 10},
+    {"name": "終身壽險 B", "premium": 500_000, "sum_assured": 820_000, "min_units": 0, "max_units": 20},
+    {"name": "定期壽險", "premium": 80_000, "sum_assured": 1_000_000, "min_units": 0, "max_units": 5},
+    {"name": "信託預留", "premium": 1_000_000, "sum_assured": 1_000_000, "min_units": 0, "max_units": 50},
+]
+
+if optimize_coverage is not None and EstateTaxCalculator is not None and (case.get("tax_estimate") or 0) > 0:
+    with st.expander("預留稅源方案試算（保單 / 信託組合）"):
+        consts = TaxConstants()
+        base_wan = EstateTaxCalculator(consts).case_taxable_base_wan(case)
+        st.caption("每列為一個選項：premium＝每單位保費、sum_assured＝每單位預留額（元），"
+                   "min_units / max_units＝可投保單位數上下限。")
+        options = st.data_editor(_DEFAULT_OPTIONS, num_rows="dynamic", use_container_width=True,
+                                 column_order=OPTION_COLUMNS, key="cov_opt_options")
+        oc1, oc2 = st.columns(2)
+        target_gap = oc1.number_input("可接受的稅後資金缺口（元）", min_value=0, value=0, step=100_000)
+        reduce = oc2.checkbox("保費由遺產支出（課稅基礎同步減少）", value=True)
+        try:
+            res = optimize_coverage([o for o in options if o.get("premium")], base_wan=float(base_wan),
+                                    target_gap=float(target_gap), constants=consts,
+                                    premiums_reduce_estate=reduce)
+        except Exception as e:
+            res = None
+            st.warning(f"試算失敗：{e}")
+        if res is not None:
+            m1, m2, m3 = st.columns(3)
+            m1.metric("總保費（元）", _fmt_money(res["premium"]))
+            m2.metric("預留額（元）", _fmt_money(res["coverage"]))
+            m3.metric("稅後資金缺口（元）", _fmt_money(res["gap"]))
+            if not res["feasible"]:
+                st.warning("選項上限內無法把缺口壓到目標以下，以下為可達到的最佳組合。")
+            elif not res["exact"]:
+                st.info("選項與單位數組合過多，以下為啟發式近似解，保費未必最低；可縮小單位數上限後重算。")
+            st.dataframe(res["plan"], use_container_width=True, hide_index=True)
+            _safe_chart("savings_compare_bar", round(res["tax"]), round(res["coverage"]))
+            if len(res["alternatives"]):
+                st.caption("單一選項方案（保費由低到高）")
+                st.dataframe(res["alternatives"], use_container_width=True, hide_index=True)
+
 st.caption("＊本頁內容為教育性質示意，不構成保險或法律建議。")
@@ -1,7 +1,9 @@
 import streamlit as st
 from datetime import datetime
 from src.repos.booking_repo import BookingRepo
+from src.repos.case_repo import CaseRepo
 from src.repos.event_repo import EventRepo
+from src.services import availability
 
 import smtplib
 from email.message import EmailMessage
@@ -18,7 +20,18 @@ case_id = st.text_input("案件碼（可選）", value=prefill or q_case or "")
 name = st.text_input("姓名/稱呼*")
 phone = st.text_input("手機*")
 email = st.text_input("Email")
-slot = st.selectbox("時段*", ["這週三 下午","這週五 晚上","下週一 上午","自訂（備註）"])
+
+# 可預約時段：有案件就先找該案件顧問的時段，沒有再列出所有顧問
+case_row = CaseRepo.get(case_id) if case_id else None
+case_advisor = (case_row or {}).get("advisor_id")
+slots = availability.available(case_advisor) if case_advisor else []
+if not slots:
+    slots = availability.available()
+NO_SLOT = "請顧問與我聯繫安排時間"
+options = [s["id"] for s in slots] + [NO_SLOT]
+labels = {s["id"]: availability.slot_label(s, with_advisor=not case_advisor) for s in slots}
+slot_choice = st.selectbox("時段*", options, format_func=lambda v: labels.get(v, v))
+slot = labels.get(slot_choice, NO_SLOT)
 note = st.text_area("備註（可選）")
 agree = st.checkbox("我已閱讀並同意隱私權政策與資料使用說明。")
 
@@ -42,14 +55,22 @@ def send_email(to_email: str, subject: str, body: str):
         return False
 
 if st.button("送出預約", type="primary", disabled=not agree or not name.strip() or not phone.strip()):
-    bid = BookingRepo.create({
+    payload = {
         "case_id": case_id or None,
         "name": name.strip(),
         "phone": phone.strip(),
         "email": email.strip() or None,
         "timeslot": f"{slot}{'｜'+note.strip() if note.strip() else ''}",
-    })
-    EventRepo.log(case_id or "N/A", "BOOKING_CREATED", {"booking_id": bid})
+    }
+    if slot_choice == NO_SLOT:
+        bid = BookingRepo.create(payload)
+    else:
+        # 原子佔位：名額已被搶走就請客戶改選
+        bid = availability.reserve(slot_choice, payload)
+        if bid is None:
+            st.error("這個時段剛被預約走了，請重新選擇其他時段。")
+            st.stop()
+    EventRepo.log(case_id or "N/A", "BOOKING_CREATED", {"booking_id": bid, "slot_id": None if slot_choice == NO_SLOT else slot_choice})
     st.success("預約資訊已送出，顧問將與您聯繫！")
 
     cfg, miss = _smtp_cfg()
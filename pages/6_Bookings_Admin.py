@@ -1,11 +1,95 @@
 import streamlit as st
 import pandas as pd
-from src.db import get_conn
+from datetime import datetime, timedelta
+
+from src.repos.booking_repo import BookingRepo
+from src.repos.event_repo import EventRepo
+from src.services import snapshot
+from src.services.auth import is_logged_in, current_role
 
 st.set_page_config(page_title="預約管理", page_icon="🗂️", layout="wide")
 
 st.title("🗂️ 預約管理（Admin）")
-conn = get_conn()
 
-bookings = pd.read_sql_query("SELECT * FROM bookings ORDER BY created_at DESC", conn)
-st.dataframe(bookings, use_container_width=True)
+if not is_logged_in() or current_role() != "admin":
+    st.error("本頁僅限管理者存取。")
+    st.stop()
+
+PAGE_SIZE = 100
+
+flash = st.session_state.pop("bk_flash", None)
+if flash:
+    st.success(flash)
+
+# KPI 與匯出讀唯讀快照；下方分頁列表走線上索引查詢，狀態變更會立即反映
+snapshot.freshness_caption(st)
+counts = {r["status"]: int(r["n"]) for r in snapshot.read_df(
+    "SELECT coalesce(status, 'Pending') AS status, count(*) AS n FROM bookings GROUP BY 1"
+).to_dict("records")}
+cols = st.columns(len(BookingRepo.STATUSES) + 1)
+cols[0].metric("全部", f"{sum(counts.values()):,}")
+for c, s in zip(cols[1:], BookingRepo.STATUSES):
+    c.metric(s, f"{counts.get(s, 0):,}")
+
+# 篩選
+f1, f2, f3 = st.columns([1, 1, 2])
+status = f1.selectbox("狀態", [""] + list(BookingRepo.STATUSES), format_func=lambda v: v or "全部")
+case_id = f2.text_input("案件碼").strip()
+rng = f3.date_input("建立日期區間", value=())
+
+since = until = None
+if isinstance(rng, (list, tuple)) and len(rng) == 2:
+    since = datetime.combine(rng[0], datetime.min.time()).isoformat()
+    until = datetime.combine(rng[1] + timedelta(days=1), datetime.min.time()).isoformat()
+
+# keyset 分頁：篩選條件變更就回到第一頁
+filt = (status, case_id, since, until)
+if st.session_state.get("bk_filter") != filt:
+    st.session_state["bk_filter"] = filt
+    st.session_state["bk_cursors"] = [None]
+cursors = st.session_state["bk_cursors"]
+
+rows, next_cursor = BookingRepo.page(
+    status=status or None, case_id=case_id or None, since=since, until=until,
+    after=cursors[-1], limit=PAGE_SIZE,
+)
+
+if not rows:
+    st.info("沒有符合條件的預約。")
+else:
+    df = pd.DataFrame(rows)
+    df.insert(0, "選取", False)
+    edited = st.data_editor(
+        df, use_container_width=True, hide_index=True, key=f"bk_editor_{len(cursors)}_{hash(filt)}",
+        disabled=[c for c in df.columns if c != "選取"],
+    )
+    selected = edited.loc[edited["選取"], "id"].astype(int).tolist()
+
+    # 批次狀態轉換（單一交易；不允許的轉換會被略過）
+    a1, a2 = st.columns([1, 3])
+    to_status = a1.selectbox("批次改為", list(BookingRepo.TRANSITIONS))
+    a2.caption(f"已選 {len(selected)} 筆；可從 {' / '.join(BookingRepo.TRANSITIONS[to_status])} 轉為 {to_status}")
+    if st.button("套用狀態", type="primary", disabled=not selected):
+        changed = BookingRepo.bulk_set_status(selected, to_status)
+        now = datetime.utcnow().isoformat()
+        EventRepo.log_many([
+            (c["case_id"] or "N/A", "BOOKING_STATUS",
+             {"booking_id": c["id"], "from": c["from_status"], "to": to_status}, now)
+            for c in changed
+        ])
+        skipped = len(selected) - len(changed)
+        st.session_state["bk_flash"] = f"已更新 {len(changed)} 筆" + (f"，{skipped} 筆狀態不允許轉換或原時段已額滿，已略過" if skipped else "")
+        st.rerun()
+
+p1, p2, p3 = st.columns([1, 1, 4])
+if p1.button("⬅️ 上一頁", disabled=len(cursors) == 1):
+    cursors.pop(); st.rerun()
+if p2.button("下一頁 ➡️", disabled=next_cursor is None):
+    cursors.append(next_cursor); st.rerun()
+p3.caption(f"第 {len(cursors)} 頁（每頁 {PAGE_SIZE} 筆）")
+
+with st.expander("匯出全部預約（快照）"):
+    if st.button("產生 CSV"):
+        csv = snapshot.read_df("SELECT * FROM bookings ORDER BY created_at DESC").to_csv(index=False)
+        st.download_button("⬇️ 下載 bookings.csv", data=csv.encode("utf-8-sig"),
+                           file_name="bookings.csv", mime="text/csv")
@@ -35,22 +35,24 @@ def human_period(s: datetime, e: datetime) -> str:
     return f"{s.strftime('%Y-%m-%d')} ~ {e.strftime('%Y-%m-%d')}"
 
 try:
-    from src.repos.event_repo import EventRepo
+    from src.services import snapshot
 except Exception:
-    EventRepo = None
+    snapshot = None
 
 def load_events(start_dt: datetime, end_dt: datetime) -> pd.DataFrame:
-    if EventRepo is None:
+    if snapshot is None:
         return pd.DataFrame(columns=["ts","advisor_id","advisor_name","event_type"])
+    # 讀唯讀快照（events.created_at 為 UTC naive ISO）；顧問資訊由案件帶出
+    utc = lambda d: d.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
     try:
-        if hasattr(EventRepo, "list_range"):
-            rows = EventRepo.list_range(start_dt.isoformat(), end_dt.isoformat())
-        elif hasattr(EventRepo, "list_since"):
-            rows = EventRepo.list_since(start_dt.isoformat())
-        elif hasattr(EventRepo, "list_all"):
-            rows = EventRepo.list_all()
-        else:
-            rows = []
+        rows = snapshot.read_df(
+            """
+            SELECT e.created_at AS ts, c.advisor_id, c.advisor_name, e.event AS event_type
+            FROM events e LEFT JOIN cases c ON c.id = e.case_id
+            WHERE e.created_at >= ? AND e.created_at <= ?
+            """,
+            (utc(start_dt), utc(end_dt)),
+        )
     except Exception:
         rows = []
 
@@ -75,6 +77,66 @@ st.caption(f"期間：{human_period(start_dt, end_dt)}")
 role = st.session_state.get("advisor_role", "user")
 is_admin = (role == "admin")
 st.caption("管理者視角：顯示全站事件" if is_admin else "顧問視角：僅顯示本人事件")
+if snapshot is not None:
+    snapshot.freshness_caption(st)
+
+try:
+    from src.services import event_retention
+except Exception:
+    event_retention = None
+
+if is_admin and event_retention is not None:
+    with st.expander(f"封存事件查詢（超過 {event_retention.RETENTION_DAYS} 天的事件已移至月封存檔）", expanded=False):
+        months = event_retention.archived_months()
+        if not months:
+            st.caption("尚無封存月份。")
+        else:
+            a1, a2, a3 = st.columns([1, 1, 2])
+            month = a1.selectbox("月份（UTC）", months[::-1])
+            arc_case = a2.text_input("案件碼", key="arc_case").strip()
+            arc_events = a3.text_input("事件類型（逗號分隔，可留空）", key="arc_events")
+            if st.button("查詢封存"):
+                wanted = [e.strip().upper() for e in arc_events.split(",") if e.strip()] or None
+                arc = event_retention.read_archived_df(months=[month], case_id=arc_case or None, events=wanted)
+                st.caption(f"共 {len(arc):,} 筆")
+                st.dataframe(arc.head(1000), use_container_width=True, hide_index=True)
+                st.download_button(f"⬇️ 下載 events_{month}.csv", data=arc.to_csv(index=False).encode("utf-8-sig"),
+                                   file_name=f"events_{month}.csv", mime="text/csv")
+
+try:
+    from src.services import funnel
+except Exception:
+    funnel = None
+
+if funnel is not None:
+    st.subheader("轉換漏斗（依案件建立時間分群）")
+    try:
+        c1, c2 = st.columns([4, 1])
+        c1.caption(f"背景每 {funnel.INTERVAL // 60} 分鐘併入新事件。")
+        if c2.button("立即更新", key="funnel_refresh"):
+            funnel.refresh()   # 只處理上次之後的新事件
+        per = st.radio("期間", ["週", "月"], index=1, horizontal=True)
+        scope = None if is_admin else st.session_state.get("advisor_id")
+        total = funnel.summary(start_dt, end_dt, by=(), advisor_id=scope)
+        if total.empty or not int(total["n_created_at"].iloc[0]):
+            st.caption("這段期間沒有新建立的案件。")
+        else:
+            row = total.iloc[0]
+            mcols = st.columns(len(funnel.STAGES))
+            for mc, (col, label) in zip(mcols, funnel.STAGES):
+                rate = "" if col == "created_at" else f"{row[f'rate_{col}']:.0%}"
+                mc.metric(label, f"{int(row[f'n_{col}']):,}", rate or None, delta_color="off")
+            table = funnel.summary(start_dt, end_dt, by=("advisor", "period"),
+                                   period="W" if per == "週" else "M", advisor_id=scope, tz=TZ)
+            rename = {"advisor_name": "顧問", "advisor_id": "顧問ID", "period": "期間"}
+            rename.update({f"n_{c}": l for c, l in funnel.STAGES + funnel.EXTRA_STAGES})
+            rename.update({f"step_{c}": f"{l}轉換率" for c, l in funnel.STAGES[1:]})
+            rename.update({f"hours_{p}_{c}": f"{pl}→{l}（時，中位數）"
+                           for (p, pl), (c, l) in zip(funnel.STAGES, funnel.STAGES[1:])})
+            show = table[[c for c in rename if c in table.columns]].rename(columns=rename)
+            st.dataframe(show, use_container_width=True, hide_index=True)
+    except Exception as e:
+        st.caption(f"漏斗暫時無法計算：{e}")
 
 df = load_events(start_dt, end_dt)
 if df.empty:
@@ -1,8 +1,11 @@
 import streamlit as st
 import pandas as pd
 
-from src.services.share import create_share
+from src.services.share import create_share, revoke
+from src.repos.case_repo import CaseRepo
 from src.repos.share_repo import ShareRepo
+from src.repos.slot_repo import SlotRepo
+from src.services import availability
 from src.services.auth import is_logged_in, current_role
 
 st.set_page_config(page_title="顧問面板", page_icon="🧭", layout="wide")
@@ -20,6 +23,23 @@ role = current_role()
 
 st.caption(f"目前身份：{advisor_name}（{advisor_id}）｜角色：{role}")
 
+st.subheader("搜尋案件")
+q = st.text_input("客戶代稱 / 案件碼 / 備註關鍵字", placeholder="例如：王、AB12")
+if q.strip():
+    # 管理者可搜尋全部案件，其餘只搜尋自己的案件
+    hits = CaseRepo.search(q, advisor_id=None if role == "admin" else advisor_id)
+    if hits:
+        st.dataframe(pd.DataFrame([{
+            "案件碼": h["id"],
+            "客戶": h.get("client_alias") or "",
+            "顧問": h.get("advisor_name") or "",
+            "狀態": h.get("status") or "",
+            "淨遺產": h.get("net_estate"),
+            "更新時間": (h.get("updated_at") or "")[:16].replace('T',' '),
+        } for h in hits]), use_container_width=True, hide_index=True)
+    else:
+        st.info("找不到符合的案件。")
+
 with st.form("create_share"):
     st.subheader("建立分享連結")
     case_id = st.text_input("案件碼 Case ID")
@@ -39,9 +59,24 @@ if submitted:
 st.divider()
 
 st.subheader("我發出的分享連結")
-rows = ShareRepo.list_by_advisor(advisor_id)
+PAGE_SIZE = 50
+f1, f2 = st.columns(2)
+expiry = f1.selectbox("到期狀態", ["active", "expired", "all"],
+                      format_func=lambda v: {"active": "有效", "expired": "已到期", "all": "全部"}[v])
+status = f2.selectbox("案件狀態", ["", "Prospect", "Diagnosed", "Shared", "Unlocked", "Won"],
+                      format_func=lambda v: v or "全部")
+
+# keyset 分頁：session 內保存各頁起點游標；篩選條件變更就回到第一頁
+filt = (expiry, status)
+if st.session_state.get("dash_filter") != filt:
+    st.session_state["dash_filter"] = filt
+    st.session_state["dash_cursors"] = [None]
+cursors = st.session_state["dash_cursors"]
+rows, next_cursor = ShareRepo.page_by_advisor(
+    advisor_id, status=status or None, expiry=expiry, after=cursors[-1], limit=PAGE_SIZE,
+)
 if not rows:
-    st.info("尚未建立分享連結。")
+    st.info("尚未建立分享連結。" if len(cursors) == 1 else "沒有更多連結。")
 else:
     base_url = st.secrets.get("APP_BASE_URL", "")
     def make_link(tok: str) -> str:
@@ -49,21 +84,64 @@ else:
     df = pd.DataFrame([{
         "建立時間": (r.get("created_at") or "")[:19].replace('T',' '),
         "案件碼": r.get("case_id"),
+        "客戶": r.get("client_alias") or "",
+        "淨遺產": r.get("net_estate"),
+        "案件狀態": r.get("case_status") or "",
         "連結": make_link(r.get("token")),
         "到期": (r.get("expires_at") or "")[:10],
-        "已開啟": bool(r.get("opened_at")),
-        "已意向": bool(r.get("accepted_at")),
-        "token": r.get("token"),
+        "開啟次數": int(r.get("opens") or 0),
+        "訪客數": int(r.get("unique_visitors") or 0),
+        "最後開啟": (r.get("last_opened_at") or "")[:16].replace('T',' '),
+        "已意向": bool(r.get("accepted_at")) or int(r.get("accepts") or 0) > 0,
     } for r in rows])
-    st.dataframe(df.drop(columns=["token"]), use_container_width=True)
+    st.dataframe(df, use_container_width=True)
+
+p1, p2, p3 = st.columns([1, 1, 4])
+if p1.button("⬅️ 上一頁", disabled=len(cursors) == 1):
+    cursors.pop(); st.rerun()
+if p2.button("下一頁 ➡️", disabled=next_cursor is None):
+    cursors.append(next_cursor); st.rerun()
+p3.caption(f"第 {len(cursors)} 頁（每頁 {PAGE_SIZE} 筆）")
 
+if rows:
     # 停用功能
     tok = st.text_input("輸入要停用的 token（從上方連結取值）")
     if st.button("停用該連結") and tok:
-        ok = ShareRepo.delete_by_token(tok)
+        ok = revoke(tok)
         if ok:
             st.success("已停用（刪除）該分享連結。")
         else:
             st.error("找不到該 token 或已移除。")
 
-st.caption("*提示：停用會直接移除該 token；客戶再開啟將看到『無效或撤銷』訊息。*")
+st.caption("*提示：停用會直接移除該 token；客戶再開啟將看到『無效或撤銷』訊息。開啟次數約每 10 秒彙整一次。*")
+
+st.divider()
+
+st.subheader("我的可預約時段")
+with st.form("open_slots"):
+    c1, c2, c3 = st.columns(3)
+    days = c1.multiselect("星期", list(range(7)), default=sorted(availability.DEFAULT_TEMPLATE),
+                          format_func=lambda d: availability.WEEKDAYS[d])
+    times = c2.text_input("開始時間（逗號分隔）", value="10:00,14:00")
+    weeks = c3.number_input("開放週數", min_value=1, max_value=12, value=4)
+    capacity = c3.number_input("每時段名額", min_value=1, max_value=10, value=1)
+    open_submitted = st.form_submit_button("開放時段")
+
+if open_submitted:
+    try:
+        hhmm = [t.strip() for t in times.split(",") if t.strip()]
+        n = availability.open_weeks(advisor_id, weeks=int(weeks), template={d: hhmm for d in days},
+                                    capacity=int(capacity))
+        st.success(f"已開放 / 更新 {n} 個時段。")
+    except ValueError:
+        st.error("時間格式請用 HH:MM，例如 10:00,14:00")
+
+my_slots = SlotRepo.list_by_advisor(advisor_id)
+if my_slots:
+    st.dataframe(pd.DataFrame([{
+        "時段": availability.slot_label(s),
+        "名額": s["capacity"],
+        "已預約": s["booked"],
+    } for s in my_slots]), use_container_width=True, hide_index=True)
+else:
+    st.info("尚未開放任何時段；客戶預約時只能留下聯絡方式。")
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 from io import StringIO
 
-from src.db import get_conn
+from src.services import snapshot
 from src.services.auth import is_logged_in, current_role
 
 st.set_page_config(page_title="點數對帳（Admin）", page_icon="💳", layout="wide")
@@ -13,10 +13,11 @@ if not is_logged_in() or current_role() != "admin":
     st.error("本頁僅限管理者存取。")
     st.stop()
 
-conn = get_conn()
+# 全表查詢與匯出都讀唯讀快照，不佔用線上資料庫
+snapshot.freshness_caption(st)
 
 def _df(sql: str):
-    return pd.read_sql_query(sql, conn)
+    return snapshot.read_df(sql)
 
 # KPI
 w = _df("SELECT * FROM wallets")
@@ -1,15 +1,14 @@
 # pages/Login.py
 # 顧問登入（Email OTP）— 已登入自動跳轉
-# - 白名單驗證（secrets.ADVISORS）
+# - 白名單驗證（services.advisors：secrets.ADVISORS / 名冊檔）
 # - SMTP 可選；未設時顯示測試用 OTP
-# - OTP 節流與鎖定
+# - OTP 節流與鎖定（存在 DB，跨 session / 多副本共用；見 services.auth）
 # - 已登入或登入成功後：用 goto 跳到 POST_LOGIN_PAGE（預設 Dashboard）
 
-import time
-import random
-from datetime import datetime, timedelta
 import streamlit as st
 from src.utils.nav import goto
+from src.services import advisors
+from src.services.auth import issue_otp, verify_otp, lock_remaining, attempts_left, login, OTP_TTL, LOCK_SECONDS
 
 st.set_page_config(page_title="顧問登入（Email OTP）", page_icon="🔒", layout="centered")
 st.title("🔐 顧問登入（Email OTP）")
@@ -17,62 +16,13 @@ st.caption("輸入公司白名單 Email。我們會寄送 6 位數驗證碼。
 
 TARGET_PAGE = st.secrets.get("POST_LOGIN_PAGE", "pages/1_Dashboard.py")
 
-def _now() -> float:
-    return time.time()
-
-def _normalize_email(e: str) -> str:
-    return (e or "").strip().lower()
-
-def _get_advisors():
-    tbl = st.secrets.get("ADVISORS", {})
-    return {k.strip().lower(): v for k, v in dict(tbl).items()}
-
-def _parse_display_and_role(val: str):
-    if not val: return ("", "user")
-    parts = [p.strip() for p in str(val).split("|", 1)]
-    return (parts[0], (parts[1].lower() if len(parts) > 1 else "user") or "user")
-
 def _is_whitelisted(email: str):
-    advisors = _get_advisors()
-    val = advisors.get(_normalize_email(email))
-    if not val: return None
-    name, role = _parse_display_and_role(val)
-    return {"name": name or email, "role": ("admin" if role == "admin" else "user")}
-
-def _gen_otp() -> str:
-    return f"{random.randint(0, 999999):06d}"
-
-def _smtp_enabled() -> bool:
-    s = st.secrets.get("SMTP", {})
-    return bool(s and s.get("HOST") and s.get("PORT") and s.get("USER") and s.get("PASS") and s.get("FROM"))
-
-def _send_otp_smtp(to_email: str, code: str) -> bool:
-    try:
-        from email.message import EmailMessage
-        import smtplib, ssl
-        cfg = st.secrets.get("SMTP", {})
-        host = cfg.get("HOST"); port = int(cfg.get("PORT", 587))
-        user = cfg.get("USER"); pwd = cfg.get("PASS"); sender = cfg.get("FROM")
-        msg = EmailMessage()
-        msg["Subject"] = "您的登入驗證碼"
-        msg["From"] = sender
-        msg["To"] = to_email
-        msg.set_content(f"您的登入驗證碼是：{code}\n10 分鐘內有效。")
-        context = ssl.create_default_context()
-        with smtplib.SMTP(host, port) as server:
-            server.starttls(context=context)
-            server.login(user, pwd)
-            server.send_message(msg)
-        return True
-    except Exception:
-        return False
+    adv = advisors.lookup(email)
+    if not adv: return None
+    return {"name": adv.name, "role": adv.role}
 
 # 初始化
 st.session_state.setdefault("otp_email", "")
-st.session_state.setdefault("otp_code", "")
-st.session_state.setdefault("otp_expires_at", 0.0)
-st.session_state.setdefault("otp_attempts", 0)
-st.session_state.setdefault("otp_lock_until", 0.0)
 
 # 已登入 → 直接跳轉
 if st.session_state.get("auth_ok", False):
@@ -90,7 +40,7 @@ with st.form("login_form"):
         code_input = st.text_input("驗證碼（6 位數）", value="", max_chars=6)
     login_req = st.form_submit_button("登入")
 
-email_norm = _normalize_email(email)
+email_norm = advisors.normalize_email(email)
 
 # 寄送驗證碼
 if send_req:
@@ -98,57 +48,37 @@ if send_req:
     if not wl:
         st.error("此 Email 未在顧問白名單中，請聯繫管理員新增。")
     else:
-        if _now() < st.session_state["otp_lock_until"]:
-            wait_s = int(st.session_state["otp_lock_until"] - _now())
-            st.warning(f"嘗試次數過多，請 {wait_s} 秒後再試。")
+        try:
+            code = issue_otp(email_norm)
+        except RuntimeError as e:
+            wait_s = lock_remaining(email_norm)
+            st.warning(f"嘗試次數過多，請 {wait_s} 秒後再試。" if wait_s else str(e))
         else:
-            code = _gen_otp()
-            st.session_state["otp_email"] = email_norm
-            st.session_state["otp_code"] = code
-            st.session_state["otp_expires_at"] = (_now() + 600)
-            st.session_state["otp_attempts"] = 0
-            if _smtp_enabled():
-                ok = _send_otp_smtp(email_norm, code)
-                if ok:
-                    st.info("驗證碼已寄出，請於 10 分鐘內輸入完成登入。")
-                else:
-                    st.warning("寄送失敗，但可用下方測試用驗證碼登入。")
-                    st.code(code, language="text")
+            if not st.session_state.get("otp_dev_visible"):
+                st.info(f"驗證碼已寄出，請於 {OTP_TTL // 60} 分鐘內輸入完成登入。")
             else:
-                st.info("尚未設定 SMTP，以下為測試用驗證碼（上線前請設定 SMTP）：")
+                st.info("尚未設定 SMTP 或寄送失敗，以下為測試用驗證碼（上線前請設定 SMTP）：")
                 st.code(code, language="text")
 
 # 登入
 if login_req:
-    if _now() < st.session_state["otp_lock_until"]:
-        wait_s = int(st.session_state["otp_lock_until"] - _now())
+    wait_s = lock_remaining(email_norm) if email_norm else 0
+    if wait_s:
         st.error(f"嘗試次數過多，請 {wait_s} 秒後再試。")
     elif not email_norm or email_norm != st.session_state.get("otp_email"):
         st.error("請先輸入 Email 並點『寄送驗證碼』。")
+    elif not verify_otp(code_input or "", email_norm):
+        if lock_remaining(email_norm):
+            st.error(f"驗證碼錯誤次數過多，已鎖定 {LOCK_SECONDS // 60} 分鐘。")
+        else:
+            st.error(f"驗證碼錯誤或已過期，請再試。尚可再試 {attempts_left(email_norm)} 次。")
     else:
-        sent = st.session_state.get("otp_code", "")
-        expires = st.session_state.get("otp_expires_at", 0.0)
-        if not sent:
-            st.error("尚未產生驗證碼，請先點『寄送驗證碼』。")
-        elif _now() > expires:
-            st.error("驗證碼已過期，請重新取得。")
-        elif (code_input or "").strip() != sent:
-            st.session_state["otp_attempts"] += 1
-            remain = max(0, 5 - st.session_state["otp_attempts"])
-            if remain == 0:
-                st.session_state["otp_lock_until"] = _now() + 600
-                st.error("驗證碼錯誤次數過多，已鎖定 10 分鐘。")
-            else:
-                st.error(f"驗證碼錯誤，請再試。尚可再試 {remain} 次。")
+        wl = _is_whitelisted(email_norm)
+        if not wl:
+            st.error("此 Email 未在顧問白名單中。")
         else:
-            wl = _is_whitelisted(email_norm)
-            if not wl:
-                st.error("此 Email 未在顧問白名單中。")
-            else:
-                st.session_state["auth_ok"] = True
-                st.session_state["advisor_id"] = email_norm
-                st.session_state["advisor_name"] = wl["name"]
-                st.session_state["advisor_role"] = wl["role"]
-                st.success(f"登入成功：{wl['name']}｜角色：{wl['role']}")
-                goto(st, TARGET_PAGE)
-                st.stop()
+            login(email_norm, wl["name"], wl["role"])
+            st.session_state["auth_ok"] = True
+            st.success(f"登入成功：{wl['name']}｜角色：{wl['role']}")
+            goto(st, TARGET_PAGE)
+            st.stop()
@@ -1,8 +1,6 @@
 import streamlit as st
-import json
 
-from src.services.share import record_open, record_accept
-from src.repos.share_repo import ShareRepo
+from src.services.share import get_link, is_expired, record_open, record_accept
 from src.repos.case_repo import CaseRepo
 
 st.set_page_config(page_title="分享視圖", page_icon="🔗", layout="wide")
@@ -15,18 +13,20 @@ if not token:
     st.error("缺少 token。請使用完整分享連結。")
     st.stop()
 
-share = ShareRepo.get_by_token(token)
+# 連結資料經共用快取；一次查詢即可區分「已到期」或「無效」
+share = get_link(token)
 if not share:
     st.error("連結無效或已被撤銷。請聯絡您的顧問重新取得。")
     st.stop()
-
-# 過期檢查
-if ShareRepo.is_expired(share):
+if is_expired(share):
     st.error("連結已到期。請聯絡您的顧問重新取得新連結。")
     st.stop()
 
-# 記錄開啟
-record_open(token)
+# 記錄開啟（每個 session 只記一次，rerun 不重複計）
+_opened = st.session_state.setdefault("share_opened_tokens", set())
+if token not in _opened:
+    record_open(token, share)
+    _opened.add(token)
 
 case = CaseRepo.get(share["case_id"])
 if not case:
@@ -40,17 +40,14 @@ col[0].metric("淨遺產（元）", f"{case['net_estate']:,.0f}")
 col[1].metric("估算稅額（元）", f"{case['tax_estimate']:,.0f}")
 col[2].metric("建議預留稅源（元）", f"{case['liquidity_needed']:,.0f}")
 
-payload = {}
-try:
-    payload = json.loads(case.get("payload_json") or case.get("plan_json") or "{}")
-except Exception:
-    payload = {}
+# CaseRepo 已解析好 payload；規則版本 / 課稅基礎直接取產生欄位
+payload = case.get("payload") or {}
 
 with st.expander("更多內容（簡版）", expanded=True):
     st.write("此頁為教育性質示意，僅供討論參考，不構成保險或法律建議。詳細規劃請與顧問預約會議。")
     st.json({
-        "規則版本": payload.get("rules_version"),
-        "課稅基礎_萬": payload.get("taxable_base_wan"),
+        "規則版本": case.get("rules_version"),
+        "課稅基礎_萬": case.get("taxable_base_wan"),
         "參數": payload.get("params", {}),
     })
 
@@ -58,7 +55,7 @@ st.divider()
 
 st.subheader("我想要完整方案 ➜")
 if st.button("通知顧問，安排完整方案"):
-    record_accept(token)
+    record_accept(token, share)
     st.session_state["incoming_case_id"] = case["id"]
     st.success("已通知顧問！請點下方按鈕預約會談。")
 
@@ -1,88 +1,62 @@
+from contextlib import contextmanager
 from pathlib import Path
-import sqlite3
+import threading
+
+from src import storage
 
 DB_PATH = Path("data/app.db")
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-SCHEMA_SQL = """
-PRAGMA journal_mode=WAL;
-
-CREATE TABLE IF NOT EXISTS cases (
-  id TEXT PRIMARY KEY,
-  advisor_id TEXT,
-  advisor_name TEXT,
-  client_alias TEXT,
-  assets_financial REAL,
-  assets_realestate REAL,
-  assets_business REAL,
-  liabilities REAL,
-  net_estate REAL,
-  tax_estimate REAL,
-  liquidity_needed REAL,
-  status TEXT DEFAULT 'Prospect',
-  payload_json TEXT,
-  created_at TEXT,
-  updated_at TEXT
-);
-
-CREATE TABLE IF NOT EXISTS bookings (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  case_id TEXT,
-  name TEXT,
-  phone TEXT,
-  email TEXT,
-  timeslot TEXT,
-  created_at TEXT,
-  status TEXT DEFAULT 'Pending'
-);
-
-CREATE TABLE IF NOT EXISTS events (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  case_id TEXT,
-  event TEXT,
-  meta TEXT,
-  created_at TEXT
-);
-
-CREATE TABLE IF NOT EXISTS shares (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  token TEXT UNIQUE,
-  case_id TEXT,
-  advisor_id TEXT,
-  created_at TEXT,
-  expires_at TEXT,
-  opened_at TEXT,
-  accepted_at TEXT
-);
-
-CREATE TABLE IF NOT EXISTS wallets (
-  advisor_id TEXT PRIMARY KEY,
-  balance INTEGER DEFAULT 0,
-  updated_at TEXT
-);
-
-CREATE TABLE IF NOT EXISTS credit_txns (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  advisor_id TEXT,
-  change INTEGER,
-  reason TEXT,
-  meta TEXT,
-  created_at TEXT
-);
-
--- 索引（避免重複建立）
-CREATE INDEX IF NOT EXISTS idx_events_case ON events(case_id, created_at);
-CREATE INDEX IF NOT EXISTS idx_shares_token ON shares(token);
-CREATE INDEX IF NOT EXISTS idx_shares_adv ON shares(advisor_id, created_at);
-CREATE INDEX IF NOT EXISTS idx_txns_adv ON credit_txns(advisor_id, created_at);
-"""
+# 後端由設定選擇（見 src/storage/__init__.py）；SQLite schema 見 src/migrations.py，
+# PostgreSQL schema 見 src/storage/postgres.py
+DIALECT = storage.dialect()
 
 _conn = None
+_conn_lock = threading.Lock()
+_tx_lock = threading.RLock()
+
 
 def get_conn():
     global _conn
     if _conn is None:
-        _conn = sqlite3.connect(DB_PATH.as_posix(), check_same_thread=False)
-        _conn.row_factory = sqlite3.Row
-        _conn.executescript(SCHEMA_SQL)
+        with _conn_lock:
+            if _conn is None:
+                if DIALECT == "postgres":
+                    from src.storage import postgres
+                    lo, hi = storage.pool_size()
+                    _conn = postgres.connect(storage.database_url(), min_size=lo, max_size=hi)
+                else:
+                    from src.storage import sqlite
+                    _conn = sqlite.connect(DB_PATH.as_posix())
     return _conn
+
+
+def stream(sql: str, args=(), *, batch: int = 500):
+    """逐批讀取大量資料：SQLite 用 fetchmany，PostgreSQL 用 server-side cursor"""
+    conn = get_conn()
+    if DIALECT == "postgres":
+        return conn.stream(sql, args, batch=batch)
+    from src.storage import sqlite
+    return sqlite.stream(conn, sql, args, batch=batch)
+
+
+def reclaim_space() -> int:
+    """大量刪除後歸還空間（SQLite；PostgreSQL 交給 autovacuum）"""
+    if DIALECT == "postgres":
+        return 0
+    from src.storage import sqlite
+    path = get_conn().execute("PRAGMA database_list").fetchone()["file"]
+    return sqlite.reclaim(path)
+
+
+@contextmanager
+def transaction():
+    """
+    共用連線上的寫入交易：同一 process 內的執行緒依序進入（避免彼此的 commit / rollback
+    混到別人的半套寫入），結束時 commit，例外時 rollback。
+    所有寫入都必須經過這裡；直接在共用連線上 execute + commit 會把別人進行中的交易一起提交。
+    """
+    conn = get_conn()
+    with _tx_lock:
+        with conn:
+            yield conn
@@ -6,8 +6,11 @@ from datetime import date, datetime
 from typing import Optional, Tuple, List
 
 from src.domain.tax_rules import TaxConstants
+from src.services.cache import cache, make_key
 
 CONFIG_PATH = Path("src/domain/tax_config.json")
+CACHE_NS = "tax"
+CACHE_TTL = 86400  # 秒；設定檔修改時間也在 key 內，改檔立即生效
 
 def _parse_date(s: str) -> date:
     return datetime.strptime(s, "%Y-%m-%d").date()
@@ -22,9 +25,13 @@ def load_tax_constants(
     載入 JSON 設定，挑選最適用版本：
       - 若指定 version，直接取該版本
       - 否則用 on_date（預設 today）挑選 effective_from <= on_date 的最新版本
-    回傳 TaxConstants（單位：萬）
+    回傳 TaxConstants（單位：萬）；結果放在共用快取（各 worker 共用）
     """
     on = on_date or date.today()
+    key = make_key(Path(config_path).resolve().as_posix(), Path(config_path).stat().st_mtime_ns, version, on.isoformat())
+    return cache.get_or_set(CACHE_NS, key, lambda: _load(on, version, config_path), ttl=CACHE_TTL)
+
+def _load(on: date, version: Optional[str], config_path: Path) -> TaxConstants:
     data = json.loads(config_path.read_text(encoding="utf-8"))
     versions = data.get("versions", [])
     if not versions:
@@ -66,6 +66,31 @@ class EstateTaxCalculator:
             prev_upper = upper
         return max(tax, 0.0)
 
+    def inverse_progressive_tax_wan(self, tax_wan: float) -> float:
+        """progressive_tax_wan 的反函數：稅額為 tax_wan 時的課稅基礎（各級距內為線性，直接解出）"""
+        if tax_wan <= 0:
+            return 0.0
+        acc = 0.0
+        prev_upper = 0.0
+        for upper, rate in self.c.TAX_BRACKETS:
+            band = (upper - prev_upper) * rate
+            if tax_wan <= acc + band or upper == float("inf"):
+                return prev_upper + (tax_wan - acc) / rate
+            acc += band
+            prev_upper = upper
+        return prev_upper
+
+    def case_taxable_base_wan(self, case: Dict[str, Any]) -> float:
+        """案件的課稅基礎（萬）：優先用 payload 存的值，舊案件沒存時由稅額（元）反推"""
+        payload = case.get("payload") if isinstance(case.get("payload"), dict) else {}
+        base = payload.get("taxable_base_wan")
+        if base is not None:
+            try:
+                return float(base)
+            except (TypeError, ValueError):
+                pass
+        return self.inverse_progressive_tax_wan(self._yuan_to_wan(case.get("tax_estimate") or 0.0))
+
     def diagnose_yuan(
         self,
         net_estate_yuan: float,
@@ -0,0 +1,620 @@
+"""
+資料庫 schema 版本管理（PRAGMA user_version）：
+- 每個 migration 有編號，依序在各自的交易內套用，成功後把 user_version 設為該編號
+- 啟動時 user_version 已是最新 → 完全不跑 DDL（快速路徑）
+- 大表上的新索引 / 回填列為「延後工作」（schema_deferred）：資料量小就當場完成，
+  否則交給背景執行緒用獨立連線逐項執行，回填分批提交，部署後可立即啟動
+- 多個 process 同時啟動：BEGIN IMMEDIATE 取得寫入鎖後重新讀 user_version，已套用的就跳過
+- VACUUM 類延後工作會重寫整個檔案並擋住寫入：小資料庫在啟動時完成，大的不自動跑，
+  由管理者在離峰執行 python -m src.migrations vacuum
+
+- schema 用到的 SQL 函式（目前為 word_grams）由 register() 註冊；每條會寫入 cases 的連線都要先呼叫
+
+新增 schema 變更：在 MIGRATIONS 尾端加一筆（編號 +1），不要修改已發佈的 migration。
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, List, Optional, Union
+import argparse, re, sqlite3, threading, time
+
+DEFER_ROWS = 50_000      # 資料表超過此筆數，索引 / 回填改由背景執行
+BACKFILL_BATCH = 5_000   # 回填每批 rowid 範圍
+PAUSE = 0.05             # 背景工作每批之間讓出寫入鎖（秒）
+VACUUM_MAX_BYTES = 64 * 1024 * 1024   # 資料庫小於此大小，VACUUM 類延後工作在啟動時直接完成
+
+
+@dataclass
+class Deferred:
+    """
+    延後工作：kind="index" 為單一 CREATE INDEX；kind="backfill" 以 :lo / :hi rowid 範圍分批執行；
+    kind="vacuum" 為交易外執行的 PRAGMA / VACUUM 腳本（table 留空）
+    """
+    name: str
+    table: str
+    sql: str
+    kind: str = "index"
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Union[str, Callable[[sqlite3.Connection], None]]
+    deferred: List[Deferred] = field(default_factory=list)
+
+
+# ---- 1. 基線：所有資料表與小表索引 ----
+BASELINE_SQL = """
+CREATE TABLE IF NOT EXISTS cases (
+  id TEXT PRIMARY KEY,
+  advisor_id TEXT,
+  advisor_name TEXT,
+  client_alias TEXT,
+  assets_financial REAL,
+  assets_realestate REAL,
+  assets_business REAL,
+  liabilities REAL,
+  net_estate REAL,
+  tax_estimate REAL,
+  liquidity_needed REAL,
+  status TEXT DEFAULT 'Prospect',
+  payload_json TEXT,
+  created_at TEXT,
+  updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  case_id TEXT,
+  name TEXT,
+  phone TEXT,
+  email TEXT,
+  timeslot TEXT,
+  created_at TEXT,
+  status TEXT DEFAULT 'Pending'
+);
+
+-- 顧問可預約時段（當地時間；booked 由預約交易內條件式遞增）
+CREATE TABLE IF NOT EXISTS booking_slots (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  advisor_id TEXT NOT NULL,
+  starts_at TEXT NOT NULL,
+  ends_at TEXT,
+  capacity INTEGER NOT NULL DEFAULT 1,
+  booked INTEGER NOT NULL DEFAULT 0,
+  UNIQUE (advisor_id, starts_at),
+  CHECK (booked >= 0 AND booked <= capacity)
+);
+
+CREATE TABLE IF NOT EXISTS slot_reservations (
+  slot_id INTEGER NOT NULL,
+  booking_id INTEGER NOT NULL,
+  created_at TEXT,
+  PRIMARY KEY (slot_id, booking_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS events (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  case_id TEXT,
+  event TEXT,
+  meta TEXT,
+  created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS shares (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  token TEXT UNIQUE,
+  case_id TEXT,
+  advisor_id TEXT,
+  created_at TEXT,
+  expires_at TEXT,
+  opened_at TEXT,
+  accepted_at TEXT
+);
+
+-- 過期分享連結封存（由 share_sweeper 分批搬移）
+CREATE TABLE IF NOT EXISTS shares_archive (
+  id INTEGER PRIMARY KEY,
+  token TEXT,
+  case_id TEXT,
+  advisor_id TEXT,
+  created_at TEXT,
+  expires_at TEXT,
+  opened_at TEXT,
+  accepted_at TEXT,
+  opens INTEGER DEFAULT 0,
+  unique_visitors INTEGER DEFAULT 0,
+  accepts INTEGER DEFAULT 0,
+  archived_at TEXT
+);
+
+-- 分享連結互動計數（由記憶體累積後批次寫入）
+CREATE TABLE IF NOT EXISTS share_stats (
+  token TEXT PRIMARY KEY,
+  opens INTEGER DEFAULT 0,
+  unique_visitors INTEGER DEFAULT 0,
+  first_opened_at TEXT,
+  last_opened_at TEXT,
+  accepts INTEGER DEFAULT 0,
+  last_accepted_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS share_visitors (
+  token TEXT,
+  visitor TEXT,
+  first_seen TEXT,
+  PRIMARY KEY (token, visitor)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS wallets (
+  advisor_id TEXT PRIMARY KEY,
+  balance INTEGER DEFAULT 0,
+  updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS credit_txns (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  advisor_id TEXT,
+  change INTEGER,
+  reason TEXT,
+  meta TEXT,
+  created_at TEXT
+);
+
+-- OTP 驗證碼（跨 session / 多副本共用；只存雜湊）
+CREATE TABLE IF NOT EXISTS otp_codes (
+  email TEXT PRIMARY KEY,
+  code_hash TEXT,
+  attempts INTEGER DEFAULT 0,
+  created_at REAL,
+  expires_at REAL
+);
+
+-- 登入節流：token bucket + 鎖定（key 例如 email:xxx、ip:xxx、smtp）
+CREATE TABLE IF NOT EXISTS auth_throttle (
+  key TEXT PRIMARY KEY,
+  tokens REAL,
+  updated_at REAL,
+  locked_until REAL DEFAULT 0,
+  expires_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS schema_deferred (
+  name TEXT PRIMARY KEY,
+  tbl TEXT,
+  kind TEXT,
+  sql TEXT,
+  progress INTEGER DEFAULT 0,
+  created_at TEXT,
+  done_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_otp_expiry ON otp_codes(expires_at);
+CREATE INDEX IF NOT EXISTS idx_throttle_expiry ON auth_throttle(expires_at);
+CREATE INDEX IF NOT EXISTS idx_slots_open ON booking_slots(starts_at) WHERE booked < capacity;
+CREATE INDEX IF NOT EXISTS idx_slots_open_adv ON booking_slots(advisor_id, starts_at) WHERE booked < capacity;
+CREATE INDEX IF NOT EXISTS idx_slot_res_booking ON slot_reservations(booking_id);
+CREATE INDEX IF NOT EXISTS idx_events_case ON events(case_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_shares_token ON shares(token);
+CREATE INDEX IF NOT EXISTS idx_shares_adv ON shares(advisor_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_shares_archive_adv ON shares_archive(advisor_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_txns_adv ON credit_txns(advisor_id, created_at);
+"""
+
+# ---- 2. 列表 / 分頁用索引（cases、bookings、shares 可能很大：延後建立）----
+LISTING_INDEXES = [
+    Deferred("idx_cases_upd", "cases", "CREATE INDEX IF NOT EXISTS idx_cases_upd ON cases(updated_at, id)"),
+    Deferred("idx_cases_adv_upd", "cases",
+             "CREATE INDEX IF NOT EXISTS idx_cases_adv_upd ON cases(advisor_id, updated_at, id)"),
+    Deferred("idx_cases_adv_status_upd", "cases",
+             "CREATE INDEX IF NOT EXISTS idx_cases_adv_status_upd ON cases(advisor_id, status, updated_at, id)"),
+    Deferred("idx_cases_status_upd", "cases",
+             "CREATE INDEX IF NOT EXISTS idx_cases_status_upd ON cases(status, updated_at, id)"),
+    Deferred("idx_bookings_created", "bookings",
+             "CREATE INDEX IF NOT EXISTS idx_bookings_created ON bookings(created_at)"),
+    Deferred("idx_bookings_status", "bookings",
+             "CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status, created_at)"),
+    Deferred("idx_bookings_case", "bookings",
+             "CREATE INDEX IF NOT EXISTS idx_bookings_case ON bookings(case_id, created_at)"),
+    Deferred("idx_shares_expiry", "shares", "CREATE INDEX IF NOT EXISTS idx_shares_expiry ON shares(expires_at)"),
+]
+
+# ---- 3. 案件全文檢索 ----
+CASE_FTS_SQL = """
+-- 案件全文檢索（FTS5）：案件碼、客戶代稱、顧問姓名、payload_json 內所有文字值
+-- 由下方 trigger 與 cases 同步（CaseRepo.upsert 的 ON CONFLICT DO UPDATE 也會觸發）
+CREATE VIRTUAL TABLE IF NOT EXISTS case_fts USING fts5(
+  case_id, client_alias, advisor_name, payload_text, advisor_id UNINDEXED,
+  tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_cases_fts_ins AFTER INSERT ON cases BEGIN
+  INSERT INTO case_fts(rowid, case_id, client_alias, advisor_name, payload_text, advisor_id)
+  VALUES (new.rowid, new.id, new.client_alias, new.advisor_name,
+          CASE WHEN json_valid(new.payload_json) THEN
+            (SELECT group_concat(value, ' ') FROM json_tree(new.payload_json) WHERE type = 'text') END,
+          new.advisor_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cases_fts_upd
+AFTER UPDATE OF id, client_alias, advisor_name, payload_json, advisor_id ON cases BEGIN
+  DELETE FROM case_fts WHERE rowid = old.rowid;
+  INSERT INTO case_fts(rowid, case_id, client_alias, advisor_name, payload_text, advisor_id)
+  VALUES (new.rowid, new.id, new.client_alias, new.advisor_name,
+          CASE WHEN json_valid(new.payload_json) THEN
+            (SELECT group_concat(value, ' ') FROM json_tree(new.payload_json) WHERE type = 'text') END,
+          new.advisor_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cases_fts_del AFTER DELETE ON cases BEGIN
+  DELETE FROM case_fts WHERE rowid = old.rowid;
+END;
+"""
+
+CASE_FTS_BACKFILL = Deferred(
+    "backfill_case_fts", "cases",
+    """
+    INSERT INTO case_fts(rowid, case_id, client_alias, advisor_name, payload_text, advisor_id)
+    SELECT c.rowid, c.id, c.client_alias, c.advisor_name,
+           CASE WHEN json_valid(c.payload_json) THEN
+             (SELECT group_concat(value, ' ') FROM json_tree(c.payload_json) WHERE type = 'text') END,
+           c.advisor_id
+    FROM cases c
+    WHERE c.rowid > :lo AND c.rowid <= :hi
+      AND c.rowid NOT IN (SELECT rowid FROM case_fts WHERE rowid > :lo AND rowid <= :hi)
+    """,
+    kind="backfill",
+)
+
+# ---- 4. payload_json 產生欄位 ----
+# cases.payload_json 常用欄位：以 JSON1 產生欄位（VIRTUAL，不佔空間）攤平後建索引，
+# 讓「某規則版本且有配偶的案件」這類查詢直接在 SQL 完成。payload 不是合法 JSON 時為 NULL。
+CASE_JSON_COLUMNS = {
+    "rules_version": ("TEXT", "$.rules_version"),
+    "taxable_base_wan": ("REAL", "$.taxable_base_wan"),
+    "has_spouse": ("INTEGER", "$.params.has_spouse"),
+    "adult_children": ("INTEGER", "$.params.adult_children"),
+}
+
+
+def _add_case_json_columns(conn: sqlite3.Connection):
+    """ALTER TABLE 不支援 IF NOT EXISTS：比對 table_xinfo 後只補缺少的產生欄位（VIRTUAL 欄位不改寫資料）"""
+    have = {r[1] for r in conn.execute("PRAGMA table_xinfo(cases)").fetchall()}
+    for name, (typ, path) in CASE_JSON_COLUMNS.items():
+        if name not in have:
+            conn.execute(
+                f"ALTER TABLE cases ADD COLUMN {name} {typ} GENERATED ALWAYS AS "
+                f"(CASE WHEN json_valid(payload_json) THEN json_extract(payload_json, '{path}') END) VIRTUAL"
+            )
+
+
+# ---- 5. 轉換漏斗 ----
+# 每個案件各階段第一次發生的時間，由 src.services.funnel 從 events 增量更新；
+# funnel_state 記錄已處理到的 events.id
+FUNNEL_SQL = """
+CREATE TABLE IF NOT EXISTS case_funnel (
+  case_id TEXT PRIMARY KEY,
+  created_at TEXT,
+  shared_at TEXT,
+  opened_at TEXT,
+  accepted_at TEXT,
+  booked_at TEXT,
+  unlocked_at TEXT,
+  updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_funnel_created ON case_funnel(created_at);
+
+CREATE TABLE IF NOT EXISTS funnel_state (
+  name TEXT PRIMARY KEY,
+  last_event_id INTEGER NOT NULL DEFAULT 0,
+  updated_at TEXT
+);
+"""
+
+
+# ---- 6–7. 分享連結 / 預約 keyset 索引 ----
+# 索引帶上 id，(created_at, id) 的 row value 游標才能直接定位。沿用原名重建：
+# 先拿掉舊索引與它在 schema_deferred 的紀錄（避免舊的延後工作以 IF NOT EXISTS 建回舊定義）
+def _replace_index(name: str) -> str:
+    return f"DROP INDEX IF EXISTS {name};\nDELETE FROM schema_deferred WHERE name = '{name}';"
+
+
+# ---- 8. 取消預約時保留佔位列（released_at），重新開啟才能搶回原時段 ----
+SLOT_RELEASE_SQL = "ALTER TABLE slot_reservations ADD COLUMN released_at TEXT;"
+
+# ---- 9. 全文檢索改用 trigram 斷詞 ----
+# unicode61 把一串中文當成一個詞，「小明」查不到「王小明」；trigram 以每 3 個字元為索引單位，
+# 可做任意子字串比對（SQLite 3.34+）。重建 case_fts 與 trigger，再以延後工作回填。
+CASE_FTS_TRIGRAM_SQL = """
+DROP TRIGGER IF EXISTS trg_cases_fts_ins;
+DROP TRIGGER IF EXISTS trg_cases_fts_upd;
+DROP TRIGGER IF EXISTS trg_cases_fts_del;
+DROP TABLE IF EXISTS case_fts;
+DELETE FROM schema_deferred WHERE name = 'backfill_case_fts' AND done_at IS NULL;
+""" + CASE_FTS_SQL.replace("tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'", "tokenize = 'trigram'")
+
+# ---- 10. 既有資料庫切換 auto_vacuum=INCREMENTAL ----
+# connect() 設的 PRAGMA 只對新檔生效；舊檔要 VACUUM 重寫一次，之後 reclaim 才能把空頁還給檔案系統
+AUTO_VACUUM_SQL = "PRAGMA auto_vacuum = INCREMENTAL;\nVACUUM;"
+
+# ---- 11. 短詞（1–2 字元）索引 ----
+# trigram 查不到不足 3 字元的詞（兩個字的中文名最常見）。case_grams 存每個詞的相鄰兩字元與詞尾單字，
+# 以 unicode61 斷詞：兩字元的詞直接比對詞元，單字以前綴比對（"小"* 命中「小明」與詞尾的「小」）。
+# 詞元由 SQL 函式 word_grams() 產生（trigger 內不能用 CTE）。
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def word_grams(*texts) -> str:
+    """各詞的所有相鄰兩字元＋詞尾單字，以空白分隔（去重）"""
+    grams = {}
+    for text in texts:
+        if not text:
+            continue
+        for w in _WORD_RE.findall(str(text).lower()):
+            for i in range(len(w) - 1):
+                grams[w[i:i + 2]] = None
+            grams[w[-1]] = None
+    return " ".join(grams)
+
+
+def register(conn: sqlite3.Connection):
+    conn.create_function("word_grams", -1, word_grams, deterministic=True)
+
+
+_PAYLOAD_TEXT = """CASE WHEN json_valid({r}.payload_json) THEN
+            (SELECT group_concat(value, ' ') FROM json_tree({r}.payload_json) WHERE type = 'text') END"""
+
+CASE_GRAMS_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS case_grams USING fts5(grams, tokenize = 'unicode61', prefix = '1');
+
+CREATE TRIGGER IF NOT EXISTS trg_cases_grams_ins AFTER INSERT ON cases BEGIN
+  INSERT INTO case_grams(rowid, grams)
+  VALUES (new.rowid, word_grams(new.id, new.client_alias, new.advisor_name, {_PAYLOAD_TEXT.format(r="new")}));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cases_grams_upd
+AFTER UPDATE OF id, client_alias, advisor_name, payload_json ON cases BEGIN
+  DELETE FROM case_grams WHERE rowid = old.rowid;
+  INSERT INTO case_grams(rowid, grams)
+  VALUES (new.rowid, word_grams(new.id, new.client_alias, new.advisor_name, {_PAYLOAD_TEXT.format(r="new")}));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cases_grams_del AFTER DELETE ON cases BEGIN
+  DELETE FROM case_grams WHERE rowid = old.rowid;
+END;
+"""
+
+CASE_GRAMS_BACKFILL = Deferred(
+    "backfill_case_grams", "cases",
+    f"""
+    INSERT INTO case_grams(rowid, grams)
+    SELECT c.rowid, word_grams(c.id, c.client_alias, c.advisor_name, {_PAYLOAD_TEXT.format(r="c")})
+    FROM cases c
+    WHERE c.rowid > :lo AND c.rowid <= :hi
+      AND c.rowid NOT IN (SELECT rowid FROM case_grams WHERE rowid > :lo AND rowid <= :hi)
+    """,
+    kind="backfill",
+)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", BASELINE_SQL),
+    Migration(2, "listing_indexes", "", LISTING_INDEXES),
+    Migration(3, "case_fts", CASE_FTS_SQL, [CASE_FTS_BACKFILL]),
+    Migration(4, "case_json_columns", _add_case_json_columns, [
+        Deferred("idx_cases_rules", "cases",
+                 "CREATE INDEX IF NOT EXISTS idx_cases_rules ON cases(rules_version, has_spouse)"),
+        Deferred("idx_cases_taxbase", "cases",
+                 "CREATE INDEX IF NOT EXISTS idx_cases_taxbase ON cases(taxable_base_wan)"),
+    ]),
+    Migration(5, "case_funnel", FUNNEL_SQL),
+    Migration(6, "shares_keyset_index", _replace_index("idx_shares_adv"), [
+        Deferred("idx_shares_adv", "shares",
+                 "CREATE INDEX IF NOT EXISTS idx_shares_adv ON shares(advisor_id, created_at, id)"),
+    ]),
+    Migration(7, "bookings_keyset_indexes",
+              "\n".join(_replace_index(n) for n in ("idx_bookings_created", "idx_bookings_status", "idx_bookings_case")), [
+        Deferred("idx_bookings_created", "bookings",
+                 "CREATE INDEX IF NOT EXISTS idx_bookings_created ON bookings(created_at, id)"),
+        Deferred("idx_bookings_status", "bookings",
+                 "CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status, created_at, id)"),
+        Deferred("idx_bookings_case", "bookings",
+                 "CREATE INDEX IF NOT EXISTS idx_bookings_case ON bookings(case_id, created_at, id)"),
+    ]),
+    Migration(8, "slot_reservation_release", SLOT_RELEASE_SQL),
+    Migration(9, "case_fts_trigram", CASE_FTS_TRIGRAM_SQL, [
+        Deferred("backfill_case_fts_trigram", "cases", CASE_FTS_BACKFILL.sql, kind="backfill"),
+    ]),
+    Migration(10, "auto_vacuum_incremental", "", [
+        Deferred("vacuum_auto_vacuum", "", AUTO_VACUUM_SQL, kind="vacuum"),
+    ]),
+    Migration(11, "case_short_term_grams", CASE_GRAMS_SQL, [CASE_GRAMS_BACKFILL]),
+]
+
+LATEST = MIGRATIONS[-1].version
+
+
+def _statements(script: str):
+    """把 SQL 腳本拆成單句（trigger 內的分號不會被切開）"""
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            stmt = buf.strip()
+            buf = ""
+            if stmt and stmt != ";":
+                yield stmt
+    if buf.strip():
+        yield buf.strip()
+
+
+def _user_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _small(conn: sqlite3.Connection, table: str) -> bool:
+    n = conn.execute(f"SELECT count(*) FROM (SELECT 1 FROM {table} LIMIT ?)", (DEFER_ROWS,)).fetchone()[0]
+    return n < DEFER_ROWS
+
+
+def _small_db(conn: sqlite3.Connection) -> bool:
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    return pages * conn.execute("PRAGMA page_size").fetchone()[0] < VACUUM_MAX_BYTES
+
+
+def _needed(conn: sqlite3.Connection, job: Deferred) -> bool:
+    """VACUUM 類工作只在資料庫還不是 INCREMENTAL 時需要（新檔建立時就已是）"""
+    return job.kind != "vacuum" or conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+
+
+def _run_backfill(conn: sqlite3.Connection, job: Deferred, start: int = 0, *, pause: float = 0.0):
+    """以 rowid 範圍分批執行回填，每批一個交易並記錄進度（中斷後從進度續跑）"""
+    top = conn.execute(f"SELECT coalesce(max(rowid), 0) FROM {job.table}").fetchone()[0]
+    lo = start
+    while lo < top:
+        hi = lo + BACKFILL_BATCH
+        with conn:
+            conn.execute(job.sql, {"lo": lo, "hi": hi})
+            conn.execute("UPDATE schema_deferred SET progress=? WHERE name=?", (hi, job.name))
+        lo = hi
+        if pause:
+            time.sleep(pause)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """套用尚未執行的 migration，回傳套用的數量；schema 已是最新時不執行任何 DDL"""
+    if _user_version(conn) >= LATEST:
+        return 0
+    if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+        conn.execute("PRAGMA journal_mode=WAL")
+    applied = 0
+    for m in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if _user_version(conn) >= m.version:   # 其他 process 已套用
+                conn.rollback()
+                continue
+            if callable(m.apply):
+                m.apply(conn)
+            else:
+                for stmt in _statements(m.apply):
+                    conn.execute(stmt)
+            now = datetime.utcnow().isoformat()
+            for job in m.deferred:
+                done = not _needed(conn, job)
+                if job.kind == "index" and _small(conn, job.table):
+                    conn.execute(job.sql)
+                    done = True
+                conn.execute(
+                    "INSERT OR IGNORE INTO schema_deferred (name, tbl, kind, sql, created_at, done_at) "
+                    "VALUES (?,?,?,?,?,?)",
+                    (job.name, job.table, job.kind, job.sql, now, now if done else None),
+                )
+            conn.execute(f"PRAGMA user_version = {int(m.version)}")
+            conn.commit()
+            applied += 1
+        except Exception:
+            conn.rollback()
+            raise
+    # 小表的回填、小資料庫的 VACUUM 直接完成（交易外執行，不放進 migration 交易）
+    for job in pending(conn):
+        if (job.kind == "backfill" and _small(conn, job.table)) or (job.kind == "vacuum" and _small_db(conn)):
+            _finish(conn, job)
+    return applied
+
+
+def pending(conn: sqlite3.Connection) -> List[Deferred]:
+    rows = conn.execute(
+        "SELECT name, tbl, kind, sql FROM schema_deferred WHERE done_at IS NULL ORDER BY created_at, name"
+    ).fetchall()
+    return [Deferred(r[0], r[1], r[3], r[2]) for r in rows]
+
+
+def _finish(conn: sqlite3.Connection, job: Deferred, *, pause: float = 0.0):
+    if job.kind == "backfill":
+        start = conn.execute("SELECT progress FROM schema_deferred WHERE name=?", (job.name,)).fetchone()[0]
+        _run_backfill(conn, job, int(start or 0), pause=pause)
+    elif job.kind == "vacuum":
+        if _needed(conn, job):
+            for stmt in _statements(job.sql):
+                conn.execute(stmt)
+    else:
+        with conn:
+            conn.execute(job.sql)
+    with conn:
+        conn.execute("UPDATE schema_deferred SET done_at=? WHERE name=?", (datetime.utcnow().isoformat(), job.name))
+
+
+def _background(conn: sqlite3.Connection) -> List[Deferred]:
+    """交給背景執行緒的工作；VACUUM 會長時間擋住寫入，留給管理者（main 的 vacuum 指令）"""
+    return [j for j in pending(conn) if j.kind != "vacuum"]
+
+
+_builder: Optional[threading.Thread] = None
+_builder_lock = threading.Lock()
+
+
+def _build_pending(db_path: str):
+    conn = sqlite3.connect(db_path, timeout=60)
+    register(conn)
+    try:
+        for job in _background(conn):
+            try:
+                _finish(conn, job, pause=PAUSE)
+            except sqlite3.OperationalError:
+                # 被鎖住或其他 process 正在建：下次啟動再試
+                continue
+            time.sleep(PAUSE)
+    finally:
+        conn.close()
+
+
+def start_deferred(conn: sqlite3.Connection, db_path: str) -> bool:
+    """有未完成的延後工作時，啟動背景執行緒處理（每個 process 一次）；回傳是否啟動"""
+    global _builder
+    try:
+        if not _background(conn):
+            return False
+    except sqlite3.OperationalError:
+        return False
+    with _builder_lock:
+        if _builder is None or not _builder.is_alive():
+            _builder = threading.Thread(target=_build_pending, args=(db_path,), name="schema-deferred", daemon=True)
+            _builder.start()
+    return True
+
+
+def vacuum(conn: sqlite3.Connection) -> int:
+    """執行尚未完成的 VACUUM 類延後工作，回傳執行的數量；期間擋住所有寫入，請在離峰執行"""
+    jobs = [j for j in pending(conn) if j.kind == "vacuum"]
+    for job in jobs:
+        _finish(conn, job)
+    return len(jobs)
+
+
+def main(argv: List[str] | None = None) -> int:
+    from src.db import DB_PATH
+    ap = argparse.ArgumentParser(description="SQLite schema 維護")
+    ap.add_argument("command", choices=["migrate", "vacuum"],
+                    help="migrate：套用 migration；vacuum：另外執行大資料庫未自動跑的 VACUUM")
+    ap.add_argument("--db", default=DB_PATH.as_posix(), help="資料庫路徑（預設 data/app.db）")
+    args = ap.parse_args(argv)
+
+    conn = sqlite3.connect(args.db, timeout=60)
+    register(conn)
+    try:
+        print(f"套用 migration：{migrate(conn)} 個")
+        if args.command == "vacuum":
+            print(f"完成 VACUUM：{vacuum(conn)} 項")
+        left = pending(conn)
+        if left:
+            print("尚未完成的延後工作：" + ", ".join(j.name for j in left))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,23 +1,134 @@
 from datetime import datetime
-from src.db import get_conn
+from typing import Dict, List, Optional, Iterable
+from src.db import get_conn, transaction
+from src.repos.slot_repo import SlotRepo
 
 class BookingRepo:
     TBL = "bookings"
 
+    STATUSES = ("Pending", "Confirmed", "Completed", "Cancelled", "NoShow")
+    # 允許的狀態轉換：目標狀態 -> 可從哪些狀態轉入
+    TRANSITIONS = {
+        "Confirmed": ("Pending",),
+        "Completed": ("Confirmed",),
+        "Cancelled": ("Pending", "Confirmed"),
+        "NoShow": ("Confirmed",),
+        "Pending": ("Cancelled",),   # 取消後重新開啟
+    }
+    _CHUNK = 500  # IN (...) 每批的 id 數，避免超過 SQLite 參數上限
+
     @staticmethod
     def create(payload: dict):
-        conn = get_conn()
-        now = datetime.utcnow().isoformat()
-        cur = conn.execute(
-            f"""
-            INSERT INTO {BookingRepo.TBL}
-            (case_id, name, phone, email, timeslot, created_at, status)
-            VALUES (?,?,?,?,?,?,?)
-            """,
-            (
-                payload.get("case_id"), payload.get("name"), payload.get("phone"), payload.get("email"),
-                payload.get("timeslot"), now, payload.get("status","Pending"),
-            ),
+        with transaction() as conn:
+            now = datetime.utcnow().isoformat()
+            cur = conn.execute(
+                f"""
+                INSERT INTO {BookingRepo.TBL}
+                (case_id, name, phone, email, timeslot, created_at, status)
+                VALUES (?,?,?,?,?,?,?)
+                RETURNING id
+                """,
+                (
+                    payload.get("case_id"), payload.get("name"), payload.get("phone"), payload.get("email"),
+                    payload.get("timeslot"), now, payload.get("status","Pending"),
+                ),
+            )
+            booking_id = cur.fetchone()[0]
+        return booking_id
+
+    @staticmethod
+    def get(booking_id: int) -> Optional[Dict]:
+        row = get_conn().execute(f"SELECT * FROM {BookingRepo.TBL} WHERE id=?", (int(booking_id),)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def page(
+        *,
+        status: str | None = None,
+        case_id: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        after: tuple | None = None,
+        limit: int = 50,
+    ) -> tuple:
+        """
+        預約分頁查詢（由新到舊）：
+        - 篩選：status 走 idx_bookings_status、case_id 走 idx_bookings_case，其餘走 idx_bookings_created
+        - since / until：created_at 區間（ISO 字串，含 since、不含 until）
+        - keyset 分頁：after 為上一頁回傳的 (created_at, id) 游標
+        回傳 (rows, next_cursor)；沒有下一頁時 next_cursor 為 None。
+        """
+        sql = f"SELECT * FROM {BookingRepo.TBL} WHERE 1=1"
+        args: list = []
+        if status:
+            sql += " AND status=?"; args.append(status)
+        if case_id:
+            sql += " AND case_id=?"; args.append(case_id)
+        if since:
+            sql += " AND created_at >= ?"; args.append(since)
+        if until:
+            sql += " AND created_at < ?"; args.append(until)
+        if after:
+            sql += " AND (created_at, id) < (?, ?)"   # row value：直接從游標位置往下掃索引
+            args.extend([after[0], after[1]])
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        args.append(int(limit) + 1)
+        rows = [dict(r) for r in get_conn().execute(sql, args).fetchall()]
+        nxt = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            nxt = (rows[-1]["created_at"], rows[-1]["id"])
+        return rows, nxt
+
+    @staticmethod
+    def count_by_status() -> Dict[str, int]:
+        """各狀態筆數（只掃 idx_bookings_status，不讀資料列）"""
+        cur = get_conn().execute(
+            f"SELECT coalesce(status, 'Pending') AS status, count(*) AS n FROM {BookingRepo.TBL} GROUP BY status"
         )
-        conn.commit()
-        return cur.lastrowid
+        out: Dict[str, int] = {}
+        for r in cur.fetchall():
+            out[r["status"]] = out.get(r["status"], 0) + r["n"]
+        return out
+
+    @staticmethod
+    def bulk_set_status(ids: Iterable[int], to_status: str) -> List[Dict]:
+        """
+        批次轉換狀態（單一交易）：只有目前狀態允許轉入 to_status 的預約會被更新。
+        改為 Cancelled 時同一交易內釋放其佔用的時段名額；重新開啟（→ Pending）時先搶回原時段名額，
+        原時段已額滿的預約維持 Cancelled。
+        回傳實際更新的 [{id, case_id, from_status}]，供呼叫端記錄事件。
+        """
+        if to_status not in BookingRepo.TRANSITIONS:
+            raise ValueError(f"不支援的狀態：{to_status}")
+        allowed = BookingRepo.TRANSITIONS[to_status]
+        ids = sorted({int(i) for i in ids})
+        if not ids:
+            return []
+        changed: List[Dict] = []
+        st_marks = ",".join("?" * len(allowed))
+        with transaction() as conn:
+            for i in range(0, len(ids), BookingRepo._CHUNK):
+                chunk = ids[i:i + BookingRepo._CHUNK]
+                id_marks = ",".join("?" * len(chunk))
+                where = f"id IN ({id_marks}) AND coalesce(status, 'Pending') IN ({st_marks})"
+                rows = conn.execute(
+                    f"SELECT id, case_id, coalesce(status, 'Pending') AS status FROM {BookingRepo.TBL} WHERE {where}",
+                    (*chunk, *allowed),
+                ).fetchall()
+                if to_status == "Pending":
+                    full = set(SlotRepo.reclaim_bookings(conn, [r["id"] for r in rows]))
+                    rows = [r for r in rows if r["id"] not in full]
+                    chunk = [r["id"] for r in rows]
+                    id_marks = ",".join("?" * len(chunk))
+                    where = f"id IN ({id_marks}) AND coalesce(status, 'Pending') IN ({st_marks})"
+                if not rows:
+                    continue
+                conn.execute(
+                    f"UPDATE {BookingRepo.TBL} SET status=? WHERE {where}",
+                    (to_status, *chunk, *allowed),
+                )
+                if to_status == "Cancelled":
+                    SlotRepo.release_bookings(conn, [r["id"] for r in rows])
+                changed.extend({"id": r["id"], "case_id": r["case_id"], "from_status": r["status"]} for r in rows)
+        return changed
@@ -1,59 +1,264 @@
-import json
+import json, re
 from datetime import datetime
-from src.db import get_conn
+from src.db import DIALECT, get_conn, stream, transaction
+
+_TERM_RE = re.compile(r"[\w\-@.]+", re.UNICODE)
+_WORD_RE = re.compile(r"[^\W_]+")   # 與 migrations.word_grams 的切詞一致
+_SUMMARY_COLS = ("id", "client_alias", "advisor_id", "advisor_name", "status",
+                 "net_estate", "tax_estimate", "updated_at")
+
+def _row(r) -> dict:
+    """資料列 → dict，並附上解析好的 payload（只在讀出時解析一次）"""
+    d = dict(r)
+    try:
+        d["payload"] = json.loads(d.get("payload_json") or "{}")
+    except (TypeError, ValueError):
+        d["payload"] = {}
+    return d
 
 class CaseRepo:
     TBL = "cases"
+    FTS_TBL = "case_fts"
+    GRAMS_TBL = "case_grams"   # 1–2 字元短詞索引（見 migrations 第 11 版）
+    # bm25 欄位權重：case_id, client_alias, advisor_name, payload_text, advisor_id(不索引)
+    FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0, 0.0)
 
     @staticmethod
     def upsert(case: dict):
-        conn = get_conn()
-        now = datetime.utcnow().isoformat()
-        case = {**case}
-        case.setdefault("created_at", now)
-        case["updated_at"] = now
-        payload_json = json.dumps(case.get("payload", {}), ensure_ascii=False)
-        conn.execute(
-            f"""
-            INSERT INTO {CaseRepo.TBL} (
-              id, advisor_id, advisor_name, client_alias,
-              assets_financial, assets_realestate, assets_business,
-              liabilities, net_estate, tax_estimate, liquidity_needed,
-              status, payload_json, created_at, updated_at
-            ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            ON CONFLICT(id) DO UPDATE SET
-              advisor_id=excluded.advisor_id,
-              advisor_name=excluded.advisor_name,
-              client_alias=excluded.client_alias,
-              assets_financial=excluded.assets_financial,
-              assets_realestate=excluded.assets_realestate,
-              assets_business=excluded.assets_business,
-              liabilities=excluded.liabilities,
-              net_estate=excluded.net_estate,
-              tax_estimate=excluded.tax_estimate,
-              liquidity_needed=excluded.liquidity_needed,
-              status=excluded.status,
-              payload_json=excluded.payload_json,
-              updated_at=excluded.updated_at
-            """,
-            (
-                case["id"], case.get("advisor_id"), case.get("advisor_name"), case.get("client_alias"),
-                case.get("assets_financial",0), case.get("assets_realestate",0), case.get("assets_business",0),
-                case.get("liabilities",0), case.get("net_estate",0), case.get("tax_estimate",0), case.get("liquidity_needed",0),
-                case.get("status","Prospect"), payload_json, case.get("created_at"), case.get("updated_at"),
-            ),
-        )
-        conn.commit()
+        with transaction() as conn:
+            now = datetime.utcnow().isoformat()
+            case = {**case}
+            case.setdefault("created_at", now)
+            case["updated_at"] = now
+            payload_json = json.dumps(case.get("payload", {}), ensure_ascii=False)
+            conn.execute(
+                f"""
+                INSERT INTO {CaseRepo.TBL} (
+                  id, advisor_id, advisor_name, client_alias,
+                  assets_financial, assets_realestate, assets_business,
+                  liabilities, net_estate, tax_estimate, liquidity_needed,
+                  status, payload_json, created_at, updated_at
+                ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                ON CONFLICT(id) DO UPDATE SET
+                  advisor_id=excluded.advisor_id,
+                  advisor_name=excluded.advisor_name,
+                  client_alias=excluded.client_alias,
+                  assets_financial=excluded.assets_financial,
+                  assets_realestate=excluded.assets_realestate,
+                  assets_business=excluded.assets_business,
+                  liabilities=excluded.liabilities,
+                  net_estate=excluded.net_estate,
+                  tax_estimate=excluded.tax_estimate,
+                  liquidity_needed=excluded.liquidity_needed,
+                  status=excluded.status,
+                  payload_json=excluded.payload_json,
+                  updated_at=excluded.updated_at
+                """,
+                (
+                    case["id"], case.get("advisor_id"), case.get("advisor_name"), case.get("client_alias"),
+                    case.get("assets_financial",0), case.get("assets_realestate",0), case.get("assets_business",0),
+                    case.get("liabilities",0), case.get("net_estate",0), case.get("tax_estimate",0), case.get("liquidity_needed",0),
+                    case.get("status","Prospect"), payload_json, case.get("created_at"), case.get("updated_at"),
+                ),
+            )
 
     @staticmethod
     def get(case_id: str):
         cur = get_conn().execute(f"SELECT * FROM {CaseRepo.TBL} WHERE id=?", (case_id,))
         row = cur.fetchone()
-        return dict(row) if row else None
+        return _row(row) if row else None
 
     @staticmethod
     def update_status(case_id: str, status: str):
-        get_conn().execute(
-            f"UPDATE {CaseRepo.TBL} SET status=?, updated_at=? WHERE id=?",
-            (status, datetime.utcnow().isoformat(), case_id),
-        ).connection.commit()
+        with transaction() as conn:
+            conn.execute(
+                f"UPDATE {CaseRepo.TBL} SET status=?, updated_at=? WHERE id=?",
+                (status, datetime.utcnow().isoformat(), case_id),
+            )
+
+    # ---- 列表（keyset 分頁：after 傳上一頁最後一筆的 CaseRepo.cursor(row)）----
+    # 由新到舊的列表依 (updated_at, id) 排序，分別走 idx_cases_upd / idx_cases_adv_upd /
+    # idx_cases_adv_status_upd / idx_cases_status_upd；只讀 LIMIT 筆，與案件總數無關。
+
+    @staticmethod
+    def cursor(row: dict) -> tuple:
+        return (row.get("updated_at") or "", row["id"])
+
+    @staticmethod
+    def _list(where: list[str], args: list, *, after: tuple | None, limit: int, desc: bool = True) -> list[dict]:
+        where = list(where)
+        args = list(args)
+        if after:
+            op = "<" if desc else ">"
+            where.append(f"(updated_at, id) {op} (?, ?)")   # row value：直接從游標位置掃索引
+            args.extend([after[0], after[1]])
+        sql = f"SELECT * FROM {CaseRepo.TBL}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        order = "DESC" if desc else "ASC"
+        sql += f" ORDER BY updated_at {order}, id {order} LIMIT ?"
+        args.append(int(limit))
+        return [_row(r) for r in get_conn().execute(sql, args).fetchall()]
+
+    @staticmethod
+    def list_latest(limit: int = 20, *, after: tuple | None = None) -> list[dict]:
+        """最近更新的案件（全部顧問）"""
+        return CaseRepo._list(["updated_at IS NOT NULL"], [], after=after, limit=limit)
+
+    @staticmethod
+    def list_by_advisor(advisor_id: str, *, status: str | None = None,
+                        limit: int = 20, after: tuple | None = None) -> list[dict]:
+        """某位顧問最近更新的案件；可再依狀態篩選"""
+        where, args = ["advisor_id = ?"], [advisor_id]
+        if status:
+            where.append("status = ?"); args.append(status)
+        return CaseRepo._list(where, args, after=after, limit=limit)
+
+    @staticmethod
+    def list_by_status(status: str, *, limit: int = 20, after: tuple | None = None) -> list[dict]:
+        """某狀態最近更新的案件（全部顧問）"""
+        return CaseRepo._list(["status = ?"], [status], after=after, limit=limit)
+
+    @staticmethod
+    def list_updated_since(since: str, *, limit: int = 500, after: tuple | None = None) -> list[dict]:
+        """since 之後有更新的案件，由舊到新（供增量同步 / 匯出逐批讀取）"""
+        return CaseRepo._list(["updated_at >= ?"], [since], after=after, limit=limit, desc=False)
+
+    # ---- payload 欄位查詢（走 migrations.CASE_JSON_COLUMNS 的產生欄位與索引）----
+
+    @staticmethod
+    def find_by_params(*, rules_version: str | None = None, has_spouse: bool | None = None,
+                       min_taxable_base_wan: float | None = None, max_taxable_base_wan: float | None = None,
+                       limit: int = 100) -> list[dict]:
+        """依規則版本 / 是否有配偶 / 課稅基礎區間找案件（idx_cases_rules、idx_cases_taxbase）"""
+        where, args = [], []
+        if rules_version is not None:
+            where.append("rules_version = ?"); args.append(rules_version)
+        if has_spouse is not None:
+            where.append("has_spouse = ?"); args.append(1 if has_spouse else 0)
+        if min_taxable_base_wan is not None:
+            where.append("taxable_base_wan >= ?"); args.append(float(min_taxable_base_wan))
+        if max_taxable_base_wan is not None:
+            where.append("taxable_base_wan < ?"); args.append(float(max_taxable_base_wan))
+        sql = f"SELECT * FROM {CaseRepo.TBL}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " LIMIT ?"
+        args.append(int(limit))
+        return [_row(r) for r in get_conn().execute(sql, args).fetchall()]
+
+    @staticmethod
+    def stats_by_rules() -> list[dict]:
+        """各規則版本 × 是否有配偶的案件數與平均課稅基礎（只掃索引與產生欄位）"""
+        cur = get_conn().execute(
+            f"""
+            SELECT rules_version, has_spouse, count(*) AS cases,
+                   avg(taxable_base_wan) AS avg_taxable_base_wan
+            FROM {CaseRepo.TBL}
+            WHERE rules_version IS NOT NULL
+            GROUP BY rules_version, has_spouse
+            ORDER BY rules_version, has_spouse
+            """
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+    @staticmethod
+    def iter_cases(*, advisor_id: str | None = None, status: str | None = None,
+                   case_ids: list[str] | None = None, batch: int = 200):
+        """依條件逐批讀出案件（db.stream，不一次載入全部）"""
+        where, args = [], []
+        if advisor_id:
+            where.append("advisor_id=?"); args.append(advisor_id)
+        if status:
+            where.append("status=?"); args.append(status)
+        if case_ids:
+            where.append(f"id IN ({','.join('?' * len(case_ids))})"); args.extend(case_ids)
+        sql = f"SELECT * FROM {CaseRepo.TBL}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY updated_at DESC"
+        for r in stream(sql, args, batch=batch):
+            yield _row(r)
+
+    @staticmethod
+    def _fts_query(q: str) -> tuple[str, str]:
+        """
+        使用者輸入 → (case_fts MATCH 字串, case_grams MATCH 字串)，各詞之間為 AND：
+        3 個字元以上的詞在 trigram 索引做子字串比對；不足 3 字元的詞（如兩個字的中文名）查 case_grams，
+        兩字元比對詞元、單字以前綴比對
+        """
+        terms = _TERM_RE.findall(q or "")
+        match = " AND ".join('"' + t.replace('"', '""') + '"' for t in terms if len(t) >= 3)
+        short = dict.fromkeys(w for t in terms if len(t) < 3 for w in _WORD_RE.findall(t.lower()))
+        grams = " AND ".join(f'"{w}"' if len(w) == 2 else f'"{w}"*' for w in short)
+        return match, grams
+
+    @staticmethod
+    def _tsquery(q: str) -> str:
+        """使用者輸入 → PostgreSQL tsquery 前綴查詢（'詞':* 以 & 串接），只用於排序"""
+        terms = _TERM_RE.findall(q or "")
+        return " & ".join("'" + t.replace("'", "''") + "':*" for t in terms)
+
+    @staticmethod
+    def _like_patterns(q: str) -> list[str]:
+        """使用者輸入 → 每個詞一個 ILIKE 子字串樣式（% _ \\ 已跳脫）"""
+        return ["%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                for t in _TERM_RE.findall(q or "")]
+
+    @staticmethod
+    def search(q: str, *, advisor_id: str | None = None, limit: int = 20) -> list[dict]:
+        """
+        全文檢索案件（子字串比對，依 bm25 排序、同分依更新時間；只有短詞時依更新時間）；
+        advisor_id 有值時只找該顧問的案件。回傳案件摘要（不含 payload_json）。
+        """
+        if DIALECT == "postgres":
+            return CaseRepo._search_pg(q, advisor_id=advisor_id, limit=limit)
+        match, grams = CaseRepo._fts_query(q)
+        if not match and not grams:
+            return []
+        # CROSS JOIN 固定由全文索引先找出命中的列（否則有 advisor_id 時規劃器會逐筆掃該顧問的案件）
+        where, args = [], []
+        if match:
+            weights = ", ".join(str(w) for w in CaseRepo.FTS_WEIGHTS)
+            src = f"{CaseRepo.FTS_TBL} CROSS JOIN {CaseRepo.TBL} c ON c.rowid = {CaseRepo.FTS_TBL}.rowid"
+            where.append(f"{CaseRepo.FTS_TBL} MATCH ?"); args.append(match)
+            if grams:
+                where.append(f"c.rowid IN (SELECT rowid FROM {CaseRepo.GRAMS_TBL} WHERE {CaseRepo.GRAMS_TBL} MATCH ?)")
+                args.append(grams)
+            order = f"bm25({CaseRepo.FTS_TBL}, {weights}), c.updated_at DESC"
+        else:
+            src = f"{CaseRepo.GRAMS_TBL} CROSS JOIN {CaseRepo.TBL} c ON c.rowid = {CaseRepo.GRAMS_TBL}.rowid"
+            where.append(f"{CaseRepo.GRAMS_TBL} MATCH ?"); args.append(grams)
+            order = "c.updated_at DESC"
+        if advisor_id:
+            where.append("c.advisor_id = ?"); args.append(advisor_id)
+        sql = f"""
+            SELECT {", ".join("c." + col for col in _SUMMARY_COLS)}
+            FROM {src}
+            WHERE {" AND ".join(where)}
+            ORDER BY {order} LIMIT ?
+            """
+        args.append(int(limit))
+        return [dict(r) for r in get_conn().execute(sql, args).fetchall()]
+
+    @staticmethod
+    def _search_pg(q: str, *, advisor_id: str | None = None, limit: int = 20) -> list[dict]:
+        """
+        PostgreSQL：search_text 子字串比對（ILIKE，各詞 AND；有 pg_trgm 時走 GIN trigram 索引），
+        與 SQLite 相同語意；整詞（前綴）命中的 ts_rank 較高，其次依更新時間
+        """
+        patterns = CaseRepo._like_patterns(q)
+        if not patterns:
+            return []
+        where = ["search_text ILIKE ?"] * len(patterns)
+        args: list = [CaseRepo._tsquery(q), *patterns]
+        if advisor_id:
+            where.append("advisor_id = ?"); args.append(advisor_id)
+        sql = f"""
+            SELECT {", ".join(_SUMMARY_COLS)}
+            FROM {CaseRepo.TBL}, to_tsquery('simple', ?) AS query
+            WHERE {" AND ".join(where)}
+            ORDER BY ts_rank(search_tsv, query) DESC, updated_at DESC LIMIT ?
+            """
+        args.append(int(limit))
+        return [dict(r) for r in get_conn().execute(sql, args).fetchall()]
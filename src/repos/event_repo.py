@@ -1,13 +1,43 @@
 import json
 from datetime import datetime
-from src.db import get_conn
+from src.db import get_conn, transaction
 
 class EventRepo:
     TBL = "events"
 
     @staticmethod
     def log(case_id: str, event: str, meta: dict | None = None):
-        get_conn().execute(
-            f"INSERT INTO {EventRepo.TBL} (case_id, event, meta, created_at) VALUES (?,?,?,?)",
-            (case_id, event, json.dumps(meta or {}, ensure_ascii=False), datetime.utcnow().isoformat()),
-        ).connection.commit()
+        with transaction() as conn:
+            conn.execute(
+                f"INSERT INTO {EventRepo.TBL} (case_id, event, meta, created_at) VALUES (?,?,?,?)",
+                (case_id, event, json.dumps(meta or {}, ensure_ascii=False), datetime.utcnow().isoformat()),
+            )
+
+    @staticmethod
+    def log_many(rows: list[tuple[str, str, dict | None, str]]):
+        """批次寫入 [(case_id, event, meta, created_at), ...]，單一交易"""
+        if not rows:
+            return
+        with transaction() as conn:
+            conn.executemany(
+                f"INSERT INTO {EventRepo.TBL} (case_id, event, meta, created_at) VALUES (?,?,?,?)",
+                [(c, e, json.dumps(m or {}, ensure_ascii=False), ts) for c, e, m, ts in rows],
+            )
+
+    @staticmethod
+    def head(*, after_id: int = 0, limit: int = 1000) -> list[dict]:
+        """依 id 由舊到新取一批（主鍵範圍掃描，不需要 created_at 索引）"""
+        rows = get_conn().execute(
+            f"SELECT id, case_id, event, meta, created_at FROM {EventRepo.TBL} WHERE id > ? ORDER BY id LIMIT ?",
+            (int(after_id), int(limit)),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    def delete_range(first_id: int, last_id: int) -> int:
+        """刪除 id 介於 [first_id, last_id] 的事件（封存後呼叫）"""
+        with transaction() as conn:
+            cur = conn.execute(
+                f"DELETE FROM {EventRepo.TBL} WHERE id >= ? AND id <= ?", (int(first_id), int(last_id))
+            )
+        return cur.rowcount
@@ -0,0 +1,128 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from src.db import get_conn, transaction
+
+
+class FunnelRepo:
+    """案件轉換漏斗：每個案件各階段第一次發生的時間（由 events 增量彙整）"""
+    TBL = "case_funnel"
+    STATE_TBL = "funnel_state"
+    EVENTS_TBL = "events"
+    STATE_NAME = "case_funnel"
+
+    # 欄位 → 對應的事件（舊事件名稱一併對應）
+    STAGE_EVENTS: Dict[str, tuple] = {
+        "created_at": ("CASE_CREATED", "DIAG_DONE"),
+        "shared_at": ("SHARE_CREATED", "SHARED"),
+        "opened_at": ("SHARE_OPENED",),
+        "accepted_at": ("SHARE_ACCEPTED",),
+        "booked_at": ("BOOKING_CREATED",),
+        "unlocked_at": ("UNLOCKED",),
+    }
+
+    @staticmethod
+    def last_event_id() -> int:
+        row = get_conn().execute(
+            f"SELECT last_event_id FROM {FunnelRepo.STATE_TBL} WHERE name=?", (FunnelRepo.STATE_NAME,)
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def max_event_id() -> int:
+        row = get_conn().execute(f"SELECT coalesce(max(id), 0) FROM {FunnelRepo.EVENTS_TBL}").fetchone()
+        return int(row[0])
+
+    @staticmethod
+    def _apply_sql() -> str:
+        stage = "CASE event " + " ".join(
+            f"WHEN '{e}' THEN '{col}'" for col, evs in FunnelRepo.STAGE_EVENTS.items() for e in evs
+        ) + " END"
+        names = ", ".join(f"'{e}'" for evs in FunnelRepo.STAGE_EVENTS.values() for e in evs)
+        cols = list(FunnelRepo.STAGE_EVENTS)
+        firsts = ",\n                   ".join(f"max(CASE WHEN stage = '{c}' THEN created_at END)" for c in cols)
+        merge = ",\n              ".join(f"{c} = least({FunnelRepo.TBL}.{c}, excluded.{c})" for c in cols)
+        # 一次視窗函式掃描：每個 (案件, 階段) 只取最早一筆，再攤平成一列
+        return f"""
+            WITH ev AS (
+              SELECT case_id, created_at, {stage} AS stage,
+                     row_number() OVER (PARTITION BY case_id, {stage} ORDER BY created_at, id) AS rn
+              FROM {FunnelRepo.EVENTS_TBL}
+              WHERE id > :lo AND id <= :hi AND event IN ({names})
+                AND case_id IS NOT NULL AND case_id <> 'N/A' AND created_at IS NOT NULL
+            )
+            INSERT INTO {FunnelRepo.TBL} (case_id, {", ".join(cols)}, updated_at)
+            SELECT case_id,
+                   {firsts},
+                   :now
+            FROM ev WHERE rn = 1
+            GROUP BY case_id
+            ON CONFLICT(case_id) DO UPDATE SET
+              {merge},
+              updated_at = excluded.updated_at
+            """
+
+    @staticmethod
+    def apply_range(lo: int, hi: int) -> int:
+        """
+        彙整 events.id ∈ (lo, hi] 並推進處理進度（單一交易）。
+        各階段取較早的時間（least），重複套用同一範圍結果不變，多個 process 同時跑也安全。
+        """
+        now = datetime.utcnow().isoformat()
+        with transaction() as conn:
+            cur = conn.execute(FunnelRepo._apply_sql(), {"lo": int(lo), "hi": int(hi), "now": now})
+            conn.execute(
+                f"""
+                INSERT INTO {FunnelRepo.STATE_TBL} (name, last_event_id, updated_at) VALUES (?,?,?)
+                ON CONFLICT(name) DO UPDATE SET
+                  last_event_id = greatest({FunnelRepo.STATE_TBL}.last_event_id, excluded.last_event_id),
+                  updated_at = excluded.updated_at
+                """,
+                (FunnelRepo.STATE_NAME, int(hi), now),
+            )
+        return cur.rowcount
+
+    @staticmethod
+    def merge_firsts(firsts: Dict[str, Dict[str, str]]) -> int:
+        """
+        把 {case_id: {欄位: 最早時間}} 併入漏斗（各階段取較早的時間）。
+        供重播已封存、不在 events 表內的事件；不動處理進度。
+        """
+        if not firsts:
+            return 0
+        cols = list(FunnelRepo.STAGE_EVENTS)
+        merge = ", ".join(f"{c} = least({FunnelRepo.TBL}.{c}, excluded.{c})" for c in cols)
+        now = datetime.utcnow().isoformat()
+        with transaction() as conn:
+            conn.executemany(
+                f"""
+                INSERT INTO {FunnelRepo.TBL} (case_id, {", ".join(cols)}, updated_at)
+                VALUES ({", ".join("?" * (len(cols) + 2))})
+                ON CONFLICT(case_id) DO UPDATE SET {merge}, updated_at = excluded.updated_at
+                """,
+                [(case_id, *(stages.get(c) for c in cols), now) for case_id, stages in firsts.items()],
+            )
+        return len(firsts)
+
+    @staticmethod
+    def reset():
+        """清空漏斗與進度（下次 refresh 從頭重建）"""
+        with transaction() as conn:
+            conn.execute(f"DELETE FROM {FunnelRepo.TBL}")
+            conn.execute(f"DELETE FROM {FunnelRepo.STATE_TBL} WHERE name=?", (FunnelRepo.STATE_NAME,))
+
+    @staticmethod
+    def cohort(since: str, until: str, *, advisor_id: Optional[str] = None) -> List[Dict]:
+        """建立時間（created_at，UTC ISO）落在 [since, until) 的案件與其顧問（走 idx_funnel_created）"""
+        sql = f"""
+            SELECT f.case_id, c.advisor_id, c.advisor_name,
+                   {", ".join(f"f.{col}" for col in FunnelRepo.STAGE_EVENTS)}
+            FROM {FunnelRepo.TBL} f LEFT JOIN cases c ON c.id = f.case_id
+            WHERE f.created_at >= ? AND f.created_at < ?
+            """
+        args: list = [since, until]
+        if advisor_id:
+            sql += " AND c.advisor_id = ?"
+            args.append(advisor_id)
+        return [dict(r) for r in get_conn().execute(sql, args).fetchall()]
@@ -0,0 +1,60 @@
+from __future__ import annotations
+import time
+from typing import Optional, Dict
+from src.db import get_conn, transaction
+
+class OtpRepo:
+    """OTP 驗證碼（只存雜湊；同一 email 只保留最新一組）"""
+    TBL = "otp_codes"
+
+    @staticmethod
+    def put(email: str, code_hash: str, ttl_seconds: float, *, now: float | None = None):
+        now = time.time() if now is None else now
+        with transaction() as conn:
+            conn.execute(
+                f"""
+                INSERT INTO {OtpRepo.TBL} (email, code_hash, attempts, created_at, expires_at)
+                VALUES (?,?,0,?,?)
+                ON CONFLICT(email) DO UPDATE SET
+                  code_hash=excluded.code_hash,
+                  attempts=0,
+                  created_at=excluded.created_at,
+                  expires_at=excluded.expires_at
+                """,
+                (email, code_hash, now, now + float(ttl_seconds)),
+            )
+
+    @staticmethod
+    def get_active(email: str, *, now: float | None = None) -> Optional[Dict]:
+        now = time.time() if now is None else now
+        row = get_conn().execute(
+            f"SELECT * FROM {OtpRepo.TBL} WHERE email=? AND expires_at>=?", (email, now)
+        ).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def add_failure(email: str) -> int:
+        with transaction() as conn:
+            row = conn.execute(
+                f"UPDATE {OtpRepo.TBL} SET attempts=attempts+1 WHERE email=? RETURNING attempts", (email,)
+            ).fetchone()
+        return int(row["attempts"]) if row else 0
+
+    @staticmethod
+    def delete(email: str):
+        with transaction() as conn:
+            conn.execute(f"DELETE FROM {OtpRepo.TBL} WHERE email=?", (email,))
+
+    @staticmethod
+    def sweep(*, now: float | None = None, limit: int = 500) -> int:
+        now = time.time() if now is None else now
+        with transaction() as conn:
+            cur = conn.execute(
+                f"""
+                DELETE FROM {OtpRepo.TBL} WHERE email IN (
+                  SELECT email FROM {OtpRepo.TBL} WHERE expires_at < ? LIMIT ?
+                )
+                """,
+                (now, int(limit)),
+            )
+        return cur.rowcount
@@ -3,26 +3,28 @@ from typing import Optional, List, Dict
 from datetime import datetime
 import secrets
 
-from src.db import get_conn
+from src.db import get_conn, transaction
 
 class ShareRepo:
     TBL = "shares"
+    STATS_TBL = "share_stats"
+    VISITORS_TBL = "share_visitors"
+    ARCHIVE_TBL = "shares_archive"
 
     @staticmethod
     def create(case_id: str, advisor_id: str, *, days_valid: int = 14) -> Dict:
-        conn = get_conn()
-        now = datetime.utcnow()
-        from datetime import timedelta
-        token = secrets.token_urlsafe(16)
-        exp = now + timedelta(days=days_valid)
-        conn.execute(
-            f"""
-            INSERT INTO {ShareRepo.TBL} (token, case_id, advisor_id, created_at, expires_at)
-            VALUES (?,?,?,?,?)
-            """,
-            (token, case_id, advisor_id, now.isoformat(), exp.isoformat()),
-        )
-        conn.commit()
+        with transaction() as conn:
+            now = datetime.utcnow()
+            from datetime import timedelta
+            token = secrets.token_urlsafe(16)
+            exp = now + timedelta(days=days_valid)
+            conn.execute(
+                f"""
+                INSERT INTO {ShareRepo.TBL} (token, case_id, advisor_id, created_at, expires_at)
+                VALUES (?,?,?,?,?)
+                """,
+                (token, case_id, advisor_id, now.isoformat(), exp.isoformat()),
+            )
         return {
             "token": token,
             "case_id": case_id,
@@ -32,25 +34,200 @@ class ShareRepo:
         }
 
     @staticmethod
-    def get_by_token(token: str) -> Optional[Dict]:
-        cur = get_conn().execute(f"SELECT * FROM {ShareRepo.TBL} WHERE token=?", (token,))
+    def get_by_token(token: str, *, include_expired: bool = False) -> Optional[Dict]:
+        """預設只回傳未過期的連結（過期判斷在 SQL 內完成）"""
+        sql = f"SELECT * FROM {ShareRepo.TBL} WHERE token=?"
+        args: list = [token]
+        if not include_expired:
+            sql += " AND (expires_at IS NULL OR expires_at >= ?)"
+            args.append(datetime.utcnow().isoformat())
+        cur = get_conn().execute(sql, args)
         row = cur.fetchone(); return dict(row) if row else None
 
     @staticmethod
-    def list_by_advisor(advisor_id: str) -> List[Dict]:
-        cur = get_conn().execute(
-            f"SELECT * FROM {ShareRepo.TBL} WHERE advisor_id=? ORDER BY created_at DESC",
-            (advisor_id,)
-        )
+    def list_by_advisor(advisor_id: str, *, include_expired: bool = False) -> List[Dict]:
+        """含互動計數（share_stats：opens / unique_visitors / last_opened_at / accepts）"""
+        sql = f"""
+            SELECT s.*, coalesce(st.opens, 0) AS opens, coalesce(st.unique_visitors, 0) AS unique_visitors,
+                   st.last_opened_at, coalesce(st.accepts, 0) AS accepts
+            FROM {ShareRepo.TBL} s LEFT JOIN {ShareRepo.STATS_TBL} st ON st.token = s.token
+            WHERE s.advisor_id=?
+            """
+        args: list = [advisor_id]
+        if not include_expired:
+            sql += " AND (s.expires_at IS NULL OR s.expires_at >= ?)"
+            args.append(datetime.utcnow().isoformat())
+        sql += " ORDER BY s.created_at DESC"
+        cur = get_conn().execute(sql, args)
         return [dict(r) for r in cur.fetchall()]
 
+    @staticmethod
+    def page_by_advisor(
+        advisor_id: str,
+        *,
+        status: str | None = None,
+        expiry: str = "active",
+        after: tuple | None = None,
+        limit: int = 50,
+    ) -> tuple:
+        """
+        顧問面板分頁：分享連結 + 互動計數 + 案件摘要（客戶、淨遺產、案件狀態），單一查詢。
+        - keyset 分頁：依 (created_at, id) 由新到舊，after 傳上一頁回傳的游標；走 idx_shares_adv(advisor_id, created_at, id)
+        - status：案件狀態；expiry："active" / "expired" / "all"
+        回傳 (rows, next_cursor)；沒有下一頁時 next_cursor 為 None。
+        """
+        sql = f"""
+            SELECT s.id, s.token, s.case_id, s.created_at, s.expires_at, s.opened_at, s.accepted_at,
+                   coalesce(st.opens, 0) AS opens, coalesce(st.unique_visitors, 0) AS unique_visitors,
+                   st.last_opened_at, coalesce(st.accepts, 0) AS accepts,
+                   c.client_alias, c.net_estate, c.status AS case_status
+            FROM {ShareRepo.TBL} s
+            LEFT JOIN {ShareRepo.STATS_TBL} st ON st.token = s.token
+            LEFT JOIN cases c ON c.id = s.case_id
+            WHERE s.advisor_id=?
+            """
+        args: list = [advisor_id]
+        now = datetime.utcnow().isoformat()
+        if expiry == "active":
+            sql += " AND (s.expires_at IS NULL OR s.expires_at >= ?)"
+            args.append(now)
+        elif expiry == "expired":
+            sql += " AND s.expires_at < ?"
+            args.append(now)
+        if status:
+            sql += " AND c.status = ?"
+            args.append(status)
+        if after:
+            sql += " AND (s.created_at, s.id) < (?, ?)"   # row value：直接從游標位置往下掃索引
+            args.extend([after[0], after[1]])
+        sql += " ORDER BY s.created_at DESC, s.id DESC LIMIT ?"
+        args.append(int(limit) + 1)
+        rows = [dict(r) for r in get_conn().execute(sql, args).fetchall()]
+        nxt = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            nxt = (rows[-1]["created_at"], rows[-1]["id"])
+        return rows, nxt
+
+    @staticmethod
+    def archive_expired(*, before: str, limit: int = 500) -> int:
+        """
+        把 expires_at < before 的連結（最多 limit 筆，走 idx_shares_expiry）搬到 shares_archive，
+        連同計數快照；並刪除 shares / share_stats / share_visitors 對應列。單一交易，回傳搬移筆數。
+        """
+        with transaction() as conn:
+            rows = conn.execute(
+                f"SELECT id, token FROM {ShareRepo.TBL} WHERE expires_at < ? ORDER BY expires_at LIMIT ?",
+                (before, int(limit)),
+            ).fetchall()
+            if not rows:
+                return 0
+            ids = [r["id"] for r in rows]
+            tokens = [(r["token"],) for r in rows]
+            marks = ",".join("?" * len(ids))
+            conn.execute(
+                f"""
+                INSERT INTO {ShareRepo.ARCHIVE_TBL}
+                  (id, token, case_id, advisor_id, created_at, expires_at, opened_at, accepted_at,
+                   opens, unique_visitors, accepts, archived_at)
+                SELECT s.id, s.token, s.case_id, s.advisor_id, s.created_at, s.expires_at, s.opened_at, s.accepted_at,
+                       coalesce(st.opens, 0), coalesce(st.unique_visitors, 0), coalesce(st.accepts, 0), ?
+                FROM {ShareRepo.TBL} s LEFT JOIN {ShareRepo.STATS_TBL} st ON st.token = s.token
+                WHERE s.id IN ({marks})
+                ON CONFLICT DO NOTHING
+                """,
+                [datetime.utcnow().isoformat(), *ids],
+            )
+            conn.executemany(f"DELETE FROM {ShareRepo.STATS_TBL} WHERE token=?", tokens)
+            conn.executemany(f"DELETE FROM {ShareRepo.VISITORS_TBL} WHERE token=?", tokens)
+            cur = conn.execute(f"DELETE FROM {ShareRepo.TBL} WHERE id IN ({marks})", ids)
+            return cur.rowcount
+
     @staticmethod
     def delete_by_token(token: str) -> bool:
-        conn = get_conn()
-        cur = conn.execute(f"DELETE FROM {ShareRepo.TBL} WHERE token=?", (token,))
-        conn.commit()
+        with transaction() as conn:
+            cur = conn.execute(f"DELETE FROM {ShareRepo.TBL} WHERE token=?", (token,))
+            conn.execute(f"DELETE FROM {ShareRepo.STATS_TBL} WHERE token=?", (token,))
+            conn.execute(f"DELETE FROM {ShareRepo.VISITORS_TBL} WHERE token=?", (token,))
         return cur.rowcount > 0
 
+    @staticmethod
+    def mark_opened(token: str, at: str | None = None):
+        """只記第一次開啟時間"""
+        with transaction() as conn:
+            conn.execute(
+                f"UPDATE {ShareRepo.TBL} SET opened_at=coalesce(opened_at, ?) WHERE token=?",
+                (at or datetime.utcnow().isoformat(), token),
+            )
+
+    @staticmethod
+    def mark_accepted(token: str, at: str | None = None):
+        with transaction() as conn:
+            conn.execute(
+                f"UPDATE {ShareRepo.TBL} SET accepted_at=coalesce(accepted_at, ?) WHERE token=?",
+                (at or datetime.utcnow().isoformat(), token),
+            )
+
+    @staticmethod
+    def apply_counters(rows: List[Dict]):
+        """
+        批次套用累積的計數（單一交易）。rows 每筆：
+          token, opens, accepts, visitors(list[str]), first_opened_at, last_opened_at, last_accepted_at
+        """
+        if not rows:
+            return
+        with transaction() as conn:  # 單一交易：失敗整批回滾，由呼叫端重試
+            conn.executemany(
+                f"INSERT INTO {ShareRepo.VISITORS_TBL} (token, visitor, first_seen) VALUES (?,?,?) ON CONFLICT DO NOTHING",
+                [(r["token"], v, r.get("first_opened_at") or r.get("last_accepted_at")) for r in rows for v in r.get("visitors", [])],
+            )
+            conn.executemany(
+                f"""
+                INSERT INTO {ShareRepo.STATS_TBL} (token, opens, first_opened_at, last_opened_at, accepts, last_accepted_at)
+                VALUES (:token, :opens, :first_opened_at, :last_opened_at, :accepts, :last_accepted_at)
+                ON CONFLICT(token) DO UPDATE SET
+                  opens = {ShareRepo.STATS_TBL}.opens + excluded.opens,
+                  first_opened_at = coalesce({ShareRepo.STATS_TBL}.first_opened_at, excluded.first_opened_at),
+                  last_opened_at = greatest({ShareRepo.STATS_TBL}.last_opened_at, excluded.last_opened_at),
+                  accepts = {ShareRepo.STATS_TBL}.accepts + excluded.accepts,
+                  last_accepted_at = greatest({ShareRepo.STATS_TBL}.last_accepted_at, excluded.last_accepted_at)
+                """,
+                [{k: r.get(k) for k in ("token", "opens", "first_opened_at", "last_opened_at", "accepts", "last_accepted_at")} for r in rows],
+            )
+            conn.executemany(
+                f"""
+                UPDATE {ShareRepo.STATS_TBL}
+                SET unique_visitors = (SELECT count(*) FROM {ShareRepo.VISITORS_TBL} v WHERE v.token = ?)
+                WHERE token = ?
+                """,
+                [(r["token"], r["token"]) for r in rows if r.get("visitors")],
+            )
+            conn.executemany(
+                f"""
+                UPDATE {ShareRepo.TBL} SET
+                  opened_at = coalesce(opened_at, ?),
+                  accepted_at = coalesce(accepted_at, ?)
+                WHERE token = ?
+                """,
+                [(r.get("first_opened_at"), r.get("last_accepted_at"), r["token"]) for r in rows],
+            )
+
+    @staticmethod
+    def purge_orphan_stats(*, limit: int = 500) -> int:
+        """清掉對應連結已不存在的計數列（例如 flush 前連結已被停用）"""
+        with transaction() as conn:
+            cur = conn.execute(
+                f"""
+                DELETE FROM {ShareRepo.STATS_TBL} WHERE token IN (
+                  SELECT st.token FROM {ShareRepo.STATS_TBL} st
+                  LEFT JOIN {ShareRepo.TBL} s ON s.token = st.token
+                  WHERE s.id IS NULL LIMIT ?
+                )
+                """,
+                (int(limit),),
+            )
+            return cur.rowcount
+
     @staticmethod
     def is_expired(row: Dict) -> bool:
         try:
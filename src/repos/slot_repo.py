@@ -0,0 +1,181 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Dict, List, Optional, Iterable, Tuple
+
+from src.db import get_conn, transaction
+
+class SlotRepo:
+    """
+    顧問可預約時段（booking_slots）與預約佔位（slot_reservations）。
+    時段時間為當地時間（naive ISO，例如 2026-10-21T14:00），以字串比較排序。
+    """
+    TBL = "booking_slots"
+    RES_TBL = "slot_reservations"
+
+    @staticmethod
+    def upsert_slots(advisor_id: str, slots: Iterable[Tuple[str, str, int]]) -> int:
+        """
+        新增 / 更新時段 [(starts_at, ends_at, capacity), ...]，單一交易。
+        已存在的時段只更新結束時間與容量（容量不會低於已預約數）。
+        """
+        rows = [(advisor_id, s, e, max(1, int(c))) for s, e, c in slots]
+        if not rows:
+            return 0
+        with transaction() as conn:
+            conn.executemany(
+                f"""
+                INSERT INTO {SlotRepo.TBL} (advisor_id, starts_at, ends_at, capacity, booked)
+                VALUES (?,?,?,?,0)
+                ON CONFLICT(advisor_id, starts_at) DO UPDATE SET
+                  ends_at = excluded.ends_at,
+                  capacity = greatest(excluded.capacity, {SlotRepo.TBL}.booked)
+                """,
+                rows,
+            )
+        return len(rows)
+
+    @staticmethod
+    def get(slot_id: int) -> Optional[Dict]:
+        row = get_conn().execute(f"SELECT * FROM {SlotRepo.TBL} WHERE id=?", (int(slot_id),)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def open_slots(
+        *,
+        advisor_id: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        limit: int = 50,
+    ) -> List[Dict]:
+        """
+        尚有名額的時段（依開始時間排序）。
+        走部分索引 idx_slots_open / idx_slots_open_adv（只收 booked < capacity 的列），
+        額滿時段不在索引內，查詢成本與總時段數無關。
+        """
+        since = since or datetime.now().isoformat(timespec="minutes")
+        sql = f"""
+            SELECT id, advisor_id, starts_at, ends_at, capacity, booked, capacity - booked AS remaining
+            FROM {SlotRepo.TBL}
+            WHERE booked < capacity AND starts_at >= ?
+            """
+        args: list = [since]
+        if advisor_id:
+            sql += " AND advisor_id = ?"; args.append(advisor_id)
+        if until:
+            sql += " AND starts_at < ?"; args.append(until)
+        sql += " ORDER BY starts_at LIMIT ?"
+        args.append(int(limit))
+        return [dict(r) for r in get_conn().execute(sql, args).fetchall()]
+
+    @staticmethod
+    def list_by_advisor(advisor_id: str, *, since: str | None = None, limit: int = 200) -> List[Dict]:
+        since = since or datetime.now().isoformat(timespec="minutes")
+        cur = get_conn().execute(
+            f"""
+            SELECT * FROM {SlotRepo.TBL}
+            WHERE advisor_id = ? AND starts_at >= ?
+            ORDER BY starts_at LIMIT ?
+            """,
+            (advisor_id, since, int(limit)),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+    @staticmethod
+    def reserve(slot_id: int, payload: dict) -> Optional[int]:
+        """
+        佔位並建立預約（單一交易）。名額檢查寫在 UPDATE 條件內（booked < capacity），
+        即使多個請求同時搶同一時段，也只有名額內的請求會成功；失敗回傳 None。
+        """
+        now = datetime.utcnow().isoformat()
+        with transaction() as conn:
+            cur = conn.execute(
+                f"""
+                UPDATE {SlotRepo.TBL} SET booked = booked + 1
+                WHERE id = ? AND booked < capacity AND starts_at >= ?
+                """,
+                (int(slot_id), datetime.now().isoformat(timespec="minutes")),
+            )
+            if cur.rowcount != 1:
+                return None
+            cur = conn.execute(
+                """
+                INSERT INTO bookings (case_id, name, phone, email, timeslot, created_at, status)
+                VALUES (?,?,?,?,?,?,?)
+                RETURNING id
+                """,
+                (
+                    payload.get("case_id"), payload.get("name"), payload.get("phone"), payload.get("email"),
+                    payload.get("timeslot"), now, payload.get("status", "Pending"),
+                ),
+            )
+            booking_id = cur.fetchone()[0]
+            conn.execute(
+                f"INSERT INTO {SlotRepo.RES_TBL} (slot_id, booking_id, created_at) VALUES (?,?,?)",
+                (int(slot_id), booking_id, now),
+            )
+        return booking_id
+
+    @staticmethod
+    def release_bookings(conn, booking_ids: List[int]):
+        """
+        釋放預約佔用的名額（供取消預約時在呼叫端的交易內使用，不自行 commit）。
+        佔位列保留並記下 released_at，重新開啟時才知道要搶回哪個時段。
+        """
+        if not booking_ids:
+            return
+        marks = ",".join("?" * len(booking_ids))
+        conn.execute(
+            f"""
+            UPDATE {SlotRepo.TBL} SET booked = greatest(booked - 1, 0)
+            WHERE id IN (SELECT slot_id FROM {SlotRepo.RES_TBL}
+                         WHERE booking_id IN ({marks}) AND released_at IS NULL)
+            """,
+            booking_ids,
+        )
+        conn.execute(
+            f"UPDATE {SlotRepo.RES_TBL} SET released_at=? WHERE booking_id IN ({marks}) AND released_at IS NULL",
+            (datetime.utcnow().isoformat(), *booking_ids),
+        )
+
+    @staticmethod
+    def reclaim_bookings(conn, booking_ids: List[int]) -> List[int]:
+        """
+        重新開啟已取消的預約時搶回原時段名額（呼叫端的交易內使用，不自行 commit）。
+        與 reserve 相同以 booked < capacity 為條件；時段已額滿的預約回傳其 id，呼叫端不應重新開啟。
+        沒有佔位紀錄的預約（未綁時段）不受影響。
+        """
+        if not booking_ids:
+            return []
+        marks = ",".join("?" * len(booking_ids))
+        rows = conn.execute(
+            f"""
+            SELECT slot_id, booking_id FROM {SlotRepo.RES_TBL}
+            WHERE booking_id IN ({marks}) AND released_at IS NOT NULL
+            ORDER BY booking_id
+            """,
+            booking_ids,
+        ).fetchall()
+        full: List[int] = []
+        for r in rows:
+            cur = conn.execute(
+                f"UPDATE {SlotRepo.TBL} SET booked = booked + 1 WHERE id = ? AND booked < capacity",
+                (r["slot_id"],),
+            )
+            if cur.rowcount != 1:
+                full.append(r["booking_id"])
+                continue
+            conn.execute(
+                f"UPDATE {SlotRepo.RES_TBL} SET released_at = NULL WHERE slot_id = ? AND booking_id = ?",
+                (r["slot_id"], r["booking_id"]),
+            )
+        return full
+
+    @staticmethod
+    def delete_unbooked(slot_id: int, advisor_id: str) -> bool:
+        """刪除尚無人預約的時段"""
+        with transaction() as conn:
+            cur = conn.execute(
+                f"DELETE FROM {SlotRepo.TBL} WHERE id=? AND advisor_id=? AND booked=0",
+                (int(slot_id), advisor_id),
+            )
+        return cur.rowcount > 0
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import time
+from src.db import get_conn, transaction
+
+
+class _Denied(Exception):
+    pass
+
+
+class ThrottleRepo:
+    """
+    登入節流（存在 DB，跨 session / 多副本共用）：
+      - take()：token bucket，單一 UPSERT 完成「補充 + 扣除」，不需先讀再寫
+      - take_all()：多個 bucket 全部有額度才一起扣（任一不足整批回滾）
+      - lock()/locked_for()：鎖定到某時間點
+      - sweep()：依 expires_at 索引清掉過期列（分批）
+    """
+    TBL = "auth_throttle"
+
+    @staticmethod
+    def _take(conn, key: str, capacity: float, per_seconds: float, *, cost: float, now: float) -> bool:
+        rate = float(capacity) / float(per_seconds)
+        cur = conn.execute(
+            f"""
+            INSERT INTO {ThrottleRepo.TBL} (key, tokens, updated_at, locked_until, expires_at)
+            VALUES (:key, :cap - :cost, :now, 0, :now + :window)
+            ON CONFLICT(key) DO UPDATE SET
+              tokens = least(:cap, coalesce({ThrottleRepo.TBL}.tokens, :cap)
+                             + (:now - coalesce({ThrottleRepo.TBL}.updated_at, :now)) * :rate) - :cost,
+              updated_at = :now,
+              expires_at = greatest(coalesce({ThrottleRepo.TBL}.locked_until, 0), :now + :window)
+            WHERE least(:cap, coalesce({ThrottleRepo.TBL}.tokens, :cap)
+                        + (:now - coalesce({ThrottleRepo.TBL}.updated_at, :now)) * :rate) >= :cost
+            """,
+            {"key": key, "cap": float(capacity), "cost": float(cost), "now": now,
+             "rate": rate, "window": float(per_seconds)},
+        )
+        return cur.rowcount > 0
+
+    @staticmethod
+    def take(key: str, capacity: float, per_seconds: float, *, cost: float = 1.0, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        with transaction() as conn:
+            return ThrottleRepo._take(conn, key, capacity, per_seconds, cost=cost, now=now)
+
+    @staticmethod
+    def take_all(buckets, *, cost: float = 1.0, now: float | None = None) -> str | None:
+        """
+        buckets：[(key, capacity, per_seconds), ...]。單一交易內依序扣除，全部有額度才 commit；
+        任一不足就整批回滾（前面的 bucket 不會被扣），回傳該 key。全部成功回傳 None。
+        """
+        now = time.time() if now is None else now
+        denied = None
+        try:
+            with transaction() as conn:
+                for key, capacity, per_seconds in buckets:
+                    if not ThrottleRepo._take(conn, key, capacity, per_seconds, cost=cost, now=now):
+                        denied = key
+                        raise _Denied(key)
+        except _Denied:
+            pass
+        return denied
+
+    @staticmethod
+    def lock(key: str, seconds: float, *, now: float | None = None):
+        now = time.time() if now is None else now
+        until = now + float(seconds)
+        with transaction() as conn:
+            conn.execute(
+                f"""
+                INSERT INTO {ThrottleRepo.TBL} (key, tokens, updated_at, locked_until, expires_at)
+                VALUES (?, NULL, NULL, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                  locked_until = excluded.locked_until,
+                  expires_at = greatest(coalesce({ThrottleRepo.TBL}.expires_at, 0), excluded.expires_at)
+                """,
+                (key, until, until),
+            )
+
+    @staticmethod
+    def locked_for(key: str, *, now: float | None = None) -> int:
+        """回傳剩餘鎖定秒數（未鎖定為 0）"""
+        now = time.time() if now is None else now
+        row = get_conn().execute(
+            f"SELECT locked_until FROM {ThrottleRepo.TBL} WHERE key=?", (key,)
+        ).fetchone()
+        if not row or not row["locked_until"]:
+            return 0
+        return max(0, int(row["locked_until"] - now))
+
+    @staticmethod
+    def unlock(key: str):
+        with transaction() as conn:
+            conn.execute(f"UPDATE {ThrottleRepo.TBL} SET locked_until=0 WHERE key=?", (key,))
+
+    @staticmethod
+    def sweep(*, now: float | None = None, limit: int = 500) -> int:
+        now = time.time() if now is None else now
+        with transaction() as conn:
+            cur = conn.execute(
+                f"""
+                DELETE FROM {ThrottleRepo.TBL} WHERE key IN (
+                  SELECT key FROM {ThrottleRepo.TBL} WHERE expires_at < ? LIMIT ?
+                )
+                """,
+                (now, int(limit)),
+            )
+        return cur.rowcount
@@ -0,0 +1,130 @@
+"""
+顧問名冊（白名單）：
+- 來源：secrets.ADVISORS（email = "顯示名稱|角色"）＋ 可選的 CSV 檔（email,name,role）
+- 一次載入、預先建好「小寫 email → Advisor」索引，查詢為 O(1)
+- 每 CHECK_EVERY 秒最多檢查一次來源是否變動（檔案 mtime / secrets 指紋），有變才重建
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import csv, threading, time
+
+ADVISORS_FILE = Path("data/advisors.csv")
+CHECK_EVERY = 30  # 秒
+
+@dataclass(frozen=True)
+class Advisor:
+    email: str
+    name: str
+    role: str  # "admin" | "user"
+
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+def _parse_entry(email: str, raw) -> Advisor:
+    parts = [p.strip() for p in str(raw or "").split("|", 1)]
+    name = parts[0] or email
+    role = (parts[1].lower() if len(parts) > 1 else "user") or "user"
+    return Advisor(email=email, name=name, role=("admin" if role == "admin" else "user"))
+
+
+def _secrets_table() -> Dict[str, str]:
+    try:
+        import streamlit as st
+        return dict(st.secrets.get("ADVISORS", {}))
+    except Exception:
+        return {}
+
+
+def _file_path() -> Path:
+    try:
+        import streamlit as st
+        p = st.secrets.get("ADVISORS_FILE")
+        return Path(p) if p else ADVISORS_FILE
+    except Exception:
+        return ADVISORS_FILE
+
+
+def _file_mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+class _Directory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Dict[str, Advisor] = {}
+        self._signature: Tuple | None = None
+        self._checked_at = 0.0
+
+    def _signature_now(self) -> Tuple:
+        path = _file_path()
+        table = _secrets_table()
+        return (path.as_posix(), _file_mtime(path), hash(tuple(sorted(table.items()))))
+
+    def _build(self) -> Dict[str, Advisor]:
+        index: Dict[str, Advisor] = {}
+        path = _file_path()
+        if path.exists():
+            try:
+                with path.open("r", newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f):
+                        email = normalize_email(row.get("email"))
+                        if not email:
+                            continue
+                        index[email] = _parse_entry(email, f"{row.get('name') or ''}|{row.get('role') or 'user'}")
+            except Exception:
+                pass
+        # secrets 優先（可覆寫檔案中的同一 email）
+        for k, v in _secrets_table().items():
+            email = normalize_email(k)
+            if email:
+                index[email] = _parse_entry(email, v)
+        return index
+
+    def _refresh(self, force: bool = False):
+        now = time.time()
+        if not force and self._signature is not None and now - self._checked_at < CHECK_EVERY:
+            return
+        with self._lock:
+            self._checked_at = now
+            sig = self._signature_now()
+            if force or sig != self._signature:
+                self._index = self._build()
+                self._signature = sig
+
+    def lookup(self, email: str) -> Optional[Advisor]:
+        self._refresh()
+        return self._index.get(normalize_email(email))
+
+    def count(self) -> int:
+        self._refresh()
+        return len(self._index)
+
+    def reload(self):
+        self._refresh(force=True)
+
+
+_directory = _Directory()
+
+
+def lookup(email: str) -> Optional[Advisor]:
+    return _directory.lookup(email)
+
+
+def is_advisor(email: str) -> bool:
+    return _directory.lookup(email) is not None
+
+
+def count() -> int:
+    return _directory.count()
+
+
+def reload():
+    _directory.reload()
@@ -1,8 +1,12 @@
 from __future__ import annotations
-from typing import Optional, Tuple
-import random, time
+from typing import Tuple
+import hashlib, hmac, secrets, time
 import streamlit as st
 
+from src.repos.otp_repo import OtpRepo
+from src.repos.throttle_repo import ThrottleRepo
+from src.services import advisors
+
 # ============ SMTP ============
 import smtplib
 from email.message import EmailMessage
@@ -25,71 +29,145 @@ def _send_mail(to_email: str, subject: str, body: str) -> bool:
     except Exception:
         return False
 
-# 顧問名單
-
-def _advisors():
-    return dict(st.secrets.get("ADVISORS", {}))
-
+# 顧問名單（見 services.advisors：預先建好的正規化索引）
 
 def is_whitelisted(email: str) -> bool:
-    adv = _advisors(); return email.lower().strip() in {k.lower() for k in adv.keys()}
+    return advisors.is_advisor(email)
 
 
 def resolve_profile(email: str) -> Tuple[str, str]:
-    raw = _advisors().get(email) or _advisors().get(email.lower().strip())
-    if raw and isinstance(raw, str) and "|" in raw:
-        name, role = raw.split("|", 1)
-        role = role.strip().lower()
-        if role not in ("admin","user"): role = "user"
-        return name.strip(), role
+    adv = advisors.lookup(email)
+    if adv:
+        return adv.name, adv.role
     return email, "user"
 
 # OTP 流程 + 節流
+# 驗證碼、錯誤次數與鎖定都存在 DB（otp_codes / auth_throttle），
+# 換瀏覽器 session 或多副本部署都共用同一份節流狀態。
+# 可在 secrets 設定：
+# [AUTH]
+# OTP_TTL = 300
+# IP_BURST = 10
+# IP_WINDOW = 600
+# SMTP_BURST = 30
+# SMTP_WINDOW = 60
+# TRUSTED_PROXIES = 1   # 前面有幾層會附加 X-Forwarded-For 的反向代理（0 = 不信任此標頭）
+
+def _cfg_int(section: str, key: str, default: int) -> int:
+    try:
+        return int(st.secrets.get(section, {}).get(key, default))
+    except Exception:
+        return default
+
+OTP_TTL = _cfg_int("AUTH", "OTP_TTL", 300)              # 5 分鐘
+RESEND_WINDOW = _cfg_int("AUTH", "RESEND_WINDOW", 60)   # 同一 email 60 秒內僅允許一次寄送
+IP_BURST = _cfg_int("AUTH", "IP_BURST", 10)             # 同一 IP 每 IP_WINDOW 秒最多寄送次數
+IP_WINDOW = _cfg_int("AUTH", "IP_WINDOW", 600)
+SMTP_BURST = _cfg_int("AUTH", "SMTP_BURST", 30)         # 全站寄信上限，保護 SMTP
+SMTP_WINDOW = _cfg_int("AUTH", "SMTP_WINDOW", 60)
+TRUSTED_PROXIES = _cfg_int("AUTH", "TRUSTED_PROXIES", 1)
+MAX_FAILS = _cfg_int("AUTH", "MAX_FAILS", 5)
+LOCK_SECONDS = _cfg_int("AUTH", "LOCK_SECONDS", 600)    # 10 分鐘鎖定
+SWEEP_EVERY = 60
+
+_last_sweep = 0.0
+
+
+def _maybe_sweep():
+    """每個 process 每 SWEEP_EVERY 秒最多清一次過期列（走 expires_at 索引）。"""
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < SWEEP_EVERY:
+        return
+    _last_sweep = now
+    try:
+        OtpRepo.sweep(now=now)
+        ThrottleRepo.sweep(now=now)
+    except Exception:
+        pass
+
+
+def _hash_code(email: str, code: str) -> str:
+    return hashlib.sha256(f"{email}:{code}".encode("utf-8")).hexdigest()
+
+
+def client_ip() -> str | None:
+    """
+    用戶端 IP：X-Forwarded-For 由右往左第 TRUSTED_PROXIES 個（我方反向代理附加的那一筆）。
+    左邊的值是用戶端自己送來的、可任意偽造，不能拿來節流。標頭層數不足時改用代理設定的 X-Real-Ip；
+    取不到回 None。
+    """
+    try:
+        headers = st.context.headers
+        hops = [h.strip() for h in (headers.get("X-Forwarded-For") or "").split(",") if h.strip()]
+        if TRUSTED_PROXIES > 0 and len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+        return (headers.get("X-Real-Ip") or "").strip() or None
+    except Exception:
+        return None
 
-def _now() -> int:
-    return int(time.time())
 
-LOCK_KEY = "otp_locked_until"
-FAIL_KEY = "otp_fail_count"
-LAST_ISSUE_KEY = "otp_last_issue"
+def lock_remaining(email: str) -> int:
+    """該 email 尚需鎖定的秒數（0 = 未鎖定）"""
+    return ThrottleRepo.locked_for(f"lock:{email.lower().strip()}")
 
 
-def issue_otp(email: str) -> str:
+def attempts_left(email: str) -> int:
+    row = OtpRepo.get_active(email.lower().strip())
+    used = int(row["attempts"]) if row else 0
+    return max(0, MAX_FAILS - used)
+
+
+_DENIED_MSG = {
+    "email": "驗證碼已寄出，請稍候再試。",
+    "ip": "請求過於頻繁，請稍後再試。",
+    "smtp": "目前寄送量過大，請稍後再試。",
+}
+
+
+def issue_otp(email: str, ip: str | None = None) -> str:
     email = email.lower().strip()
+    ip = ip or client_ip()
+    _maybe_sweep()
     # 被鎖定？
-    locked = st.session_state.get(LOCK_KEY, 0)
-    if _now() < locked:
+    if lock_remaining(email) > 0:
         raise RuntimeError("多次錯誤嘗試，請稍後再試。")
-    # 節流：60 秒內僅允許一次寄送
-    last_issue = st.session_state.get(LAST_ISSUE_KEY, 0)
-    if _now() - last_issue < 60:
-        raise RuntimeError("驗證碼已寄出，請稍候再試。")
-
-    code = f"{random.randint(0, 999999):06d}"
+    # 節流：同 email、同 IP、全站 SMTP 三層 token bucket；三層都有額度才一起扣，
+    # 被 IP / SMTP 擋下時不會用掉該 email 的重寄額度
+    buckets = [(f"email:{email}", 1, RESEND_WINDOW)]
+    if ip:
+        buckets.append((f"ip:{ip}", IP_BURST, IP_WINDOW))
+    buckets.append(("smtp", SMTP_BURST, SMTP_WINDOW))
+    denied = ThrottleRepo.take_all(buckets)
+    if denied:
+        raise RuntimeError(_DENIED_MSG[denied.split(":", 1)[0]])
+
+    code = f"{secrets.randbelow(1_000_000):06d}"
+    OtpRepo.put(email, _hash_code(email, code), OTP_TTL)
     st.session_state["otp_email"] = email
-    st.session_state["otp_code"] = code
-    st.session_state["otp_expiry"] = _now() + 300  # 5 分鐘
-    st.session_state[LAST_ISSUE_KEY] = _now()
-    sent = _send_mail(email, "您的登入驗證碼", f"您的驗證碼為：{code}（5 分鐘內有效）")
+    sent = _send_mail(email, "您的登入驗證碼", f"您的驗證碼為：{code}（{OTP_TTL // 60} 分鐘內有效）")
     st.session_state["otp_dev_visible"] = (not sent)
-    # 重置錯誤次數
-    st.session_state[FAIL_KEY] = 0
     return code
 
 
-def verify_otp(input_code: str) -> bool:
-    code = st.session_state.get("otp_code")
-    exp = st.session_state.get("otp_expiry", 0)
-    if not code or not input_code or _now() > exp:
+def verify_otp(input_code: str, email: str | None = None) -> bool:
+    email = (email or st.session_state.get("otp_email") or "").lower().strip()
+    if not email or not input_code:
+        return False
+    if lock_remaining(email) > 0:
+        return False
+    row = OtpRepo.get_active(email)
+    if not row:
         return False
-    ok = input_code.strip() == code
+    ok = hmac.compare_digest(row["code_hash"], _hash_code(email, input_code.strip()))
     if ok:
-        st.session_state[FAIL_KEY] = 0
+        # 一次性：用過即刪
+        OtpRepo.delete(email)
         return True
     # 累計錯誤
-    st.session_state[FAIL_KEY] = int(st.session_state.get(FAIL_KEY, 0)) + 1
-    if st.session_state[FAIL_KEY] >= 5:
-        st.session_state[LOCK_KEY] = _now() + 600  # 10 分鐘鎖定
+    if OtpRepo.add_failure(email) >= MAX_FAILS:
+        ThrottleRepo.lock(f"lock:{email}", LOCK_SECONDS)
+        OtpRepo.delete(email)
     return False
 
 
@@ -101,7 +179,8 @@ def login(email: str, display_name: str, role: str):
 
 
 def logout():
-    for k in ["advisor_email","advisor_name","advisor_id","advisor_role","otp_email","otp_code","otp_expiry","otp_dev_visible",FAIL_KEY,LOCK_KEY,LAST_ISSUE_KEY]:
+    for k in ["advisor_email","advisor_name","advisor_id","advisor_role","auth_ok","otp_email","otp_dev_visible",
+              "session_case_ids"]:
         st.session_state.pop(k, None)
 
 
@@ -111,3 +190,19 @@ def is_logged_in() -> bool:
 
 def current_role() -> str:
     return st.session_state.get("advisor_role", "user")
+
+
+# 案件存取：登入顧問看自己的案件（admin 看全部）；未登入的訪客只看本 session 建立的案件
+def remember_case(case_id: str):
+    ids = st.session_state.setdefault("session_case_ids", [])
+    if case_id not in ids:
+        ids.append(case_id)
+
+
+def can_view_case(case: dict | None) -> bool:
+    if not case:
+        return False
+    if case.get("id") in st.session_state.get("session_case_ids", []):
+        return True
+    advisor_id = st.session_state.get("advisor_id")
+    return bool(advisor_id) and (current_role() == "admin" or case.get("advisor_id") == advisor_id)
@@ -0,0 +1,73 @@
+"""
+顧問行事曆：
+- 以每週範本（星期 → 開始時間）批次開出未來數週的時段，重複開放不會重複建立
+- 預約時以 SlotRepo.reserve 原子佔位；查詢可預約時段只走部分索引
+"""
+
+from __future__ import annotations
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from src.repos.slot_repo import SlotRepo
+from src.services import advisors
+
+SLOT_MINUTES = 60
+DEFAULT_CAPACITY = 1
+# 星期一 = 0
+DEFAULT_TEMPLATE: Dict[int, List[str]] = {
+    0: ["10:00", "14:00"],
+    2: ["14:00", "16:00"],
+    4: ["19:00"],
+}
+WEEKDAYS = ["週一", "週二", "週三", "週四", "週五", "週六", "週日"]
+
+
+def build_slots(
+    template: Dict[int, List[str]],
+    *,
+    start: Optional[date] = None,
+    weeks: int = 4,
+    minutes: int = SLOT_MINUTES,
+    capacity: int = DEFAULT_CAPACITY,
+) -> List[tuple]:
+    """把每週範本展開成 [(starts_at, ends_at, capacity)]（只含未來時段）"""
+    start = start or date.today()
+    now = datetime.now()
+    out: List[tuple] = []
+    for d in range(weeks * 7):
+        day = start + timedelta(days=d)
+        for hhmm in template.get(day.weekday(), []):
+            h, m = (int(x) for x in hhmm.split(":"))
+            s = datetime.combine(day, datetime.min.time()).replace(hour=h, minute=m)
+            if s <= now:
+                continue
+            e = s + timedelta(minutes=minutes)
+            out.append((s.isoformat(timespec="minutes"), e.isoformat(timespec="minutes"), capacity))
+    return out
+
+
+def open_weeks(advisor_id: str, *, weeks: int = 4, template: Dict[int, List[str]] | None = None,
+               capacity: int = DEFAULT_CAPACITY) -> int:
+    """依範本開放未來 weeks 週的時段，回傳處理的時段數"""
+    return SlotRepo.upsert_slots(advisor_id, build_slots(template or DEFAULT_TEMPLATE, weeks=weeks, capacity=capacity))
+
+
+def slot_label(slot: Dict, *, with_advisor: bool = False) -> str:
+    s = datetime.fromisoformat(slot["starts_at"])
+    label = f"{s:%m/%d}（{WEEKDAYS[s.weekday()]}）{s:%H:%M}"
+    if slot.get("ends_at"):
+        label += f"–{datetime.fromisoformat(slot['ends_at']):%H:%M}"
+    if with_advisor:
+        adv = advisors.lookup(slot["advisor_id"])
+        label += f"｜{adv.name if adv else slot['advisor_id']}"
+    return label
+
+
+def available(advisor_id: str | None = None, *, days: int = 28, limit: int = 50) -> List[Dict]:
+    until = (datetime.now() + timedelta(days=days)).isoformat(timespec="minutes")
+    return SlotRepo.open_slots(advisor_id=advisor_id, until=until, limit=limit)
+
+
+def reserve(slot_id: int, payload: dict) -> Optional[int]:
+    """原子佔位並建立預約；名額已滿（或時段已過）回傳 None"""
+    return SlotRepo.reserve(slot_id, payload)
@@ -0,0 +1,136 @@
+"""
+批次產出報告（季末檢視包）：
+- 依顧問 ID / 狀態 / 指定案件碼挑出案件，平行產出 PDF（reports_pdf）與 DOCX（reports）
+- 完成一份就寫進 zip（從磁碟串流，不把所有檔案留在記憶體），同時限制同時進行中的工作數
+- zip 內附 manifest.csv（每個案件 × 格式一列：成功 / 失敗與原因），並回傳同內容的清單
+- manifest 的 suggestions 欄為策略建議代碼（strategy_writer 規則表，整批一次向量化評估）
+
+CLI：
+  python -m src.services.batch_reports --advisor a@b.com --out data/exports/q3.zip
+  python -m src.services.batch_reports --status Won --formats pdf
+"""
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterable, List
+import argparse, csv, io, json, zipfile
+
+from src.repos.case_repo import CaseRepo
+from src.services import strategy_writer
+
+FORMATS = ("pdf", "docx")
+WORKERS = 4
+MANIFEST_FIELDS = ["case_id", "client_alias", "format", "status", "file", "error", "suggestions"]
+
+
+def _build_one(case: Dict[str, Any], fmt: str) -> Path:
+    if fmt == "pdf":
+        from src.services.reports_pdf import build_pdf_report
+        return Path(build_pdf_report(case))
+    if fmt == "docx":
+        from src.services.reports import generate_docx
+        from src.services.report_files import REPORTS_DIR
+        return REPORTS_DIR / generate_docx(case, full=True)
+    raise ValueError(f"不支援的格式：{fmt}")
+
+
+def generate_book(
+    out_zip: Path,
+    *,
+    advisor_id: str | None = None,
+    status: str | None = None,
+    case_ids: List[str] | None = None,
+    formats: Iterable[str] = FORMATS,
+    workers: int = WORKERS,
+) -> List[Dict[str, Any]]:
+    """
+    產出符合條件的所有案件報告並寫入 out_zip。
+    回傳 manifest（list of dict，欄位見 MANIFEST_FIELDS）。
+    """
+    formats = [f.lower() for f in formats]
+    out_zip = Path(out_zip)
+    out_zip.parent.mkdir(parents=True, exist_ok=True)
+    cases = CaseRepo.iter_cases(advisor_id=advisor_id, status=status, case_ids=case_ids)
+    manifest: List[Dict[str, Any]] = []
+    features: Dict[str, Dict[str, Any]] = {}
+    max_inflight = max(1, workers) * 2
+
+    with zipfile.ZipFile(out_zip, "w", compression=zipfile.ZIP_DEFLATED) as zf, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        inflight: Dict[Any, tuple] = {}
+
+        def _collect(done):
+            for fut in done:
+                case, fmt = inflight.pop(fut)
+                row = {"case_id": case.get("id"), "client_alias": case.get("client_alias") or "",
+                       "format": fmt, "status": "ok", "file": "", "error": "", "suggestions": ""}
+                try:
+                    path = fut.result()
+                    arcname = f"{case.get('id')}/{path.name}"
+                    zf.write(path, arcname)  # 由磁碟分段讀入，不整檔載入
+                    row["file"] = arcname
+                    if fmt == "pdf" and path.suffix.lower() != ".pdf":
+                        row["error"] = "WeasyPrint 不可用，已退回 HTML"
+                except Exception as e:
+                    row["status"] = "failed"
+                    row["error"] = str(e) or e.__class__.__name__
+                manifest.append(row)
+
+        for case in cases:
+            features[case.get("id")] = strategy_writer.feature_row(case)
+            for fmt in formats:
+                while len(inflight) >= max_inflight:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    _collect(done)
+                inflight[pool.submit(_build_one, case, fmt)] = (case, fmt)
+        while inflight:
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            _collect(done)
+
+        if features:
+            import pandas as pd
+            codes = strategy_writer.suggest_batch(pd.DataFrame.from_dict(features, orient="index"))
+            for row in manifest:
+                row["suggestions"] = "|".join(codes.get(row["case_id"], []))
+
+        buf = io.StringIO()
+        w = csv.DictWriter(buf, fieldnames=MANIFEST_FIELDS)
+        w.writeheader(); w.writerows(manifest)
+        zf.writestr("manifest.csv", buf.getvalue().encode("utf-8-sig"))
+        zf.writestr("manifest.json", json.dumps({
+            "generated_at": datetime.utcnow().isoformat(),
+            "filter": {"advisor_id": advisor_id, "status": status, "case_ids": case_ids, "formats": formats},
+            "ok": sum(1 for r in manifest if r["status"] == "ok"),
+            "failed": sum(1 for r in manifest if r["status"] != "ok"),
+        }, ensure_ascii=False, indent=2))
+    return manifest
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="批次產出案件報告（PDF / DOCX）並打包成 zip")
+    ap.add_argument("--advisor", help="顧問 ID（email）")
+    ap.add_argument("--status", help="案件狀態，例如 Prospect / Won")
+    ap.add_argument("--case", action="append", dest="case_ids", help="指定案件碼，可重複")
+    ap.add_argument("--formats", default=",".join(FORMATS), help="pdf,docx")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--out", help="輸出 zip 路徑（預設 data/exports/reports_<時間>.zip）")
+    args = ap.parse_args(argv)
+
+    out = Path(args.out or f"data/exports/reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+    manifest = generate_book(
+        out,
+        advisor_id=args.advisor, status=args.status, case_ids=args.case_ids,
+        formats=[f.strip() for f in args.formats.split(",") if f.strip()],
+        workers=args.workers,
+    )
+    failed = [r for r in manifest if r["status"] != "ok"]
+    print(f"完成：{len(manifest) - len(failed)} 成功，{len(failed)} 失敗 → {out}")
+    for r in failed:
+        print(f"  ✗ {r['case_id']} [{r['format']}] {r['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
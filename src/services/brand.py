@@ -1,7 +1,7 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Dict, Any
-import base64
+from typing import Dict, Any, Tuple
+import base64, io, threading
 
 BRAND_PATH = Path("brand.json")
 
@@ -21,27 +21,114 @@ DEFAULT_BRAND = {
 }
 
 
+# 品牌資產快取：以檔案 mtime 為鍵，檔案一改就自動失效
+# - brand.json 只在變動時重新解析
+# - logo 只讀一次檔，預先算好各輸出目標（web / pdf）的縮圖與 data URI
+# 縮圖需 Pillow（可選）；沒裝就沿用原圖。
+try:
+    from PIL import Image  # type: ignore
+    HAS_PIL = True
+except Exception:
+    HAS_PIL = False
+
+# 輸出目標 → 最大高度（px）。web 顯示約 40px（2x 螢幕），PDF 以約 300dpi 列印。
+LOGO_VARIANTS = {
+    "web": 80,
+    "pdf": 240,
+}
+
+_brand_cache: Dict[str, Any] = {}   # {"mtime": float, "data": dict}
+_logo_cache: Dict[str, Any] = {}    # path -> {"mtime": float, "uris": {target: str|None}}
+_lock = threading.Lock()
+
+
+def _mtime(path: Path) -> float | None:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
 def load_brand() -> Dict[str, Any]:
+    mtime = _mtime(BRAND_PATH)
+    if mtime is None:
+        return DEFAULT_BRAND
+    cached = _brand_cache.get("data")
+    if cached is not None and _brand_cache.get("mtime") == mtime:
+        return cached
     try:
-        if BRAND_PATH.exists():
-            import json
-            data = json.loads(BRAND_PATH.read_text(encoding="utf-8"))
-            return {**DEFAULT_BRAND, **data}
+        import json
+        data = json.loads(BRAND_PATH.read_text(encoding="utf-8"))
+        merged = {**DEFAULT_BRAND, **data}
     except Exception:
-        pass
-    return DEFAULT_BRAND
+        merged = DEFAULT_BRAND
+    _brand_cache.update({"mtime": mtime, "data": merged})
+    return merged
+
+
+def _mime_for(path: Path) -> str:
+    return "image/png" if path.suffix.lower() in [".png"] else "image/jpeg"
 
 
-def logo_data_uri(brand: Dict[str, Any]) -> str | None:
+def _resized(raw: bytes, path: Path, max_height: int) -> Tuple[bytes, str]:
+    """縮到 max_height 以內並壓縮；失敗或沒裝 Pillow 就回原圖。"""
+    if not HAS_PIL:
+        return raw, _mime_for(path)
+    try:
+        img = Image.open(io.BytesIO(raw))
+        if img.height > max_height:
+            w = max(1, round(img.width * max_height / img.height))
+            img = img.resize((w, max_height), Image.LANCZOS)
+        buf = io.BytesIO()
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(buf, format="PNG", optimize=True)
+            mime = "image/png"
+        else:
+            img.convert("RGB").save(buf, format="JPEG", quality=85, optimize=True)
+            mime = "image/jpeg"
+        out = buf.getvalue()
+        # 壓完反而更大就用原圖
+        return (out, mime) if len(out) < len(raw) else (raw, _mime_for(path))
+    except Exception:
+        return raw, _mime_for(path)
+
+
+def _logo_variants(path: Path) -> Dict[str, str | None] | None:
+    mtime = _mtime(path)
+    if mtime is None:
+        return None
+    key = path.as_posix()
+    entry = _logo_cache.get(key)
+    if entry and entry["mtime"] == mtime:
+        return entry["uris"]
+    with _lock:
+        entry = _logo_cache.get(key)
+        if entry and entry["mtime"] == mtime:
+            return entry["uris"]
+        try:
+            raw = path.read_bytes()
+        except Exception:
+            return None
+        uris: Dict[str, str | None] = {
+            "original": f"data:{_mime_for(path)};base64,{base64.b64encode(raw).decode('ascii')}",
+        }
+        for target, max_h in LOGO_VARIANTS.items():
+            data, mime = _resized(raw, path, max_h)
+            uris[target] = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        _logo_cache[key] = {"mtime": mtime, "uris": uris}
+        return uris
+
+
+def logo_data_uri(brand: Dict[str, Any], target: str = "original") -> str | None:
+    """
+    回傳 logo 的 data URI。target：
+      - "original"：原圖
+      - "web" / "pdf"：依 LOGO_VARIANTS 縮放壓縮後的版本
+    """
     p = brand.get("logo_path") or ""
     if not p:
         return None
-    path = Path(p)
-    if not path.exists():
-        return None
-    try:
-        b64 = base64.b64encode(path.read_bytes()).decode("ascii")
-        mime = "image/png" if path.suffix.lower() in [".png"] else "image/jpeg"
-        return f"data:{mime};base64,{b64}"
-    except Exception:
+    uris = _logo_variants(Path(p))
+    if not uris:
         return None
+    return uris.get(target) or uris.get("original")
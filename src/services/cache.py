@@ -0,0 +1,317 @@
+"""
+兩層快取：process 內 LRU + 跨 process / 跨副本共用層。
+- 共用層預設為本機 SQLite 檔（data/cache.db，WAL；同一台機器上的 worker 共用）
+  設定 [CACHE] URL = "redis://host:6379/0"（或環境變數 CACHE_URL）且已安裝 redis 套件時改用 Redis
+- 每筆有 TTL；命名空間以「世代號」失效：invalidate(ns) 只遞增世代號，舊 key 自然過期
+  （其他 process 的 LRU 最多 NS_CHECK_EVERY 秒後發現世代號變了）
+- 值以 pickle 儲存，共用層的每筆前面加 HMAC-SHA256，驗證通過才 unpickle（被竄改或金鑰不符的當作沒命中）。
+  金鑰為 [CACHE] SECRET（或 CACHE_SECRET）；未設定時 SQLite 共用層用 data/cache.db.key（首次啟動產生，權限 600），
+  Redis 則必須設定 SECRET 才會啟用（否則退回本機 SQLite 共用層）。
+  能寫入 Redis 又拿到金鑰的人即可在各 worker 執行任意程式碼：Redis 只能放在受信任的內網並開啟認證
+- stats() 回傳各命名空間的 hit / miss 計數
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+import functools, hashlib, hmac, os, pickle, secrets, sqlite3, threading, time
+
+try:
+    import redis as _redis
+    HAS_REDIS = True
+except Exception:
+    HAS_REDIS = False
+
+CACHE_PATH = Path("data/cache.db")
+KEY_PATH = Path("data/cache.db.key")
+LOCAL_MAX_ITEMS = 1024
+DEFAULT_TTL = 600       # 秒
+NS_CHECK_EVERY = 2.0    # 秒：本機 LRU 重新確認命名空間世代號的間隔
+SWEEP_EVERY = 60.0      # 秒：清掉共用層過期資料的間隔
+
+_MISS = object()
+_MAC_SIZE = hashlib.sha256().digest_size
+
+
+def _setting(key: str, default=None):
+    try:
+        import streamlit as st
+        v = st.secrets.get("CACHE", {}).get(key)
+        if v is not None:
+            return v
+    except Exception:
+        pass
+    return os.environ.get(f"CACHE_{key}", default)
+
+
+def _local_key(path: Path = KEY_PATH) -> bytes:
+    """同一台機器上各 process 共用的簽章金鑰：第一個 process 以 O_EXCL 建檔，其他的讀同一把"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            key = path.read_bytes()
+            if len(key) >= 32:
+                return key
+            time.sleep(0.01)   # 另一個 process 剛建檔、還沒寫完
+        raise RuntimeError(f"快取金鑰檔不完整：{path}")
+    key = secrets.token_bytes(32)
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(key)
+    return key
+
+
+def make_key(*parts) -> str:
+    """任意可 repr 的參數 → 固定長度 key"""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+class SqliteTier:
+    """本機共用層：同一台機器上的多個 process 共用一個 SQLite 檔"""
+
+    def __init__(self, path: Path = CACHE_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path.as_posix(), check_same_thread=False, timeout=5)
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                  k TEXT PRIMARY KEY, v BLOB NOT NULL, expires_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache_entries(expires_at);
+                CREATE TABLE IF NOT EXISTS cache_ns (ns TEXT PRIMARY KEY, gen INTEGER NOT NULL);
+                """
+            )
+
+    def get(self, k: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT v FROM cache_entries WHERE k=? AND expires_at>?", (k, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, k: str, v: bytes, ttl: float):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO cache_entries (k, v, expires_at) VALUES (?,?,?) "
+                "ON CONFLICT(k) DO UPDATE SET v=excluded.v, expires_at=excluded.expires_at",
+                (k, v, now + ttl),
+            )
+            if now - self._last_sweep > SWEEP_EVERY:
+                self._last_sweep = now
+                self._conn.execute("DELETE FROM cache_entries WHERE expires_at<=?", (now,))
+
+    def delete(self, k: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache_entries WHERE k=?", (k,))
+
+    def generation(self, ns: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT gen FROM cache_ns WHERE ns=?", (ns,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def bump(self, ns: str) -> int:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "INSERT INTO cache_ns (ns, gen) VALUES (?, 1) "
+                "ON CONFLICT(ns) DO UPDATE SET gen = gen + 1 RETURNING gen",
+                (ns,),
+            ).fetchone()
+        return int(row[0])
+
+
+class RedisTier:
+    """跨副本共用層（Redis 協定；任何相容的伺服器皆可）"""
+
+    def __init__(self, url: str):
+        self._r = _redis.Redis.from_url(url)
+
+    def get(self, k: str) -> Optional[bytes]:
+        return self._r.get(f"c:{k}")
+
+    def set(self, k: str, v: bytes, ttl: float):
+        self._r.set(f"c:{k}", v, px=max(int(ttl * 1000), 1))
+
+    def delete(self, k: str):
+        self._r.delete(f"c:{k}")
+
+    def generation(self, ns: str) -> int:
+        return int(self._r.get(f"ns:{ns}") or 0)
+
+    def bump(self, ns: str) -> int:
+        return int(self._r.incr(f"ns:{ns}"))
+
+
+class Cache:
+    def __init__(self, shared=None, *, secret: bytes | None = None, max_items: int = LOCAL_MAX_ITEMS):
+        self._shared = shared
+        # 共用同一層的 process 必須用同一把金鑰；沒給就只有本 process 讀得回自己寫的值
+        self._secret = secret or secrets.token_bytes(32)
+        self._max_items = max_items
+        self._lock = threading.Lock()
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()   # key -> (expires_at, value)
+        self._gens: Dict[str, tuple] = {}                         # ns -> (checked_at, gen)
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, ns: str, what: str):
+        s = self._stats.setdefault(ns, {"local_hits": 0, "shared_hits": 0, "misses": 0, "sets": 0})
+        s[what] += 1
+
+    def _gen(self, ns: str) -> int:
+        now = time.monotonic()
+        checked = self._gens.get(ns)
+        if checked and now - checked[0] < NS_CHECK_EVERY:
+            return checked[1]
+        gen = checked[1] if checked else 0
+        if self._shared is not None:
+            try:
+                gen = self._shared.generation(ns)
+            except Exception:
+                pass
+        self._gens[ns] = (now, gen)
+        return gen
+
+    def _full_key(self, ns: str, key: str) -> str:
+        return f"{ns}:{self._gen(ns)}:{key}"
+
+    def _mac(self, fk: str, payload: bytes) -> bytes:
+        # key 也簽進去：不能把別的 key 的值搬過來用
+        return hmac.new(self._secret, fk.encode("utf-8") + b"\0" + payload, hashlib.sha256).digest()
+
+    def _seal(self, fk: str, expires_at: float, value) -> bytes:
+        payload = pickle.dumps((expires_at, value), protocol=pickle.HIGHEST_PROTOCOL)
+        return self._mac(fk, payload) + payload
+
+    def _open(self, fk: str, raw: bytes):
+        """驗證簽章後才 unpickle；失敗回 (0, _MISS)"""
+        mac, payload = raw[:_MAC_SIZE], raw[_MAC_SIZE:]
+        if len(mac) != _MAC_SIZE or not hmac.compare_digest(mac, self._mac(fk, payload)):
+            return 0.0, _MISS
+        return pickle.loads(payload)
+
+    def get(self, ns: str, key: str, default=None):
+        fk = self._full_key(ns, key)
+        now = time.time()
+        with self._lock:
+            hit = self._local.get(fk)
+            if hit is not None and hit[0] > now:
+                self._local.move_to_end(fk)
+                self._count(ns, "local_hits")
+                return hit[1]
+        if self._shared is not None:
+            try:
+                raw = self._shared.get(fk)
+            except Exception:
+                raw = None
+            if raw is not None:
+                try:
+                    expires_at, value = self._open(fk, bytes(raw))
+                except Exception:
+                    value = _MISS
+                if value is not _MISS:
+                    with self._lock:
+                        self._put_local(fk, expires_at, value)
+                        self._count(ns, "shared_hits")
+                    return value
+        with self._lock:
+            self._count(ns, "misses")
+        return default
+
+    def _put_local(self, fk: str, expires_at: float, value):
+        self._local[fk] = (expires_at, value)
+        self._local.move_to_end(fk)
+        while len(self._local) > self._max_items:
+            self._local.popitem(last=False)
+
+    def set(self, ns: str, key: str, value, *, ttl: float = DEFAULT_TTL):
+        fk = self._full_key(ns, key)
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._put_local(fk, expires_at, value)
+            self._count(ns, "sets")
+        if self._shared is not None:
+            try:
+                self._shared.set(fk, self._seal(fk, expires_at, value), ttl)
+            except Exception:
+                # 共用層不可用時只留本機快取
+                pass
+
+    def delete(self, ns: str, key: str):
+        fk = self._full_key(ns, key)
+        with self._lock:
+            self._local.pop(fk, None)
+        if self._shared is not None:
+            try:
+                self._shared.delete(fk)
+            except Exception:
+                pass
+
+    def get_or_set(self, ns: str, key: str, compute: Callable[[], Any], *, ttl: float = DEFAULT_TTL):
+        value = self.get(ns, key, _MISS)
+        if value is _MISS:
+            value = compute()
+            self.set(ns, key, value, ttl=ttl)
+        return value
+
+    def invalidate(self, ns: str):
+        """整個命名空間失效（所有 process / 副本）"""
+        gen = None
+        if self._shared is not None:
+            try:
+                gen = self._shared.bump(ns)
+            except Exception:
+                pass
+        with self._lock:
+            if gen is None:
+                gen = self._gens.get(ns, (0, 0))[1] + 1
+            self._gens[ns] = (time.monotonic(), gen)
+            prefix = f"{ns}:"
+            for fk in [k for k in self._local if k.startswith(prefix)]:
+                del self._local[fk]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            out = {}
+            for ns, s in self._stats.items():
+                lookups = s["local_hits"] + s["shared_hits"] + s["misses"]
+                out[ns] = {**s, "hit_rate": (lookups - s["misses"]) / lookups if lookups else 0.0}
+            return out
+
+
+def _shared_tier():
+    """回傳 (共用層, 簽章金鑰)；Redis 需設定 SECRET（各副本同一把）"""
+    secret = _setting("SECRET")
+    secret = str(secret).encode("utf-8") if secret else None
+    url = str(_setting("URL") or "")
+    if url.startswith(("redis://", "rediss://", "unix://")) and HAS_REDIS and secret:
+        try:
+            return RedisTier(url), secret
+        except Exception:
+            pass
+    try:
+        return SqliteTier(), secret or _local_key()
+    except (sqlite3.Error, OSError, RuntimeError):
+        return None, None
+
+
+_tier, _secret = _shared_tier()
+cache = Cache(_tier, secret=_secret)
+
+
+def cached(ns: str, *, ttl: float = DEFAULT_TTL, key: Callable[..., Any] | None = None):
+    """函式結果快取；key 預設由全部參數產生"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            k = make_key(fn.__qualname__, key(*args, **kwargs) if key else (args, sorted(kwargs.items())))
+            return cache.get_or_set(ns, k, lambda: fn(*args, **kwargs), ttl=ttl)
+        wrapper.invalidate = lambda: cache.invalidate(ns)
+        return wrapper
+    return deco
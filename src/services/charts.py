@@ -1,10 +1,11 @@
 from __future__ import annotations
 from typing import List, Tuple
-import math
+import io, math
 import matplotlib.pyplot as plt
 from matplotlib.sankey import Sankey
 
 from src.domain.tax_rules import TaxConstants
+from src.services.cache import cache, make_key
 
 # --- 既有：各級距稅額 Bar ---
 def _compute_tax_components_wan(taxable_base_wan: float, brackets: List[Tuple[float, float]]) -> List[Tuple[str, float]]:
@@ -38,6 +39,25 @@ def tax_breakdown_bar(taxable_base_wan: float, *, constants: TaxConstants | None
     fig.tight_layout()
     return fig
 
+# --- 資產結構圓餅圖 ---
+
+def asset_pie(financial_yuan: float, realestate_yuan: float, business_yuan: float):
+    """金融 / 不動產 / 公司股權 三類資產佔比；全部為 0 時畫空白提示。"""
+    labels = ["金融資產", "不動產", "公司股權"]
+    values = [max(float(financial_yuan or 0), 0.0), max(float(realestate_yuan or 0), 0.0), max(float(business_yuan or 0), 0.0)]
+    pairs = [(l, v) for l, v in zip(labels, values) if v > 0]
+
+    fig, ax = plt.subplots(figsize=(5, 3.6))
+    ax.set_title("資產結構（佔比）")
+    if pairs:
+        ax.pie([v for _, v in pairs], labels=[l for l, _ in pairs], autopct="%1.1f%%", startangle=90)
+        ax.axis("equal")
+    else:
+        ax.text(0.5, 0.5, "無資產資料", ha="center", va="center")
+        ax.axis("off")
+    fig.tight_layout()
+    return fig
+
 # --- 新增：節稅對比（實際上是「稅後資金缺口」對比） ---
 
 def savings_compare_bar(current_tax_yuan: float, coverage_yuan: float):
@@ -98,3 +118,23 @@ def simple_sankey(total_assets_yuan: float, tax_yuan: float, reserve_yuan: float
     sankey.finish()
     fig.tight_layout()
     return fig
+
+# --- PNG 輸出（共用快取：相同參數的圖在各 process / 副本只畫一次） ---
+CACHE_NS = "charts"
+CACHE_TTL = 86400  # 秒；圖只由參數決定，不會過時
+
+def cache_key(func_name: str, args: tuple) -> str:
+    return make_key(func_name, tuple(args))
+
+def _png_bytes(fig, dpi: int = 160) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    plt.close(fig)
+    return buf.getvalue()
+
+def render_png(func_name: str, *args) -> bytes:
+    """以本模組的繪圖函式畫圖並輸出 PNG bytes（先查快取）"""
+    return cache.get_or_set(
+        CACHE_NS, cache_key(func_name, args),
+        lambda: _png_bytes(globals()[func_name](*args)), ttl=CACHE_TTL,
+    )
@@ -0,0 +1,280 @@
+"""
+預留稅源方案最佳化：從保單 / 信託選項中找出「保費最低、且稅後資金缺口 ≤ 目標」的組合。
+模型（金額單位：元）：
+  P   = Σ premium_i·x_i（保費由遺產現金支出；premiums_reduce_estate=True 時課稅基礎同步減少 P）
+  need = 稅額(課稅基礎 − P)·buffer
+  gap  = max(need − Σ sum_assured_i·x_i, 0)
+- 單一選項所需單位數：稅額在每個級距內是線性的，逐級距直接解出 c·x = buffer·稅額(B − p·x) − 目標 − 已有預留，
+  取落在該級距內的解；數千個選項一次以 numpy 陣列算完
+- 組合（整數單位數的精確最佳解）：先以啟發式（依每元保費的預留額由高到低加入、單一選項補足、
+  再拿掉多餘單位）得到一組可行解當上界，再對各選項的單位數做分支定界：
+  每展開一個選項就以 evaluate() 向量化評估整層候選，剪掉「保費不低於目前最佳」與
+  「其餘選項全取上限仍達不到目標」的分支（多投保只會讓缺口變小，可行性單調）
+- 候選數超過 SEARCH_BUDGET 時停止搜尋、改回傳啟發式結果，並以 exact=False 標示（畫面須註明為近似解）
+- 結果另附各單一選項方案（alternatives），方便比較
+本模組只做示意試算，不構成保險或稅務建議。
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Optional, Tuple
+import math
+
+import numpy as np
+import pandas as pd
+
+from src.domain.tax_rules import EstateTaxCalculator, TaxConstants
+
+OPTION_COLUMNS = ["name", "premium", "sum_assured", "min_units", "max_units"]
+ALTERNATIVES = 10
+SEARCH_BUDGET = 2_000_000   # 分支定界最多評估的候選組合數
+MAX_FRONTIER = 200_000      # 單層展開的候選上限（控制記憶體）
+_EPS = 1e-9
+
+
+def _brackets(c: TaxConstants):
+    """級距 → (下限, 上限, 稅率, 下限以前的累計稅額)，單位：萬"""
+    lower, upper, rate, acc = [], [], [], []
+    prev, total = 0.0, 0.0
+    for up, r in c.TAX_BRACKETS:
+        lower.append(prev); upper.append(float(up)); rate.append(float(r)); acc.append(total)
+        if math.isinf(up):
+            break
+        total += (up - prev) * r
+        prev = float(up)
+    return np.array(lower), np.array(upper), np.array(rate), np.array(acc)
+
+
+def tax_wan(base_wan, c: TaxConstants):
+    """progressive_tax_wan 的向量化版本"""
+    lower, upper, rate, acc = _brackets(c)
+    b = np.maximum(np.asarray(base_wan, dtype=float), 0.0)[..., None]
+    inside = (b > lower) & (b <= upper)
+    return np.where(inside, acc + (b - lower) * rate, 0.0).sum(axis=-1)
+
+
+def units_needed(base_wan: float, covered: float, sum_assured, premium, *, buffer: float,
+                 target_gap: float, c: TaxConstants, premiums_reduce_estate: bool = True):
+    """
+    目前課稅基礎 base_wan、已有預留 covered 下，每個選項各自需要多少單位（連續值）才能讓缺口 ≤ target_gap。
+    無解（不提供預留也不減少課稅基礎）為 inf。
+    """
+    unit = c.UNIT_FACTOR
+    cov = np.asarray(sum_assured, dtype=float)
+    k = (np.asarray(premium, dtype=float) if premiums_reduce_estate else np.zeros_like(cov)) / unit  # 每單位降低的基礎（萬）
+    lower, upper, rate, acc = _brackets(c)
+    slack = target_gap + covered
+    need0 = buffer * unit * float(tax_wan(base_wan, c)) - slack
+    if need0 <= 0:
+        return np.zeros_like(cov)
+
+    best = np.full(cov.shape, np.inf)
+    B = float(base_wan)
+    for lo, hi, r, a in zip(lower, upper, rate, acc):
+        if lo >= B:
+            break   # 基礎只會往下走
+        num = buffer * unit * (a + r * (B - lo)) - slack
+        den = cov + buffer * unit * r * k
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = np.where(den > 0, num / den, np.inf)
+        b = B - k * x
+        ok = (x >= 0) & (b >= lo - _EPS) & (b <= hi + _EPS)
+        best = np.where(ok, np.minimum(best, x), best)
+    # 課稅基礎降到 0：稅額為 0，剩下只要 slack ≥ 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zero = np.where(k > 0, B / k, np.inf)
+    if slack >= 0:
+        best = np.minimum(best, zero)
+    return best
+
+
+def evaluate(units, options, *, base_wan: float, buffer: float, c: TaxConstants,
+             premiums_reduce_estate: bool = True) -> Dict[str, Any]:
+    """一次評估多組候選（units：候選數 × 選項數），回傳各候選的保費、預留、稅額、需求與缺口（元）"""
+    x = np.atleast_2d(np.asarray(units, dtype=float))
+    premium = x @ options["premium"].to_numpy(dtype=float)
+    coverage = x @ options["sum_assured"].to_numpy(dtype=float)
+    base = base_wan - (premium / c.UNIT_FACTOR if premiums_reduce_estate else np.zeros_like(premium))
+    tax = tax_wan(base, c) * c.UNIT_FACTOR
+    need = tax * buffer
+    return {"premium": premium, "coverage": coverage, "tax": tax, "need": need,
+            "gap": np.maximum(need - coverage, 0.0)}
+
+
+def _normalize(options) -> pd.DataFrame:
+    df = pd.DataFrame(options).copy()
+    if "name" not in df.columns:
+        df["name"] = [f"選項{i + 1}" for i in range(len(df))]
+    for col, default in (("min_units", 0), ("max_units", 1)):
+        if col not in df.columns:
+            df[col] = default
+    for col in ("premium", "sum_assured", "min_units", "max_units"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0).clip(lower=0.0)
+    df["min_units"] = df["min_units"].round()
+    df["max_units"] = df[["max_units", "min_units"]].max(axis=1).round()
+    return df.reset_index(drop=True)
+
+
+def _greedy(p, cov, lo, hi, state, *, kw, red: float, buf: float, c: TaxConstants, target: float):
+    """啟發式：每元保費預留額高的先加（加到差一點點或上限），狀態每變一次就比較「直接由單一選項補足」"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(p > 0, cov / np.where(p > 0, p, 1.0), np.where(cov > 0, np.inf, 0.0))
+    order = [i for i in np.argsort(-ratio, kind="stable") if cov[i] > 0 or (red and p[i] > 0)]
+    x = lo.copy()
+    best = None
+    need = None
+    for i in [*order, None]:
+        if need is None:
+            need = units_needed(*state(x), cov, p, **kw)   # 每個選項單獨補足所需（連續值）
+            if not need.any():
+                best = x.copy()
+                break
+            rest = np.ceil(need - _EPS)
+            fits = rest <= hi - x
+            if fits.any():
+                j = int(np.argmin(np.where(fits, rest * p, np.inf)))
+                if best is None or x @ p + rest[j] * p[j] < best @ p:
+                    best = x.copy()
+                    best[j] += rest[j]
+        if i is None:
+            break
+        add = min(hi[i] - x[i], math.floor(need[i] + _EPS))
+        if add > 0:
+            x[i] += add
+            need = None
+    if best is None:
+        return None
+
+    # 逐一拿掉多餘的單位（每輪所有選項一起試，取省最多且仍達標者）；每輪少一個單位，輪數有上限
+    x = best
+    for _ in range(int((x - lo).sum())):
+        B, C = state(x)
+        b = B + red * p / c.UNIT_FACTOR
+        gap = np.maximum(buf * c.UNIT_FACTOR * tax_wan(b, c) - (C - cov), 0.0)
+        ok = (x > lo) & (gap <= target)
+        if not ok.any():
+            break
+        x[int(np.argmax(np.where(ok, p, -1.0)))] -= 1
+    return x
+
+
+def _branch_and_bound(x0, free, p, hi, *, gap_of, target: float,
+                      upper: float) -> Tuple[Optional[np.ndarray], bool]:
+    """
+    對 free 內各選項的整數單位數做分支定界（其餘選項固定為 x0），找保費 < upper 的最低保費可行解。
+    回傳 (最佳解；沒有比 upper 更便宜的解為 None, 是否在 SEARCH_BUDGET 內完成)。
+    """
+    best, best_cost = None, upper
+    if gap_of(x0[None, :])[0] <= target:
+        return (x0.copy(), True) if x0 @ p < upper else (None, True)
+    order = sorted(free, key=lambda i: hi[i] - x0[i])   # 範圍小的先展開，前幾層候選較少
+    rows = x0[None, :]
+    evaluated = 0
+    for depth, i in enumerate(order):
+        steps = np.arange(x0[i] + 1, hi[i] + 1)   # x0[i] 本身已在上一層的候選裡
+        n = len(rows) * (len(steps) + 1)
+        evaluated += n
+        if n > MAX_FRONTIER or evaluated > SEARCH_BUDGET:
+            return best, False
+        cand = np.repeat(rows, len(steps) + 1, axis=0)
+        cand[:, i] = np.tile(np.concatenate(([x0[i]], steps)), len(rows))
+        cand = cand[cand @ p < best_cost - 1e-6]
+        if not len(cand):
+            break
+        # 已達標的候選：更新最佳解；再加單位只會更貴，不必往下展開
+        ok = gap_of(cand) <= target
+        if ok.any():
+            hit = cand[ok]
+            j = int(np.argmin(hit @ p))
+            best, best_cost = hit[j].copy(), float(hit[j] @ p)
+            cand = cand[~ok]
+            cand = cand[cand @ p < best_cost - 1e-6]
+        rest = order[depth + 1:]
+        if not rest or not len(cand):
+            break
+        # 其餘選項全取上限仍不達標 → 剪掉
+        probe = cand.copy()
+        probe[:, rest] = hi[rest]
+        rows = cand[gap_of(probe) <= target]
+        if not len(rows):
+            break
+    return best, True
+
+
+def optimize(options, *, base_wan: float, target_gap: float = 0.0, buffer: Optional[float] = None,
+             constants: Optional[TaxConstants] = None, premiums_reduce_estate: bool = True,
+             alternatives: int = ALTERNATIVES) -> Dict[str, Any]:
+    """
+    options：DataFrame 或 list of dict（name, premium, sum_assured, min_units, max_units；金額為每單位的元）。
+    base_wan：目前課稅基礎（萬）。回傳 dict：
+      feasible, exact（False 表示候選過多、units 為啟發式近似解）, units（每個選項的單位數）,
+      plan（有投保的選項明細 DataFrame）, premium, coverage, tax, need, gap（元）,
+      alternatives（單一選項方案 DataFrame）,
+      base_without_reserve_wan（不靠預留、缺口 ≤ 目標時課稅基礎需降到多少）
+    """
+    c = constants or TaxConstants()
+    buf = float(buffer if buffer is not None else c.BUFFER_MULTIPLIER)
+    opts = _normalize(options)
+    p = opts["premium"].to_numpy(dtype=float)
+    cov = opts["sum_assured"].to_numpy(dtype=float)
+    lo = opts["min_units"].to_numpy(dtype=float)
+    hi = opts["max_units"].to_numpy(dtype=float)
+    kw = dict(buffer=buf, target_gap=float(target_gap), c=c, premiums_reduce_estate=premiums_reduce_estate)
+    red = 1.0 if premiums_reduce_estate else 0.0
+    target = float(target_gap) + 1e-6
+
+    def state(units):
+        return base_wan - red * float(units @ p) / c.UNIT_FACTOR, float(units @ cov)
+
+    def gap_of(units):
+        return evaluate(units, opts, base_wan=base_wan, buffer=buf, c=c,
+                        premiums_reduce_estate=premiums_reduce_estate)["gap"]
+
+    # 單一選項方案（從最低單位數出發，各自補足）
+    single = np.ceil(units_needed(*state(lo), cov, p, **kw) - _EPS)
+    single_ok = single <= hi - lo
+    alt = opts[["name", "premium", "sum_assured"]].copy()
+    alt["units"] = lo + np.where(single_ok, single, 0.0)
+    alt["cost"] = alt["units"] * p
+    alt = alt[single_ok].sort_values("cost").head(alternatives).reset_index(drop=True)
+
+    # 免保費而有預留的選項直接取上限；沒有作用的選項固定在下限；其餘交給分支定界
+    useful = (cov > 0) | ((red > 0) & (p > 0))
+    x0 = np.where((p <= 0) & useful, hi, lo)
+    free = [i for i in range(len(opts)) if useful[i] and p[i] > 0 and hi[i] > lo[i]]
+    top = x0.copy()
+    top[free] = hi[free]
+    if gap_of(top[None, :])[0] > target:
+        # 全部取上限仍不達標：回傳缺口最小（預留最多）的組合
+        x, exact = top, True
+    else:
+        heur = _greedy(p, cov, lo, hi, state, kw=kw, red=red, buf=buf, c=c, target=target)
+        if heur is not None and gap_of(heur[None, :])[0] > target:
+            heur = None
+        upper = float(heur @ p) if heur is not None else math.inf
+        found, exact = _branch_and_bound(x0, free, p, hi, gap_of=gap_of, target=target, upper=upper)
+        if found is not None:
+            x = found
+        elif heur is not None:
+            x = heur
+        else:
+            x, exact = top, False
+
+    res = evaluate(x, opts, base_wan=base_wan, buffer=buf, c=c, premiums_reduce_estate=premiums_reduce_estate)
+    plan = opts.assign(units=x)
+    plan = plan[plan["units"] > 0].assign(
+        cost=lambda d: d["units"] * d["premium"], reserve=lambda d: d["units"] * d["sum_assured"],
+    )[["name", "units", "premium", "sum_assured", "cost", "reserve"]].reset_index(drop=True)
+    calc = EstateTaxCalculator(c)
+    return {
+        "feasible": bool(res["gap"][0] <= target),
+        "exact": bool(exact),
+        "units": x,
+        "plan": plan,
+        "premium": float(res["premium"][0]),
+        "coverage": float(res["coverage"][0]),
+        "tax": float(res["tax"][0]),
+        "need": float(res["need"][0]),
+        "gap": float(res["gap"][0]),
+        "alternatives": alt,
+        "base_without_reserve_wan": calc.inverse_progressive_tax_wan(max(target_gap, 0.0) / buf / c.UNIT_FACTOR),
+    }
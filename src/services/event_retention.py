@@ -0,0 +1,141 @@
+"""
+事件保留期：events 只留最近 RETENTION_DAYS 天，更舊的依月份封存成壓縮 JSONL。
+- 依 id 由舊到新分批（BATCH_SIZE）讀取，遇到第一筆仍在保留期內的事件就停（主鍵範圍掃描，
+  不需要為此多建 created_at 索引，熱表只留 idx_events_case）
+- 每批先寫檔再刪除：archive/events/YYYY-MM/part-<第一筆 id>.jsonl.gz，暫存檔寫完 fsync 後
+  os.replace；中途失敗重跑會產生同名、內容相同或更多的檔案覆蓋，不會重複
+- 封存前先 funnel.refresh()，確保要刪的事件已併入轉換漏斗
+- 一輪有刪除就呼叫 db.reclaim_space() 歸還空間
+- 封存月份可用 iter_archived / read_archived_df 查詢（依月份目錄挑檔，不必全部解壓）
+多副本部署時封存目錄需放在共用儲存空間。
+"""
+
+from __future__ import annotations
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+import gzip, json, os, threading, time
+
+from src.db import reclaim_space
+from src.repos.event_repo import EventRepo
+from src.services import funnel
+
+RETENTION_DAYS = int(os.environ.get("EVENTS_RETENTION_DAYS", 180))
+ARCHIVE_DIR = Path("data/archive/events")
+BATCH_SIZE = 2000
+MAX_BATCHES = 50      # 每輪上限，避免單輪佔用太久
+INTERVAL = 6 * 3600   # 秒
+PAUSE = 0.05          # 批次間隔（秒）
+
+_thread: threading.Thread | None = None
+_lock = threading.Lock()
+
+
+def _month(created_at: str | None) -> str:
+    return (created_at or "")[:7] or "unknown"
+
+
+def _write_part(month: str, rows: List[Dict]) -> Path:
+    d = ARCHIVE_DIR / month
+    d.mkdir(parents=True, exist_ok=True)
+    target = d / f"part-{rows[0]['id']:012d}.jsonl.gz"
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as fh:
+            for r in rows:
+                fh.write(json.dumps(r, ensure_ascii=False).encode("utf-8"))
+                fh.write(b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, target)
+    return target
+
+
+def archive_once(*, retention_days: int = RETENTION_DAYS, batch_size: int = BATCH_SIZE,
+                 max_batches: int = MAX_BATCHES) -> int:
+    """跑一輪封存，回傳封存筆數"""
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+    funnel.refresh()
+    total = 0
+    for _ in range(max_batches):
+        rows = EventRepo.head(limit=batch_size)
+        old = []
+        for r in rows:
+            if r["created_at"] and r["created_at"] >= cutoff:
+                break
+            old.append(r)
+        if not old:
+            break
+        by_month: Dict[str, List[Dict]] = {}
+        for r in old:
+            try:
+                r["meta"] = json.loads(r["meta"]) if r["meta"] else {}
+            except (TypeError, ValueError):
+                pass   # 保留原字串
+            by_month.setdefault(_month(r["created_at"]), []).append(r)
+        for month, part in by_month.items():
+            _write_part(month, part)
+        total += EventRepo.delete_range(old[0]["id"], old[-1]["id"])
+        if len(old) < len(rows) or len(rows) < batch_size:
+            break
+        time.sleep(PAUSE)
+    if total:
+        reclaim_space()
+    return total
+
+
+def archived_months() -> List[str]:
+    if not ARCHIVE_DIR.exists():
+        return []
+    return sorted(d.name for d in ARCHIVE_DIR.iterdir() if d.is_dir())
+
+
+def iter_archived(since: str | None = None, until: str | None = None, *, months: Iterable[str] | None = None,
+                  case_id: str | None = None, events: Iterable[str] | None = None) -> Iterator[Dict]:
+    """
+    逐筆讀出封存事件；since / until 為 UTC ISO 字串（含 since，不含 until），
+    months 可直接指定月份（YYYY-MM）。只開啟涵蓋期間的月份目錄。
+    """
+    wanted = set(events) if events else None
+    only = set(months) if months else None
+    for month in archived_months():
+        if only is not None and month not in only:
+            continue
+        if month != "unknown" and ((since and month < since[:7]) or (until and month > until[:7])):
+            continue
+        for path in sorted((ARCHIVE_DIR / month).glob("part-*.jsonl.gz")):
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                for line in fh:
+                    r = json.loads(line)
+                    ts = r.get("created_at") or ""
+                    if (since and ts < since) or (until and ts >= until):
+                        continue
+                    if case_id and r.get("case_id") != case_id:
+                        continue
+                    if wanted and r.get("event") not in wanted:
+                        continue
+                    yield r
+
+
+def read_archived_df(since: str | None = None, until: str | None = None, **filters):
+    import pandas as pd
+    return pd.DataFrame(list(iter_archived(since, until, **filters)),
+                        columns=["id", "case_id", "event", "meta", "created_at"])
+
+
+def _run():
+    while True:
+        try:
+            archive_once()
+        except Exception:
+            pass
+        time.sleep(INTERVAL)
+
+
+def start():
+    """啟動背景封存（每個 process 一次）"""
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="event-retention", daemon=True)
+            _thread.start()
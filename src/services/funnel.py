@@ -0,0 +1,145 @@
+"""
+案件轉換漏斗：建立 → 分享 → 開啟 → 意向 → 預約（另計解鎖）。
+- refresh() 從上次處理到的 events.id 往後，每 CHUNK 筆 id 以一次視窗函式查詢彙整成 case_funnel
+  （每案件一列、各階段第一次發生時間），事件再多也只處理新增的部分
+- summary() 以案件建立時間分 cohort，依顧問 / 期間算出各階段人數、相對建立的轉換率、
+  相鄰階段的轉換率與時間中位數（小時）；計算在 pandas 內向量化完成
+- 背景執行緒每 INTERVAL 秒 refresh 一次（app.py 啟動）；頁面不在繪製時寫入
+- event_retention 封存前會先 refresh，封存掉的事件已反映在 case_funnel；
+  rebuild() 清空後會先重播封存檔（iter_archived），再從 events 表補上其餘事件
+"""
+
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+import threading, time
+
+from src.repos.funnel_repo import FunnelRepo
+
+STAGES = [
+    ("created_at", "建立"),
+    ("shared_at", "分享"),
+    ("opened_at", "開啟"),
+    ("accepted_at", "意向"),
+    ("booked_at", "預約"),
+]
+EXTRA_STAGES = [("unlocked_at", "解鎖")]
+CHUNK = 50_000   # 每次彙整的 events.id 範圍
+INTERVAL = 300   # 秒：背景 refresh 間隔
+
+_lock = threading.Lock()
+_thread: threading.Thread | None = None
+_thread_lock = threading.Lock()
+
+
+def refresh(*, chunk: int = CHUNK) -> int:
+    """把新事件併入漏斗，回傳處理的 events.id 範圍大小"""
+    with _lock:
+        lo = FunnelRepo.last_event_id()
+        top = FunnelRepo.max_event_id()
+        start = lo
+        while lo < top:
+            hi = min(lo + chunk, top)
+            FunnelRepo.apply_range(lo, hi)
+            lo = hi
+        return top - start if top > start else 0
+
+
+def _replay_archived(*, batch: int = CHUNK) -> int:
+    """把封存檔裡的漏斗事件併回 case_funnel，回傳重播的事件數"""
+    from src.services import event_retention   # event_retention 也 import 本模組
+    stage_of = {e: col for col, evs in FunnelRepo.STAGE_EVENTS.items() for e in evs}
+    firsts: dict = {}
+    n = 0
+    for r in event_retention.iter_archived(events=stage_of):
+        case_id, ts = r.get("case_id"), r.get("created_at")
+        if not case_id or case_id == "N/A" or not ts:
+            continue
+        stages = firsts.setdefault(case_id, {})
+        col = stage_of[r["event"]]
+        if col not in stages or ts < stages[col]:
+            stages[col] = ts
+        n += 1
+        if len(firsts) >= batch:
+            FunnelRepo.merge_firsts(firsts)
+            firsts = {}
+    FunnelRepo.merge_firsts(firsts)
+    return n
+
+
+def rebuild() -> int:
+    """從頭重建：封存事件 + events 表，回傳處理的事件數 / id 範圍"""
+    FunnelRepo.reset()
+    return _replay_archived() + refresh()
+
+
+def _run():
+    while True:
+        try:
+            refresh()
+        except Exception:
+            pass
+        time.sleep(INTERVAL)
+
+
+def start():
+    """啟動背景 refresh（每個 process 一次）"""
+    global _thread
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="funnel-refresh", daemon=True)
+            _thread.start()
+
+
+def _to_utc(d: datetime) -> str:
+    if d.tzinfo is not None:
+        d = d.astimezone(timezone.utc).replace(tzinfo=None)
+    return d.isoformat()
+
+
+def summary(since: datetime, until: datetime, *, by: Sequence[str] = ("advisor",),
+            period: str = "M", advisor_id: Optional[str] = None, tz=None):
+    """
+    by 可含 "advisor"、"period"（period 為 pandas 週期代碼，例如 "W"、"M"；以 tz 的當地日期切分）。
+    回傳 DataFrame：n_<階段>、rate_<階段>（相對建立）、step_<階段>（相對前一階段）、
+    hours_<前一階段>_<階段>（時間中位數）。
+    """
+    import pandas as pd
+    cols = [c for c, _ in STAGES + EXTRA_STAGES]
+    df = pd.DataFrame(FunnelRepo.cohort(_to_utc(since), _to_utc(until), advisor_id=advisor_id),
+                      columns=["case_id", "advisor_id", "advisor_name", *cols])
+    for c in cols:
+        df[c] = pd.to_datetime(df[c], errors="coerce", utc=True)
+
+    keys = []
+    if "advisor" in by:
+        df["advisor_id"] = df["advisor_id"].fillna("")
+        df["advisor_name"] = df["advisor_name"].fillna("")
+        keys += ["advisor_id", "advisor_name"]
+    if "period" in by:
+        local = df["created_at"].dt.tz_convert(tz) if tz is not None else df["created_at"]
+        df["period"] = local.dt.tz_localize(None).dt.to_period(period).astype(str)
+        keys.append("period")
+
+    reached = {c: df[c].notna() for c in cols}
+    calc = pd.DataFrame({f"n_{c}": reached[c].astype(int) for c in cols}, index=df.index)
+    # 相鄰階段：兩者都有且順序正確才算轉換 / 計時
+    for (prev, _), (cur, _) in zip(STAGES, STAGES[1:]):
+        ok = reached[prev] & reached[cur] & (df[cur] >= df[prev])
+        calc[f"conv_{cur}"] = ok.astype(int)
+        calc[f"hours_{prev}_{cur}"] = ((df[cur] - df[prev]).dt.total_seconds() / 3600.0).where(ok)
+    for k in keys:
+        calc[k] = df[k]
+
+    grouped = calc.groupby(keys, dropna=False) if keys else calc.groupby(lambda _: 0)
+    counts = grouped[[c for c in calc.columns if c.startswith(("n_", "conv_"))]].sum()
+    medians = grouped[[c for c in calc.columns if c.startswith("hours_")]].median()
+    out = counts.join(medians)
+
+    base = out["n_created_at"].where(out["n_created_at"] > 0)
+    for c in cols[1:]:
+        out[f"rate_{c}"] = (out[f"n_{c}"] / base).fillna(0.0)
+    for (prev, _), (cur, _) in zip(STAGES, STAGES[1:]):
+        denom = out[f"n_{prev}"].where(out[f"n_{prev}"] > 0)
+        out[f"step_{cur}"] = (out.pop(f"conv_{cur}") / denom).fillna(0.0)
+    return out.reset_index(drop=not keys)
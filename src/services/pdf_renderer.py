@@ -0,0 +1,206 @@
+"""
+長駐 PDF 轉檔 worker（WeasyPrint）：
+- 獨立 process 只做一次字型探索（FontConfiguration）與共用樣式表解析，之後每份報告只剩排版成本
+- 透過本機 Queue 收 HTML 工作；一次取出佇列中多筆，逐一輸出（批次）
+- 先寫暫存檔再 os.replace 到輸出路徑，讀檔的人不會看到寫到一半的 PDF
+- worker 掛掉或逾時（視為卡住，直接終止）會在下次 get_renderer 時重啟；
+  呼叫端仍保留 in-process / HTML 退回路徑（見 reports_pdf）
+"""
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Tuple
+import multiprocessing as mp
+import os, queue, threading, uuid
+
+BATCH_SIZE = 8
+RENDER_TIMEOUT = 60.0  # 秒：單次等待上限（含冷啟動）
+
+# 共用樣式：頁面設定 + 中文字型優先順序（每份報告共用，只解析一次）
+SHARED_CSS = """
+@page { size: A4; margin: 14mm 12mm; }
+body { font-family: "Noto Sans TC", "Noto Sans CJK TC", "PingFang TC", "Microsoft JhengHei", sans-serif; }
+img { max-width: 100%; }
+"""
+
+_READY = "__ready__"
+
+
+def _worker_main(jobs, results, batch_size: int):
+    """worker process 入口：載入 WeasyPrint、預熱字型，然後批次處理工作。"""
+    try:
+        from weasyprint import HTML, CSS
+        try:
+            from weasyprint.text.fonts import FontConfiguration
+        except Exception:  # 舊版 WeasyPrint
+            from weasyprint.fonts import FontConfiguration
+        font_config = FontConfiguration()
+        shared = CSS(string=SHARED_CSS, font_config=font_config)
+        # 預熱：先排一份含中文的小文件，讓字型探索在此發生
+        HTML(string="<p>預熱 warm-up</p>").write_pdf(stylesheets=[shared], font_config=font_config)
+    except Exception as e:
+        results.put((_READY, False, repr(e)))
+        return
+    results.put((_READY, True, None))
+
+    while True:
+        job = jobs.get()
+        batch = [job]
+        while len(batch) < batch_size:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        stop = any(j is None for j in batch)
+        for j in batch:
+            if j is None:
+                continue
+            job_id, html, out_path = j
+            tmp = f"{out_path}.{job_id}.tmp"
+            try:
+                HTML(string=html, base_url=".").write_pdf(tmp, stylesheets=[shared], font_config=font_config)
+                os.replace(tmp, out_path)
+                results.put((job_id, True, None))
+            except Exception as e:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                results.put((job_id, False, repr(e)))
+        if stop:
+            return
+
+
+class PdfRenderer:
+    def __init__(self, *, batch_size: int = BATCH_SIZE):
+        ctx = mp.get_context("spawn")
+        self._jobs = ctx.Queue()
+        self._results = ctx.Queue()
+        self._proc = ctx.Process(target=_worker_main, args=(self._jobs, self._results, batch_size), daemon=True)
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, list] = {}   # job_id -> [Event, (ok, err)]
+        self._ready = threading.Event()
+        self._ready_ok = False
+        self._ready_err = None
+        self._dead = False
+        self._proc.start()
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def _read_results(self):
+        while True:
+            try:
+                job_id, ok, err = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if not self._proc.is_alive():
+                    self._fail_all("PDF worker 已停止")
+                    return
+                continue
+            except (EOFError, OSError):
+                self._fail_all("PDF worker 連線中斷")
+                return
+            if job_id == _READY:
+                self._ready_ok, self._ready_err = ok, err
+                self._ready.set()
+                if not ok:
+                    self._fail_all(err or "PDF worker 啟動失敗")
+                    return
+                continue
+            with self._lock:
+                w = self._waiters.pop(job_id, None)
+            if w:
+                w[1] = (ok, err)
+                w[0].set()
+
+    def _fail_all(self, err: str):
+        if not self._ready.is_set():
+            self._ready_err = err
+            self._ready.set()
+        with self._lock:
+            self._dead = True
+            waiters, self._waiters = self._waiters, {}
+        for w in waiters.values():
+            w[1] = (False, err)
+            w[0].set()
+
+    def abort(self, reason: str):
+        """停掉 worker（例如逾時，可能卡在某份文件上），等待中的工作全部以失敗結束；下次 get_renderer 會重啟"""
+        self._fail_all(reason)
+        try:
+            self._proc.terminate()
+            self._proc.join(timeout=5)
+        except Exception:
+            pass
+
+    def alive(self) -> bool:
+        return not self._dead and self._proc.is_alive()
+
+    def wait_ready(self, timeout: float = RENDER_TIMEOUT) -> bool:
+        self._ready.wait(timeout)
+        return self._ready_ok
+
+    def _submit(self, html: str, out_path: Path) -> list:
+        job_id = uuid.uuid4().hex
+        w = [threading.Event(), None]
+        with self._lock:
+            if self._dead:
+                w[1] = (False, self._ready_err or "PDF worker 不可用")
+                w[0].set()
+                return w
+            self._waiters[job_id] = w
+        self._jobs.put((job_id, html, Path(out_path).as_posix()))
+        return w
+
+    def render_many(self, items: List[Tuple[str, Path]], *, timeout: float = RENDER_TIMEOUT) -> List[Tuple[Path, bool, str | None]]:
+        """
+        一次送出多份 HTML，worker 會批次處理。回傳 [(輸出路徑, 成功?, 錯誤)]。
+        逾時就終止 worker（之後不會再寫入輸出路徑），其餘等待中的工作一併失敗，不再各等一輪。
+        """
+        waiters = [(Path(p), self._submit(html, p)) for html, p in items]
+        out = []
+        for p, w in waiters:
+            if not w[0].wait(timeout):
+                self.abort("PDF 轉檔逾時")
+                out.append((p, False, "逾時"))
+                continue
+            ok, err = w[1]
+            out.append((p, ok, err))
+        return out
+
+    def render(self, html: str, out_path: Path, *, timeout: float = RENDER_TIMEOUT) -> Path:
+        (p, ok, err), = self.render_many([(html, out_path)], timeout=timeout)
+        if not ok:
+            raise RuntimeError(f"PDF 轉檔失敗：{err}")
+        return p
+
+    def close(self):
+        try:
+            self._jobs.put(None)
+            self._proc.join(timeout=5)
+        except Exception:
+            pass
+        if self._proc.is_alive():
+            self._proc.terminate()
+
+
+_renderer: PdfRenderer | None = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> PdfRenderer:
+    """取得（必要時重啟）共用的 PDF worker"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None or not _renderer.alive():
+            if _renderer is not None:
+                _renderer.close()
+            _renderer = PdfRenderer()
+        return _renderer
+
+
+def warm_up(timeout: float = RENDER_TIMEOUT) -> bool:
+    """啟動並等待 worker 完成字型預熱；WeasyPrint 不可用時回傳 False。"""
+    try:
+        return get_renderer().wait_ready(timeout)
+    except Exception:
+        return False
@@ -0,0 +1,218 @@
+"""
+報告檔下載：入口只在頁面通過權限檢查（解鎖）後才產生，不走公開的靜態目錄。
+- ASGI 模式（streamlit run asgi.py）：頁面簽發短效票證 URL（HMAC，綁定檔案路徑、ETag 與到期時間），
+  由自訂路由以固定大小分段串流，不把整份檔案讀進 Python heap；檔案重新產生後舊票證即失效。
+  瀏覽器以 If-None-Match / If-Modified-Since 重新驗證，檔案未變就回 304 不重送
+- 一般模式（streamlit run app.py）：st.download_button 延遲讀檔（按下時才讀）
+報告一律先寫暫存檔再 os.replace（write_atomic），串流中的下載不會讀到寫到一半的內容。
+"""
+
+from __future__ import annotations
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+import base64, hashlib, hmac, json, mimetypes, os, secrets, threading, time
+
+ROOT = Path(__file__).resolve().parents[2]
+REPORTS_DIR = ROOT / "data" / "reports"
+ROUTE_PATH = "report-files"
+TICKET_TTL = 300   # 秒：下載票證有效時間
+CHUNK_SIZE = 256 * 1024
+
+_route_mounted = False
+_local_key = secrets.token_bytes(32)
+
+
+def reports_dir() -> Path:
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    return REPORTS_DIR
+
+
+def write_atomic(path: Path, write: Callable[[Path], Any]) -> Path:
+    """write(暫存路徑) 寫完後以 os.replace 換上；已開啟舊檔的讀取端仍讀到完整的舊內容"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return path
+
+
+def _meta(st_: os.stat_result, path: Path) -> Dict[str, Any]:
+    return {
+        "size": st_.st_size,
+        "mtime": st_.st_mtime,
+        "mtime_ns": st_.st_mtime_ns,
+        "etag": f'"{st_.st_size:x}-{st_.st_mtime_ns:x}"',
+        "last_modified": formatdate(st_.st_mtime, usegmt=True),
+        "mime": mimetypes.guess_type(str(path))[0] or "application/octet-stream",
+    }
+
+
+def file_meta(path: Path) -> Dict[str, Any]:
+    """檔案大小、修改時間與 ETag（由 size + mtime 算出，不需讀檔）"""
+    return _meta(Path(path).stat(), Path(path))
+
+
+def _iter_open(fh, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    try:
+        while True:
+            buf = fh.read(chunk_size)
+            if not buf:
+                break
+            yield buf
+    finally:
+        fh.close()
+
+
+def iter_chunks(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    return _iter_open(Path(path).open("rb"), chunk_size)
+
+
+# ---------- 下載票證 ----------
+
+def _signing_key() -> bytes:
+    """
+    secrets 的 [REPORTS] SIGNING_KEY；未設定時用本 process 的隨機金鑰
+    （單一 server process 足夠，多副本部署需設定同一把）
+    """
+    try:
+        import streamlit as st
+        key = st.secrets.get("REPORTS", {}).get("SIGNING_KEY")
+        if key:
+            return str(key).encode("utf-8")
+    except Exception:
+        pass
+    return _local_key
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _allowed(path: Path) -> bool:
+    return path.is_relative_to(REPORTS_DIR.resolve())
+
+
+def issue_ticket(path: Path, *, ttl: int = TICKET_TTL, now: float | None = None) -> str:
+    """簽發下載票證；呼叫端須已確認目前使用者可以取得這份報告"""
+    path = Path(path).resolve()
+    if not _allowed(path):
+        raise ValueError(f"不在報告目錄內：{path}")
+    # 到期時間對齊 ttl 的整數倍：同一份檔案在一個區間內拿到同一個 URL，瀏覽器才能對它重新驗證（304）
+    expires = (int(now or time.time()) // ttl + 2) * ttl
+    body = json.dumps({"p": path.relative_to(REPORTS_DIR.resolve()).as_posix(),
+                       "e": file_meta(path)["etag"],
+                       "x": expires}, separators=(",", ":")).encode("utf-8")
+    sig = hmac.new(_signing_key(), body, hashlib.sha256).digest()
+    return f"{_b64(body)}.{_b64(sig)}"
+
+
+def verify_ticket(ticket: str, *, now: float | None = None) -> Optional[Tuple[Path, str]]:
+    """驗證簽章與期限，回傳 (檔案路徑, 簽發時的 ETag)；無效回 None"""
+    try:
+        body_s, sig_s = ticket.split(".", 1)
+        body = _unb64(body_s)
+        if not hmac.compare_digest(_unb64(sig_s), hmac.new(_signing_key(), body, hashlib.sha256).digest()):
+            return None
+        data = json.loads(body)
+        if int(data["x"]) < (now or time.time()):
+            return None
+        path = (REPORTS_DIR / data["p"]).resolve()
+        return (path, str(data["e"])) if _allowed(path) else None
+    except Exception:
+        return None
+
+
+def ticket_url(path: Path) -> str:
+    return f"{ROUTE_PATH}/{issue_ticket(path)}"
+
+
+def streaming_enabled() -> bool:
+    """download_routes() 已掛到 st.App（ASGI 模式）才有串流路由可用"""
+    return _route_mounted
+
+
+def _not_modified(headers, meta: Dict[str, Any]) -> bool:
+    """條件式請求：有 If-None-Match 就只比 ETag，否則比 If-Modified-Since（秒為單位）"""
+    inm = headers.get("if-none-match")
+    if inm:
+        tags = [t.strip().removeprefix("W/") for t in inm.split(",")]
+        return "*" in tags or meta["etag"] in tags
+    ims = headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(meta["mtime"]) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def download_routes():
+    """
+    給 st.App(routes=...) 的串流下載路由（見 asgi.py）。
+    先開檔再以該檔的 fstat 比對 ETag：之後檔案被 os.replace 也不影響這次下載的內容。
+    """
+    global _route_mounted
+    from starlette.responses import Response, StreamingResponse
+    from starlette.routing import Route
+
+    def _download(request):
+        info = verify_ticket(request.path_params["ticket"])
+        if info is None:
+            return Response("連結無效或已過期", status_code=404)
+        path, etag = info
+        try:
+            fh = path.open("rb")
+        except OSError:
+            return Response("檔案不存在", status_code=404)
+        meta = _meta(os.fstat(fh.fileno()), path)
+        if meta["etag"] != etag:
+            fh.close()
+            return Response("報告已更新，請回頁面重新下載", status_code=404)
+        # no-cache：瀏覽器可留副本，但每次使用前都要帶 ETag 回來重新驗證
+        headers = {
+            "ETag": etag,
+            "Last-Modified": meta["last_modified"],
+            "Cache-Control": "private, no-cache",
+        }
+        if _not_modified(request.headers, meta):
+            fh.close()
+            return Response(status_code=304, headers=headers)
+        headers.update({
+            "Content-Length": str(meta["size"]),
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(path.name)}",
+            "X-Content-Type-Options": "nosniff",
+        })
+        return StreamingResponse(_iter_open(fh), media_type=meta["mime"], headers=headers)
+
+    _route_mounted = True
+    return [Route(f"/{ROUTE_PATH}/{{ticket}}", _download, methods=["GET"])]
+
+
+def download_widget(st, path: Path, label: str, *, key: str | None = None):
+    """在頁面放下載入口（呼叫端負責權限檢查）：ASGI 模式給票證連結，否則用延遲讀檔的 download_button。"""
+    path = Path(path)
+    meta = file_meta(path)
+    if streaming_enabled():
+        try:
+            st.markdown(
+                f'<a href="{ticket_url(path)}" download="{path.name}">⬇️ {label}</a>'
+                f'<span style="color:#888;font-size:12px">（{meta["size"] / 1024:,.0f} KB，'
+                f'{TICKET_TTL // 60} 分鐘內有效）</span>',
+                unsafe_allow_html=True,
+            )
+            return
+        except Exception:
+            pass
+    # 延遲產生：只有按下時才讀檔
+    st.download_button(label, data=path.read_bytes, file_name=path.name,
+                       mime=meta["mime"], key=key or f"dl_{meta['etag']}")
@@ -1,10 +1,11 @@
 from __future__ import annotations
 from pathlib import Path
-import base64
+import base64, re, threading
 from typing import Dict, Any
 
 TEMPLATE_DIR = Path("templates")
 TEMPLATE_DIR.mkdir(parents=True, exist_ok=True)
+BYTECODE_DIR = Path("data/cache/jinja")
 
 def fig_to_data_uri(fig) -> str:
     import io
@@ -14,15 +15,58 @@ def fig_to_data_uri(fig) -> str:
     b64 = base64.b64encode(buf.read()).decode("ascii")
     return f"data:image/png;base64,{b64}"
 
+# 共用 Jinja Environment（每個 process 一份）：
+# - FileSystemLoader + auto_reload：模板檔 mtime 變動才重新編譯
+# - FileSystemBytecodeCache：編譯結果存到磁碟，重啟 / 其他 worker 直接載入
+# - 建立時預先編譯 templates/ 下所有模板，之後每份報告只剩 render 成本
+_env = None
+_env_lock = threading.Lock()
+
+def _get_env():
+    global _env
+    if _env is None:
+        with _env_lock:
+            if _env is None:
+                from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache  # type: ignore
+                BYTECODE_DIR.mkdir(parents=True, exist_ok=True)
+                env = Environment(
+                    loader=FileSystemLoader(TEMPLATE_DIR.as_posix(), encoding="utf-8"),
+                    auto_reload=True,
+                    bytecode_cache=FileSystemBytecodeCache(BYTECODE_DIR.as_posix()),
+                )
+                _precompile(env)
+                _env = env
+    return _env
+
+def _precompile(env) -> list[str]:
+    done = []
+    for name in env.list_templates(extensions=["html", "htm", "txt"]):
+        try:
+            env.get_template(name)
+            done.append(name)
+        except Exception:
+            # 單一模板有錯不影響其他模板；render 時會再拋出
+            pass
+    return done
+
+def precompile_templates() -> list[str]:
+    """啟動時呼叫：預先編譯 templates/ 下所有模板。回傳成功的模板名稱；沒有 jinja2 時回傳空清單。"""
+    try:
+        return _precompile(_get_env())
+    except ImportError:
+        return []
+
+# fallback（沒有 jinja2 時）：一次 regex 取代所有 {{ key }}
+_VAR_RE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+def _render_simple(name: str, context: Dict[str, Any]) -> str:
+    html = (TEMPLATE_DIR / name).read_text(encoding="utf-8")
+    return _VAR_RE.sub(lambda m: str(context[m.group(1)]) if m.group(1) in context else m.group(0), html)
+
 def render_template(name: str, context: Dict[str, Any]) -> str:
-    """偏好使用 jinja2；若無 jinja2，使用簡單替換。"""
-    tpl_path = TEMPLATE_DIR / name
-    html = tpl_path.read_text(encoding="utf-8")
+    """偏好使用 jinja2（共用 Environment、已編譯）；若無 jinja2，使用簡單替換。"""
     try:
-        from jinja2 import Template  # type: ignore
-        return Template(html).render(**context)
-    except Exception:
-        # fallback：非常簡單的 {{ key }} 取代
-        for k, v in context.items():
-            html = html.replace(f"{{{{ {k} }}}}", str(v))
-        return html
+        env = _get_env()
+    except ImportError:
+        return _render_simple(name, context)
+    return env.get_template(name).render(**context)
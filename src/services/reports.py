@@ -1,7 +1,116 @@
 from docx import Document
 from pathlib import Path
+from typing import Dict, Any, Iterable, List
+import io, re, threading
 
-def generate_docx(case: dict, full: bool = False) -> str:
+from src.services.report_files import reports_dir, write_atomic
+
+# 品牌母版：設計可直接改 templates/report_master.docx（不必改程式）。
+# 內容中的 {{ key }} 會被案件欄位取代；文字以 [[full]] 開頭的段落只出現在完整版。
+# 檔案不存在時，以下方 _build_master() 產生與原版相同版型的預設母版。
+MASTER_PATH = Path("templates/report_master.docx")
+FULL_MARK = "[[full]]"
+_PH_RE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+_master: Dict[str, Any] = {}   # {"mtime": float|None, "raw": bytes}
+_master_lock = threading.Lock()
+
+
+def _out_dir() -> Path:
+    return reports_dir()
+
+
+def _fname(case: dict, full: bool) -> str:
+    return f"{case['id']}_report{'_full' if full else '_lite'}.docx"
+
+
+def _build_master():
+    doc = Document()
+    doc.add_heading("傳承診斷報告", level=1)
+    doc.add_paragraph("案件碼：{{ case_id }}")
+    doc.add_paragraph("客戶：{{ client_alias }}")
+    doc.add_paragraph("淨遺產：{{ net_estate }}")
+    doc.add_paragraph("估算稅額：{{ tax_estimate }}")
+    doc.add_paragraph("建議預留稅源：{{ liquidity_needed }}")
+    doc.add_heading(f"{FULL_MARK}完整明細與建議", level=2)
+    doc.add_paragraph(f"{FULL_MARK}• 稅則假設與參數（示意，可替換為正式版）")
+    doc.add_paragraph(f"{FULL_MARK}• 資產分類明細與負債")
+    doc.add_paragraph(f"{FULL_MARK}• 策略建議：保險、信託、遺囑、公司治理架構、稅務安排（示意）")
+    return doc
+
+
+def _load_master() -> bytes:
+    """母版檔只讀一次，以 bytes 留在記憶體（以檔案 mtime 判斷是否需要重載）"""
+    try:
+        mtime = MASTER_PATH.stat().st_mtime
+    except OSError:
+        mtime = None
+    if _master.get("raw") is not None and _master.get("mtime") == mtime:
+        return _master["raw"]
+    with _master_lock:
+        if _master.get("raw") is None or _master.get("mtime") != mtime:
+            if mtime is None:
+                buf = io.BytesIO(); _build_master().save(buf); raw = buf.getvalue()
+            else:
+                raw = MASTER_PATH.read_bytes()
+            _master.update({"mtime": mtime, "raw": raw})
+    return _master["raw"]
+
+
+def _context(case: dict) -> Dict[str, str]:
+    return {
+        "case_id": str(case["id"]),
+        "client_alias": str(case.get("client_alias") or ""),
+        "net_estate": f"{case['net_estate']:,}",
+        "tax_estimate": f"{case['tax_estimate']:,}",
+        "liquidity_needed": f"{case['liquidity_needed']:,}",
+        "advisor_name": str(case.get("advisor_name") or ""),
+        "status": str(case.get("status") or ""),
+    }
+
+
+def _iter_paragraphs(doc):
+    yield from doc.paragraphs
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                yield from cell.paragraphs
+    for section in doc.sections:
+        for part in (section.header, section.footer):
+            yield from part.paragraphs
+
+
+def _fill(doc, ctx: Dict[str, str], full: bool):
+    for p in list(_iter_paragraphs(doc)):
+        text = p.text
+        if text.startswith(FULL_MARK):
+            if not full:
+                p._element.getparent().remove(p._element)
+                continue
+            text = text[len(FULL_MARK):]
+        elif "{{" not in text:
+            continue
+        new = _PH_RE.sub(lambda m: ctx.get(m.group(1), m.group(0)), text)
+        if new == p.text:
+            continue
+        # 佔位符可能被 Word 拆成多個 run：整段寫回第一個 run，保留其格式
+        runs = p.runs
+        if runs:
+            runs[0].text = new
+            for r in runs[1:]:
+                r.text = ""
+        else:
+            p.add_run(new)
+
+
+def _from_master(case: dict, full: bool):
+    # 每份報告從記憶體中的母版 bytes 開一份新文件（不讀磁碟，只走 python-docx 公開 API）
+    doc = Document(io.BytesIO(_load_master()))
+    _fill(doc, _context(case), full)
+    return doc
+
+
+def _from_scratch(case: dict, full: bool):
     doc = Document()
     doc.add_heading("傳承診斷報告", level=1)
     doc.add_paragraph(f"案件碼：{case['id']}")
@@ -15,8 +124,30 @@ def generate_docx(case: dict, full: bool = False) -> str:
         doc.add_paragraph("• 稅則假設與參數（示意，可替換為正式版）")
         doc.add_paragraph("• 資產分類明細與負債")
         doc.add_paragraph("• 策略建議：保險、信託、遺囑、公司治理架構、稅務安排（示意）")
+    return doc
 
-    out_dir = Path("data/reports"); out_dir.mkdir(parents=True, exist_ok=True)
-    fname = f"{case['id']}_report{'_full' if full else '_lite'}.docx"
-    doc.save(out_dir / fname)
+
+def generate_docx(case: dict, full: bool = False, *, mode: str = "template") -> str:
+    """
+    產出 DOCX，回傳檔名（位於 report_files.REPORTS_DIR）。
+    mode="template"：複製記憶體中的品牌母版再填入欄位（預設）；mode="scratch"：逐段從頭建立。
+    """
+    doc = _from_master(case, full) if mode == "template" else _from_scratch(case, full)
+    fname = _fname(case, full)
+    write_atomic(_out_dir() / fname, lambda tmp: doc.save(tmp))
     return fname
+
+
+def generate_docx_batch(cases: Iterable[dict], full: bool = False) -> List[str]:
+    """
+    逐案呼叫 generate_docx：共用的只有已讀入記憶體的母版，每案仍各自解析、填入、寫檔；
+    單一案件失敗不影響其他案件（該筆回傳空字串）。
+    """
+    _load_master()
+    out: List[str] = []
+    for case in cases:
+        try:
+            out.append(generate_docx(case, full))
+        except Exception:
+            out.append("")
+    return out
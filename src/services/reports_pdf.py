@@ -1,7 +1,12 @@
 from __future__ import annotations
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-import io
+import base64, threading
+
+from src.domain.tax_rules import EstateTaxCalculator
+from src.services.report_files import reports_dir, write_atomic
 
 # 延遲匯入：WeasyPrint 非必裝，裝不到就退回 HTML
 try:
@@ -10,41 +15,136 @@ try:
 except Exception:
     HAS_WEASY = False
 
+# 圖表在獨立 process 中繪製（matplotlib 非 thread-safe），
 # 不在頂層匯入 charts，避免一出錯整檔無法 import
-def _try_import_charts():
+CHART_TIMEOUT = 20.0   # 秒：整批圖表的總時限，超過就不放該圖
+CHART_WORKERS = 4
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """長駐 process pool（spawn，避免 fork 帶到 Streamlit 的執行緒狀態）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                import multiprocessing as mp
+                _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=mp.get_context("spawn"))
+    return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _render_chart(func_name: str, args: tuple) -> bytes:
+    """在 worker process 內執行：畫圖 → PNG bytes（結果寫進共用快取）"""
+    import matplotlib
+    matplotlib.use("Agg")
+    from src.services import charts
+    return charts.render_png(func_name, *args)
+
+def _cached_charts(jobs: list[tuple[str, str, tuple]]) -> dict[str, bytes]:
+    """先查共用快取：其他 worker / 副本畫過的圖直接拿來用"""
     try:
-        # 相對匯入比絕對匯入更穩
-        from .charts import (
-            tax_breakdown_bar,
-            asset_pie,
-            savings_compare_bar,
-            simple_sankey,
-        )
-        return {
-            "tax_breakdown_bar": tax_breakdown_bar,
-            "asset_pie": asset_pie,
-            "savings_compare_bar": savings_compare_bar,
-            "simple_sankey": simple_sankey,
-        }, None
-    except Exception as e:
-        return None, e
+        from src.services.cache import cache
+        from src.services import charts
+    except Exception:
+        return {}
+    hits = {}
+    for name, fn, args in jobs:
+        png = cache.get(charts.CACHE_NS, charts.cache_key(fn, args))
+        if png is not None:
+            hits[name] = png
+    return hits
+
+def warm_chart_pool():
+    """預先啟動 worker 並載入 matplotlib，第一份報告就不用等冷啟動。"""
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(_render_chart, "asset_pie", (1.0, 1.0, 1.0)) for _ in range(CHART_WORKERS)]
+        wait(futures, timeout=CHART_TIMEOUT)
+    except Exception:
+        pass
+
+def _chart_jobs(case: dict) -> list[tuple[str, str, tuple]]:
+    """依現有欄位決定要畫哪些圖（有多少用多少）：[(檔名, charts 函式, 參數)]"""
+    jobs = []
+    net = float(case.get("net_estate") or 0.0)
+    tax = float(case.get("tax_estimate") or 0.0)
+    liq = float(case.get("liquidity_needed") or 0.0)
+    if tax and net:
+        base_wan = EstateTaxCalculator().case_taxable_base_wan(case)
+        jobs.append(("tax_breakdown.png", "tax_breakdown_bar", (base_wan,)))
+        jobs.append(("savings_compare.png", "savings_compare_bar", (tax, liq)))
+        jobs.append(("sankey.png", "simple_sankey", (net, tax, liq)))
+
+    assets_fin = float(case.get("assets_financial") or 0.0)
+    assets_re  = float(case.get("assets_realestate") or 0.0)
+    assets_biz = float(case.get("assets_business") or 0.0)
+    if any([assets_fin, assets_re, assets_biz]):
+        jobs.append(("asset_pie.png", "asset_pie", (assets_fin, assets_re, assets_biz)))
+    return jobs
+
+def render_charts(case: dict, *, timeout: float = CHART_TIMEOUT) -> dict[str, bytes]:
+    """
+    平行繪製報告所需圖表，回傳 {檔名: PNG bytes}。
+    單張失敗或逾時就略過該圖，不讓整份報告掛掉。
+    """
+    jobs = _chart_jobs(case)
+    if not jobs:
+        return {}
+    images = _cached_charts(jobs)
+    todo = [j for j in jobs if j[0] not in images]
+    if not todo:
+        return images
+    try:
+        pool = _get_pool()
+        futures = {pool.submit(_render_chart, fn, args): name for name, fn, args in todo}
+    except Exception:
+        _reset_pool()
+        return images
+
+    done, pending = wait(futures, timeout=timeout)
+    for f in pending:
+        f.cancel()
+    for f in done:
+        try:
+            images[futures[f]] = f.result()
+        except BrokenProcessPool:
+            _reset_pool()
+        except Exception:
+            pass
+    # 依原本順序輸出
+    return {name: images[name] for name, _, _ in jobs if name in images}
 
 def _ensure_outdir() -> Path:
-    out = Path("data/reports")
-    out.mkdir(parents=True, exist_ok=True)
-    return out
-
-def _png_bytes_from_fig(fig):
-    """將 matplotlib 圖存成 PNG bytes"""
-    import matplotlib.pyplot as plt
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight", dpi=160)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
-
-def _build_html(case: dict) -> str:
-    """最簡 HTML 報告（即使沒有圖也能出）"""
+    return reports_dir()
+
+CHART_TITLES = {
+    "tax_breakdown.png": "各級距稅額拆解",
+    "savings_compare.png": "稅後資金缺口對比",
+    "sankey.png": "資金流示意",
+    "asset_pie.png": "資產結構",
+}
+
+def _charts_html(images: dict[str, bytes]) -> str:
+    if not images:
+        return ""
+    cells = []
+    for name, png in images.items():
+        b64 = base64.b64encode(png).decode("ascii")
+        cells.append(
+            f'<div class="card chart"><div>{CHART_TITLES.get(name, name)}</div>'
+            f'<img src="data:image/png;base64,{b64}" alt="{name}"/></div>'
+        )
+    return '<h2>視覺化摘要</h2>\n  <div class="charts">' + "".join(cells) + "</div>"
+
+def _build_html(case: dict, images: dict[str, bytes] | None = None) -> str:
+    """最簡 HTML 報告（即使沒有圖也能出；有圖就以 data URI 內嵌）"""
     id_ = case.get("id", "")
     net = case.get("net_estate", 0.0)
     tax = case.get("tax_estimate", 0.0)
@@ -64,6 +164,8 @@ def _build_html(case: dict) -> str:
     .kv {{ display:flex; gap:16px; }}
     .kv div {{ flex:1; }}
     .num {{ font-weight:600; font-size:20px; }}
+    .charts {{ display:grid; grid-template-columns: 1fr 1fr; gap:12px; }}
+    .chart img {{ max-width:100%; display:block; margin-top:8px; }}
   </style>
 </head>
 <body>
@@ -76,6 +178,8 @@ def _build_html(case: dict) -> str:
     <div class="card"><div>建議預留稅源</div><div class="num">{liq:,.0f}</div></div>
   </div>
 
+  {_charts_html(images or {})}
+
   <p style="margin-top:24px;color:#666;font-size:12px">
     本報告為教育性質示意，不構成保險或法律建議。
   </p>
@@ -83,50 +187,48 @@ def _build_html(case: dict) -> str:
 </html>
 """
 
+def _write_pdf_inprocess(html: str, pdf_path: Path):
+    """
+    worker 不可用時在本 process 轉檔：與 worker 相同的共用樣式與 base_url，
+    先寫獨立暫存檔再 os.replace，不與（已被終止的）worker 寫同一個檔
+    """
+    from weasyprint import CSS
+    from .pdf_renderer import SHARED_CSS
+    write_atomic(pdf_path, lambda tmp: HTML(string=html, base_url=".").write_pdf(
+        tmp.as_posix(), stylesheets=[CSS(string=SHARED_CSS)]))
+
 def build_pdf_report(case: dict) -> Path:
     """
-    產生 PDF（若無 WeasyPrint 或圖表匯入失敗，會退回 HTML）。
+    產生 PDF（經由長駐 PDF worker；若無 WeasyPrint 或轉檔失敗，會退回 HTML）。
     回傳檔案路徑（.pdf 或 .html）
     """
     outdir = _ensure_outdir()
-    charts, charts_err = _try_import_charts()
 
-    # 嘗試組圖（若失敗就不放圖）
-    images = {}
-    if charts:
-        try:
-            # 依現有欄位生成圖表（有多少用多少）
-            if case.get("tax_estimate") and case.get("net_estate"):
-                fig1 = charts["tax_breakdown_bar"](
-                    float(case.get("tax_estimate")) / 10000.0  # 若此函式吃「萬」，自行調整
-                )
-                images["tax_breakdown.png"] = _png_bytes_from_fig(fig1)
-
-            assets_fin = case.get("assets_financial") or 0.0
-            assets_re  = case.get("assets_realestate") or 0.0
-            assets_biz = case.get("assets_business") or 0.0
-            if any([assets_fin, assets_re, assets_biz]):
-                fig2 = charts["asset_pie"](assets_fin, assets_re, assets_biz)
-                images["asset_pie.png"] = _png_bytes_from_fig(fig2)
-        except Exception:
-            # 圖表失敗就忽略，不要讓整個匯出掛掉
-            images = {}
+    # 平行組圖（失敗 / 逾時的圖就不放）
+    try:
+        images = render_charts(case)
+    except Exception:
+        images = {}
 
-    # 基本 HTML
-    html = _build_html(case)
+    html = _build_html(case, images)
 
     # 若能做成 PDF 就輸出 PDF；否則輸出 HTML
     case_id = case.get("id", "report")
     if HAS_WEASY:
+        pdf_path = outdir / f"{case_id}.pdf"
+        # 優先交給長駐 worker（字型、共用樣式已載入）；worker 不可用再於本 process 轉檔
+        try:
+            from .pdf_renderer import get_renderer
+            return get_renderer().render(html, pdf_path)
+        except Exception:
+            pass
         try:
-            pdf_path = outdir / f"{case_id}.pdf"
-            # 若要嵌入圖片，可在 HTML 中使用 data URI（此處為簡化版本，不嵌圖也能出）
-            HTML(string=html).write_pdf(pdf_path.as_posix())
+            _write_pdf_inprocess(html, pdf_path)
             return pdf_path
         except Exception:
             pass
 
     # 退回 HTML 檔
     html_path = outdir / f"{case_id}.html"
-    html_path.write_text(html, encoding="utf-8")
+    write_atomic(html_path, lambda tmp: tmp.write_text(html, encoding="utf-8"))
     return html_path
@@ -1,9 +1,20 @@
 from __future__ import annotations
-from typing import Dict
+from datetime import datetime
+from typing import Dict, Optional
+import hashlib
 
 from src.repos.share_repo import ShareRepo
 from src.repos.case_repo import CaseRepo
 from src.repos.event_repo import EventRepo
+from src.services.share_counters import counters
+from src.services.cache import cache
+
+CACHE_NS = "share"
+CACHE_TTL = 60  # 秒
+# 停用標記：存在共用層，各 worker 的 get_link 每次都先查（本機 LRU 沒有就會讀共用層），
+# 停用立即生效，不必等其他 worker 的快取過期；保留到所有快取過的連結都已過期
+REVOKED_NS = "share_revoked"
+REVOKED_TTL = CACHE_TTL * 2
 
 def create_share(case_id: str, advisor_id: str, *, days_valid: int = 14) -> Dict:
     case = CaseRepo.get(case_id)
@@ -13,16 +24,45 @@ def create_share(case_id: str, advisor_id: str, *, days_valid: int = 14) -> Dict
     EventRepo.log(case_id, "SHARE_CREATED", {"token": data["token"], "days_valid": days_valid})
     return data
 
-def record_open(token: str):
-    row = ShareRepo.get_by_token(token)
-    if not row: 
+def get_link(token: str) -> Optional[Dict]:
+    """以 token 取分享連結（含已過期；由 is_expired 判斷），經共用快取"""
+    if not token or cache.get(REVOKED_NS, token):
+        return None
+    row = cache.get(CACHE_NS, token)
+    if row is None:
+        row = ShareRepo.get_by_token(token, include_expired=True)
+        if row:
+            cache.set(CACHE_NS, token, row, ttl=CACHE_TTL)
+    return row
+
+def is_expired(row: Dict) -> bool:
+    return bool(row.get("expires_at")) and row["expires_at"] < datetime.utcnow().isoformat()
+
+def revoke(token: str) -> bool:
+    cache.set(REVOKED_NS, token, True, ttl=REVOKED_TTL)
+    ok = ShareRepo.delete_by_token(token)
+    cache.delete(CACHE_NS, token)
+    return ok
+
+def visitor_id() -> str | None:
+    """訪客指紋（IP + User-Agent 雜湊），用於 unique_visitors 去重；取不到回 None"""
+    try:
+        import streamlit as st
+        from src.services.auth import client_ip   # 代理附加的那一筆；最左邊的值可由用戶端偽造
+        raw = f"{client_ip() or ''}|{st.context.headers.get('User-Agent') or ''}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16] if raw != "|" else None
+    except Exception:
+        return None
+
+# 開啟 / 意向計數先累積在記憶體，由 share_counters 定期批次寫入
+def record_open(token: str, row: Dict | None = None):
+    row = row or get_link(token)
+    if not row or is_expired(row):
         return
-    ShareRepo.mark_opened(token)
-    EventRepo.log(row["case_id"], "SHARE_OPENED", {"token": token})
+    counters.record_open(token, row["case_id"], visitor_id())
 
-def record_accept(token: str):
-    row = ShareRepo.get_by_token(token)
-    if not row: 
+def record_accept(token: str, row: Dict | None = None):
+    row = row or get_link(token)
+    if not row or is_expired(row):
         return
-    ShareRepo.mark_accepted(token)
-    EventRepo.log(row["case_id"], "SHARE_ACCEPTED", {"token": token})
+    counters.record_accept(token, row["case_id"], visitor_id())
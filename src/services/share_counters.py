@@ -0,0 +1,124 @@
+"""
+分享連結互動計數：先在記憶體累積，定期以批次 UPDATE 寫回 DB。
+- opens：每個 Streamlit session 只記一次（rerun 不重複計）
+- unique_visitors：以訪客指紋（IP + User-Agent 雜湊）去重
+- accepts / last_accepted_at：意向通知；累積後立即觸發一次 flush
+- SHARE_OPENED / SHARE_ACCEPTED 事件也一起批次寫入
+"""
+
+from __future__ import annotations
+from datetime import datetime
+from typing import Dict, Any, List
+import atexit, threading
+
+from src.repos.share_repo import ShareRepo
+from src.repos.event_repo import EventRepo
+
+FLUSH_EVERY = 10.0   # 秒
+MAX_PENDING = 500    # 累積超過此數量就提早 flush
+
+
+class ShareCounters:
+    def __init__(self, *, flush_every: float = FLUSH_EVERY):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._events: List[tuple] = []
+        self._flush_every = flush_every
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _entry(self, token: str) -> Dict[str, Any]:
+        e = self._pending.get(token)
+        if e is None:
+            e = {"token": token, "opens": 0, "accepts": 0, "visitors": set(),
+                 "first_opened_at": None, "last_opened_at": None, "last_accepted_at": None}
+            self._pending[token] = e
+        return e
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="share-counters", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._flush_every)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # 寫入失敗：資料已放回佇列，下一輪再試
+                pass
+
+    def record_open(self, token: str, case_id: str, visitor: str | None = None):
+        now = datetime.utcnow().isoformat()
+        with self._lock:
+            e = self._entry(token)
+            e["opens"] += 1
+            e["first_opened_at"] = e["first_opened_at"] or now
+            e["last_opened_at"] = now
+            if visitor:
+                e["visitors"].add(visitor)
+            self._events.append((case_id, "SHARE_OPENED", {"token": token}, now))
+            big = len(self._events) >= MAX_PENDING
+        self._ensure_thread()
+        if big:
+            self._wake.set()
+
+    def record_accept(self, token: str, case_id: str, visitor: str | None = None):
+        now = datetime.utcnow().isoformat()
+        with self._lock:
+            e = self._entry(token)
+            e["accepts"] += 1
+            e["last_accepted_at"] = now
+            if visitor:
+                e["visitors"].add(visitor)
+            self._events.append((case_id, "SHARE_ACCEPTED", {"token": token}, now))
+        self._ensure_thread()
+        self._wake.set()
+
+    def flush(self) -> int:
+        """把累積的計數寫回 DB，回傳處理的 token 數"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            events, self._events = self._events, []
+        if not pending and not events:
+            return 0
+        rows = [{**e, "visitors": sorted(e["visitors"])} for e in pending.values()]
+        try:
+            ShareRepo.apply_counters(rows)
+        except Exception:
+            with self._lock:
+                for r in rows:
+                    self._merge_back(r)
+                self._events = events + self._events
+            raise
+        try:
+            EventRepo.log_many(events)
+        except Exception:
+            with self._lock:
+                self._events = events + self._events
+            raise
+        return len(rows)
+
+    def _merge_back(self, r: Dict[str, Any]):
+        e = self._entry(r["token"])
+        e["opens"] += r["opens"]
+        e["accepts"] += r["accepts"]
+        e["visitors"].update(r["visitors"])
+        e["first_opened_at"] = min(filter(None, [e["first_opened_at"], r["first_opened_at"]]), default=None)
+        e["last_opened_at"] = max(filter(None, [e["last_opened_at"], r["last_opened_at"]]), default=None)
+        e["last_accepted_at"] = max(filter(None, [e["last_accepted_at"], r["last_accepted_at"]]), default=None)
+
+
+counters = ShareCounters()
+
+
+def _flush_at_exit():
+    try:
+        counters.flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,53 @@
+"""
+過期分享連結清理：
+- 到期超過 GRACE_DAYS 的連結分批（BATCH_SIZE）搬到 shares_archive，shares 只留有效 / 近期到期的連結
+- 每批之間短暫讓出寫入鎖，避免長交易卡住線上寫入
+- 背景執行緒每 INTERVAL 秒跑一輪；多副本同時跑也安全（ON CONFLICT DO NOTHING + 同一交易刪除）
+"""
+
+from __future__ import annotations
+from datetime import datetime, timedelta
+import threading, time
+
+from src.repos.share_repo import ShareRepo
+
+GRACE_DAYS = 30
+BATCH_SIZE = 500
+MAX_BATCHES = 20      # 每輪上限，避免單輪佔用太久
+INTERVAL = 3600       # 秒
+PAUSE = 0.05          # 批次間隔（秒）
+
+_thread: threading.Thread | None = None
+_lock = threading.Lock()
+
+
+def sweep_once(*, grace_days: int = GRACE_DAYS, batch_size: int = BATCH_SIZE, max_batches: int = MAX_BATCHES) -> int:
+    """跑一輪清理，回傳封存筆數"""
+    before = (datetime.utcnow() - timedelta(days=grace_days)).isoformat()
+    total = 0
+    for _ in range(max_batches):
+        n = ShareRepo.archive_expired(before=before, limit=batch_size)
+        total += n
+        if n < batch_size:
+            break
+        time.sleep(PAUSE)
+    ShareRepo.purge_orphan_stats(limit=batch_size)
+    return total
+
+
+def _run():
+    while True:
+        try:
+            sweep_once()
+        except Exception:
+            pass
+        time.sleep(INTERVAL)
+
+
+def start():
+    """啟動背景清理（每個 process 一次）"""
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="share-sweeper", daemon=True)
+            _thread.start()
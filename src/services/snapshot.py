@@ -0,0 +1,117 @@
+"""
+分析用唯讀快照：管理頁的全表查詢 / 匯出改讀這份檔案，不和線上寫入搶同一個資料庫。
+- 以 SQLite online backup API 從獨立連線複製（WAL 下讀交易不會擋住寫入），單步完成確保一致
+- 先寫到暫存檔、記錄快照時間、轉成非 WAL 單一檔案，再 os.replace 原子替換；
+  讀取端以 mode=ro&immutable=1 開啟，不加鎖
+- 背景執行緒每 REFRESH_EVERY 秒更新一次（由管理頁第一次讀取時啟動）
+- PostgreSQL 後端：MVCC 讀取不擋寫入，不另建快照，read_df 直接查線上資料庫
+"""
+
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+import os, sqlite3, threading, time
+
+from src.db import DB_PATH, DIALECT, get_conn
+
+SNAPSHOT_PATH = Path("data/analytics.db")
+REFRESH_EVERY = 300  # 秒
+META_TBL = "_snapshot_meta"
+TZ = timezone(timedelta(hours=8))
+
+_build_lock = threading.Lock()
+_reader: dict = {}   # {"mtime_ns": int, "conn": sqlite3.Connection}
+_reader_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+
+def refresh() -> str:
+    """重建快照，回傳快照時間（UTC ISO）"""
+    get_conn()  # 確保 schema 已套用
+    with _build_lock:
+        tmp = SNAPSHOT_PATH.with_name(f"{SNAPSHOT_PATH.name}.{os.getpid()}.tmp")
+        tmp.unlink(missing_ok=True)
+        src = sqlite3.connect(DB_PATH.as_posix(), timeout=30)
+        dst = sqlite3.connect(tmp.as_posix())
+        try:
+            src.backup(dst)   # pages=-1：單一讀交易內一次複製，得到一致的時間點
+            taken_at = datetime.utcnow().isoformat()
+            dst.execute("PRAGMA journal_mode=DELETE")
+            dst.execute(f"CREATE TABLE IF NOT EXISTS {META_TBL} (taken_at TEXT)")
+            dst.execute(f"DELETE FROM {META_TBL}")
+            dst.execute(f"INSERT INTO {META_TBL} (taken_at) VALUES (?)", (taken_at,))
+            dst.commit()
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp, SNAPSHOT_PATH)
+    return taken_at
+
+
+def _run():
+    while True:
+        time.sleep(REFRESH_EVERY)
+        try:
+            refresh()
+        except Exception:
+            pass
+
+
+def _ensure_thread():
+    global _thread
+    with _build_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="analytics-snapshot", daemon=True)
+            _thread.start()
+
+
+def conn() -> sqlite3.Connection:
+    """唯讀快照連線（檔案被替換後自動改開新檔）；沒有快照時先建立一份"""
+    if not SNAPSHOT_PATH.exists():
+        refresh()
+    _ensure_thread()
+    mtime_ns = SNAPSHOT_PATH.stat().st_mtime_ns
+    with _reader_lock:
+        if _reader.get("mtime_ns") != mtime_ns:
+            # 舊連線不主動 close（可能還有其他執行緒在讀）；被替換的舊檔在最後一個參照釋放後才消失
+            c = sqlite3.connect(f"file:{SNAPSHOT_PATH.as_posix()}?mode=ro&immutable=1", uri=True,
+                                check_same_thread=False)
+            c.row_factory = sqlite3.Row
+            _reader.update({"mtime_ns": mtime_ns, "conn": c})
+        return _reader["conn"]
+
+
+def taken_at() -> Optional[str]:
+    try:
+        row = conn().execute(f"SELECT taken_at FROM {META_TBL}").fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+
+def read_df(sql: str, params=()):
+    import pandas as pd
+    if DIALECT == "postgres":
+        cur = get_conn().execute(sql, params)
+        return pd.DataFrame([dict(r) for r in cur.fetchall()],
+                            columns=[d[0] for d in cur.description or ()])
+    return pd.read_sql_query(sql, conn(), params=params)
+
+
+def freshness_caption(st):
+    """在頁面顯示快照時間與手動更新按鈕"""
+    if DIALECT == "postgres":
+        st.caption("資料來源：線上資料庫（即時資料）")
+        return
+    ts = taken_at()
+    c1, c2 = st.columns([4, 1])
+    if ts:
+        at = datetime.fromisoformat(ts)
+        age = (datetime.utcnow() - at).total_seconds()
+        local = at.replace(tzinfo=timezone.utc).astimezone(TZ)
+        c1.caption(f"資料快照時間：{local:%Y-%m-%d %H:%M:%S}（約 {int(age // 60)} 分鐘前；"
+                   f"每 {REFRESH_EVERY // 60} 分鐘自動更新，非即時資料）")
+    if c2.button("🔄 立即更新快照"):
+        refresh()
+        st.rerun()
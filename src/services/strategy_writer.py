@@ -1,47 +1,171 @@
-from __future__ import annotations
-from typing import Dict, Any, List
-
 """
 根據案件數據產出策略建議（規則型 MVP）：
 - 以「降低稅後現金壓力」與「傳承合規與治理」為核心表述
 - 不宣稱減稅；使用「預留稅源、資產隔離、受益人保障」等語彙
+
+規則是資料（RULES）：每列有代碼、短標籤、條件（特徵, 運算子, 門檻 的 AND 組合）、互斥群組與文案。
+同一 group 只取第一條成立的規則（等同 if / elif），其餘依表格順序全部評估，最多 MAX_TIPS 條。
+新增規則只要加一列；suggest（單一案件）與 suggest_batch（DataFrame 向量化）共用同一張表。
+
+可用特徵：tax、net、tax_ratio、re_share、biz_share、has_spouse、adult_children、total_assets
 """
 
+from __future__ import annotations
+from typing import Dict, Any, List
+import operator
 
-def suggest(case: Dict[str, Any], payload: Dict[str, Any]) -> List[str]:
-    tips: List[str] = []
-    net = float(case.get("net_estate", 0))
-    tax = float(case.get("tax_estimate", 0))
-    need = float(case.get("liquidity_needed", 0))
-    params = (payload.get("params") or {}) if isinstance(payload, dict) else {}
+MAX_TIPS = 5
 
+RULES: List[Dict[str, Any]] = [
     # 1) 稅後現金壓力
-    ratio = (tax / net) if net > 0 else 0
-    if tax > 0:
-        if ratio >= 0.15:
-            tips.append("建立以保單為核心的『稅源預留池』：預計覆蓋稅額的 100%–120%，避免資產拋售造成折價與時程壓力。")
-        else:
-            tips.append("規劃稅源預留池覆蓋主要稅額（80%–100%），將現金壓力移轉至預留工具。")
-
+    {"code": "RESERVE_FULL", "label": "稅額占比高", "group": "reserve", "attention": True,
+     "when": [("tax", ">", 0), ("tax_ratio", ">=", 0.15)],
+     "text": "建立以保單為核心的『稅源預留池』：預計覆蓋稅額的 100%–120%，避免資產拋售造成折價與時程壓力。"},
+    {"code": "RESERVE_MAIN", "label": "需預留稅源", "group": "reserve",
+     "when": [("tax", ">", 0)],
+     "text": "規劃稅源預留池覆蓋主要稅額（80%–100%），將現金壓力移轉至預留工具。"},
     # 2) 家庭結構
-    if bool(params.get("has_spouse")) and int(params.get("adult_children", 0)) >= 1:
-        tips.append("設計『配偶＋子女』分層受益架構：近期現金流保障配偶、長期資產逐步移轉至下一代。")
-    elif int(params.get("adult_children", 0)) >= 2:
-        tips.append("多受益人情境：設定受益比例與監管機制，避免繼承爭議。")
-
+    {"code": "FAMILY_LAYERED", "label": "配偶＋子女", "group": "family",
+     "when": [("has_spouse", "==", 1), ("adult_children", ">=", 1)],
+     "text": "設計『配偶＋子女』分層受益架構：近期現金流保障配偶、長期資產逐步移轉至下一代。"},
+    {"code": "MULTI_BENEFICIARY", "label": "多受益人", "group": "family", "attention": True,
+     "when": [("adult_children", ">=", 2)],
+     "text": "多受益人情境：設定受益比例與監管機制，避免繼承爭議。"},
     # 3) 資產結構
-    fin = float(case.get("assets_financial", 0)); re = float(case.get("assets_realestate", 0)); biz = float(case.get("assets_business", 0))
-    total = fin + re + biz
-    if total > 0:
-        if re / total >= 0.5:
-            tips.append("不動產占比較高：建議以信託或保單預留支應稅款，降低短期變現風險。")
-        if biz / total >= 0.3:
-            tips.append("公司股權較高：建議同步規劃股東協議與家族治理章程，確保經營權穩定。")
-
+    {"code": "REALESTATE_HEAVY", "label": "不動產占比高", "attention": True,
+     "when": [("re_share", ">=", 0.5)],
+     "text": "不動產占比較高：建議以信託或保單預留支應稅款，降低短期變現風險。"},
+    {"code": "BUSINESS_HEAVY", "label": "股權占比高", "attention": True,
+     "when": [("biz_share", ">=", 0.3)],
+     "text": "公司股權較高：建議同步規劃股東協議與家族治理章程，確保經營權穩定。"},
     # 4) 法遵與文件
-    tips.append("同步建置：遺囑、醫療意願/代理、保單受益人指定與信託條款，形成完整傳承文件組。")
+    {"code": "DOCS", "label": "傳承文件", "when": [],
+     "text": "同步建置：遺囑、醫療意願/代理、保單受益人指定與信託條款，形成完整傳承文件組。"},
+]
+
+TEXTS = {r["code"]: r["text"] for r in RULES}
+LABELS = {r["code"]: r["label"] for r in RULES}
+ATTENTION_CODES = [r["code"] for r in RULES if r.get("attention")]
+
+_OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+        "==": operator.eq, "!=": operator.ne}
+
+
+def _num(v) -> float:
+    try:
+        return float(v or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+CASE_FIELDS = ("net_estate", "tax_estimate", "assets_financial", "assets_realestate", "assets_business",
+               "has_spouse", "adult_children")
 
-    # 控制數量
-    if len(tips) > 5:
-        tips = tips[:5]
-    return tips
+
+def feature_row(case: Dict[str, Any]) -> Dict[str, Any]:
+    """只留下評估規則需要的欄位（批次累積大量案件時不必保留整份 payload）"""
+    payload = case.get("payload") if isinstance(case.get("payload"), dict) else {}
+    row = {k: case.get(k) for k in CASE_FIELDS}
+    row["payload"] = {"params": payload.get("params") or {}}
+    return row
+
+
+def _features(cases) -> Dict[str, Any]:
+    """cases（DataFrame）→ 特徵欄（numpy 陣列）；家庭結構優先用產生欄位，否則由 payload 取"""
+    import numpy as np
+    import pandas as pd
+
+    def col(name):
+        if name in cases.columns:
+            return pd.to_numeric(cases[name], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+        return np.zeros(len(cases))
+
+    def param(name):
+        if name in cases.columns and cases[name].notna().any():
+            return col(name)
+        if "payload" in cases.columns:
+            return np.array([
+                _num(((p or {}).get("params") or {}).get(name)) if isinstance(p, dict) else 0.0
+                for p in cases["payload"]
+            ])
+        return np.zeros(len(cases))
+
+    net, tax = col("net_estate"), col("tax_estimate")
+    fin, re_, biz = col("assets_financial"), col("assets_realestate"), col("assets_business")
+    total = fin + re_ + biz
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "tax": tax,
+            "net": net,
+            "tax_ratio": np.where(net > 0, tax / np.where(net > 0, net, 1.0), 0.0),
+            "re_share": np.where(total > 0, re_ / np.where(total > 0, total, 1.0), 0.0),
+            "biz_share": np.where(total > 0, biz / np.where(total > 0, total, 1.0), 0.0),
+            "has_spouse": (param("has_spouse") != 0).astype(float),
+            "adult_children": np.floor(param("adult_children")),
+            "total_assets": total,
+        }
+
+
+def _evaluate(feats: Dict[str, Any], n: int, rules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """規則表 × 特徵陣列 → {代碼: bool 陣列}，已套用群組互斥與 MAX_TIPS"""
+    import numpy as np
+    hits = {}
+    taken: Dict[str, Any] = {}
+    count = np.zeros(n, dtype=int)
+    for r in rules:
+        m = np.ones(n, dtype=bool)
+        for feat, op, value in r["when"]:
+            m &= _OPS[op](feats[feat], value)
+        g = r.get("group")
+        if g:
+            m &= ~taken.get(g, np.zeros(n, dtype=bool))
+            taken[g] = taken.get(g, np.zeros(n, dtype=bool)) | m
+        m &= count < MAX_TIPS
+        count += m
+        hits[r["code"]] = m
+    return hits
+
+
+def suggestion_matrix(cases, *, rules: List[Dict[str, Any]] = RULES):
+    """向量化評估規則：回傳 bool DataFrame（列 = 案件、欄 = 規則代碼）"""
+    import pandas as pd
+    return pd.DataFrame(_evaluate(_features(cases), len(cases), rules), index=cases.index)
+
+
+def suggest_batch(cases, *, rules: List[Dict[str, Any]] = RULES):
+    """每個案件的建議代碼清單（pd.Series，index 同 cases；順序同規則表）"""
+    import pandas as pd
+    mat = suggestion_matrix(cases, rules=rules)
+    codes = mat.columns.to_numpy()
+    return pd.Series([list(codes[row]) for row in mat.to_numpy()], index=cases.index, dtype=object)
+
+
+def needs_attention(cases, *, codes: List[str] | None = None):
+    """篩出命中任一關注規則的案件，附上 attention（代碼清單）欄"""
+    codes = codes or ATTENTION_CODES
+    mat = suggestion_matrix(cases)[codes]
+    flagged = mat.any(axis=1)
+    out = cases.loc[flagged].copy()
+    out["attention"] = [list(mat.columns[row]) for row in mat.loc[flagged].to_numpy()]
+    return out
+
+
+def suggest(case: Dict[str, Any], payload: Dict[str, Any]) -> List[str]:
+    """單一案件：同一張規則表，以長度 1 的陣列評估（不經 DataFrame）"""
+    import numpy as np
+    params = (payload.get("params") or {}) if isinstance(payload, dict) else {}
+    net, tax = _num(case.get("net_estate")), _num(case.get("tax_estimate"))
+    fin, re_, biz = (_num(case.get(k)) for k in ("assets_financial", "assets_realestate", "assets_business"))
+    total = fin + re_ + biz
+    feats = {k: np.array([v], dtype=float) for k, v in {
+        "tax": tax,
+        "net": net,
+        "tax_ratio": tax / net if net > 0 else 0.0,
+        "re_share": re_ / total if total > 0 else 0.0,
+        "biz_share": biz / total if total > 0 else 0.0,
+        "has_spouse": float(bool(params.get("has_spouse"))),
+        "adult_children": float(int(_num(params.get("adult_children")))),
+        "total_assets": total,
+    }.items()}
+    hits = _evaluate(feats, 1, RULES)
+    return [r["text"] for r in RULES if hits[r["code"]][0]]
@@ -0,0 +1,458 @@
+"""
+PostgreSQL 後端（多副本部署）：
+- psycopg 3 + psycopg_pool 連線池；get_conn() 回傳的 PgDatabase 介面與 sqlite3.Connection 相同子集
+  （execute / executemany / commit / rollback / with 交易），repo 不需要知道後端
+- with 區塊內：同一執行緒借用同一條連線，離開時 commit / rollback 並歸還
+- with 區塊外：每次 execute 借一條連線、取回結果後立即 commit 歸還（之後的 commit() 為 no-op）
+- stream()：server-side（named）cursor 逐批讀取，大量匯出不把整張表載入記憶體
+- schema：PG_MIGRATIONS 以 schema_version 表記錄版本，advisory lock 避免多副本同時升級
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional
+import itertools, re, threading
+
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool
+    HAS_PG = True
+except Exception:  # 未安裝時只有在設定 PostgreSQL URL 才會報錯
+    psycopg = None
+    ConnectionPool = None
+    HAS_PG = False
+
+
+# ---- SQL 參數轉換：? → %s，:name → %(name)s，字面 % → %% ----
+_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|::|:[A-Za-z_]\w*|\?|%")
+_sql_cache: Dict[str, str] = {}
+
+
+def translate(sql: str) -> str:
+    out = _sql_cache.get(sql)
+    if out is not None:
+        return out
+
+    def _sub(m):
+        tok = m.group(0)
+        if tok[0] in "'\"":
+            return tok.replace("%", "%%")   # psycopg 連字串常值內的 % 也會解析
+        if tok == "::":
+            return tok
+        if tok == "?":
+            return "%s"
+        if tok == "%":
+            return "%%"
+        return f"%({tok[1:]})s"
+
+    out = _TOKEN_RE.sub(_sub, sql)
+    if len(_sql_cache) < 2048:
+        _sql_cache[sql] = out
+    return out
+
+
+class Row(dict):
+    """與 sqlite3.Row 相容：row["col"] 與 row[0] 都可用，dict(row) 取得欄位字典"""
+    __slots__ = ("_values",)
+
+    def __init__(self, names, values):
+        super().__init__(zip(names, values))
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._values[key]
+        return super().__getitem__(key)
+
+
+def _row_factory(cursor):
+    names = [c.name for c in (cursor.description or [])]
+    return lambda values: Row(names, values)
+
+
+class _Result:
+    """with 區塊外的查詢結果（已取回，連線已歸還）"""
+
+    def __init__(self, db, rows: List[Row], rowcount: int, description):
+        self.connection = db
+        self._rows = rows
+        self._pos = 0
+        self.rowcount = rowcount
+        self.description = description
+        self.lastrowid = None  # 請改用 INSERT ... RETURNING id
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        row = self._rows[self._pos]
+        self._pos += 1
+        return row
+
+    def fetchmany(self, size: int = 1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class _LiveCursor:
+    """with 區塊內的 cursor（連線由本執行緒持有到區塊結束）"""
+
+    def __init__(self, db, cur):
+        self.connection = db
+        self._cur = cur
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def fetchone(self):
+        return self._cur.fetchone() if self._cur.description else None
+
+    def fetchmany(self, size: int = 1):
+        return self._cur.fetchmany(size) if self._cur.description else []
+
+    def fetchall(self):
+        return self._cur.fetchall() if self._cur.description else []
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class PgDatabase:
+    def __init__(self, url: str, *, min_size: int = 1, max_size: int = 10):
+        if not HAS_PG:
+            raise RuntimeError("使用 PostgreSQL 需要安裝 psycopg[binary] 與 psycopg_pool")
+        self.pool = ConnectionPool(url, min_size=min_size, max_size=max_size,
+                                   kwargs={"row_factory": _row_factory}, open=True)
+        self._local = threading.local()
+        self._names = itertools.count()
+
+    # ---- 交易 ----
+    def __enter__(self):
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            self._local.conn = self.pool.getconn()
+        self._local.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn = self._local.conn
+            self._local.conn = None
+            try:
+                if exc_type is None:
+                    conn.commit()
+                else:
+                    conn.rollback()
+            finally:
+                self.pool.putconn(conn)
+        return False
+
+    def _held(self):
+        return getattr(self._local, "conn", None) if getattr(self._local, "depth", 0) else None
+
+    def commit(self):
+        conn = self._held()
+        if conn is not None:
+            conn.commit()
+
+    def rollback(self):
+        conn = self._held()
+        if conn is not None:
+            conn.rollback()
+
+    # ---- 查詢 ----
+    def execute(self, sql: str, params: Any = None):
+        sql = translate(sql)
+        params = () if params is None else params   # 空參數也要讓 psycopg 處理 %% 跳脫
+        conn = self._held()
+        if conn is not None:
+            return _LiveCursor(self, conn.execute(sql, params))
+        with self.pool.connection() as conn:   # 離開時 commit 並歸還
+            cur = conn.execute(sql, params)
+            rows = cur.fetchall() if cur.description else []
+            return _Result(self, rows, cur.rowcount, cur.description)
+
+    def executemany(self, sql: str, seq):
+        sql = translate(sql)
+        seq = list(seq)
+        conn = self._held()
+        if conn is not None:
+            cur = conn.cursor()
+            cur.executemany(sql, seq)
+            return _LiveCursor(self, cur)
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(sql, seq)
+            return _Result(self, [], cur.rowcount, None)
+
+    def stream(self, sql: str, params: Any = None, *, batch: int = 500) -> Iterator[Row]:
+        """server-side cursor：每次只從伺服器取 batch 筆"""
+        sql = translate(sql)
+        params = () if params is None else params
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                with conn.cursor(name=f"stream_{next(self._names)}") as cur:
+                    cur.itersize = batch
+                    cur.execute(sql, params)
+                    yield from cur
+
+    def close(self):
+        self.pool.close()
+
+
+# ---- schema ----
+PG_MIGRATIONS: List[str] = [
+    # 1. 基線（對應 src.migrations 的 SQLite 版本 1–4；全文檢索改用 tsvector + GIN）
+    """
+    CREATE TABLE IF NOT EXISTS cases (
+      id TEXT PRIMARY KEY,
+      advisor_id TEXT,
+      advisor_name TEXT,
+      client_alias TEXT,
+      assets_financial DOUBLE PRECISION,
+      assets_realestate DOUBLE PRECISION,
+      assets_business DOUBLE PRECISION,
+      liabilities DOUBLE PRECISION,
+      net_estate DOUBLE PRECISION,
+      tax_estimate DOUBLE PRECISION,
+      liquidity_needed DOUBLE PRECISION,
+      status TEXT DEFAULT 'Prospect',
+      payload_json TEXT,
+      created_at TEXT,
+      updated_at TEXT,
+      rules_version TEXT GENERATED ALWAYS AS (payload_json::jsonb ->> 'rules_version') STORED,
+      taxable_base_wan DOUBLE PRECISION
+        GENERATED ALWAYS AS ((payload_json::jsonb ->> 'taxable_base_wan')::double precision) STORED,
+      has_spouse INTEGER
+        GENERATED ALWAYS AS (((payload_json::jsonb -> 'params' ->> 'has_spouse')::boolean)::int) STORED,
+      adult_children INTEGER
+        GENERATED ALWAYS AS ((payload_json::jsonb -> 'params' ->> 'adult_children')::int) STORED,
+      search_tsv tsvector GENERATED ALWAYS AS (to_tsvector('simple'::regconfig,
+        coalesce(id, '') || ' ' || coalesce(client_alias, '') || ' ' || coalesce(advisor_name, '') || ' ' ||
+        coalesce(payload_json, ''))) STORED
+    );
+
+    CREATE TABLE IF NOT EXISTS bookings (
+      id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+      case_id TEXT, name TEXT, phone TEXT, email TEXT, timeslot TEXT, created_at TEXT,
+      status TEXT DEFAULT 'Pending'
+    );
+
+    CREATE TABLE IF NOT EXISTS booking_slots (
+      id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+      advisor_id TEXT NOT NULL,
+      starts_at TEXT NOT NULL,
+      ends_at TEXT,
+      capacity INTEGER NOT NULL DEFAULT 1,
+      booked INTEGER NOT NULL DEFAULT 0,
+      UNIQUE (advisor_id, starts_at),
+      CHECK (booked >= 0 AND booked <= capacity)
+    );
+
+    CREATE TABLE IF NOT EXISTS slot_reservations (
+      slot_id BIGINT NOT NULL, booking_id BIGINT NOT NULL, created_at TEXT,
+      PRIMARY KEY (slot_id, booking_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS events (
+      id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+      case_id TEXT, event TEXT, meta TEXT, created_at TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS shares (
+      id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+      token TEXT UNIQUE, case_id TEXT, advisor_id TEXT,
+      created_at TEXT, expires_at TEXT, opened_at TEXT, accepted_at TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS shares_archive (
+      id BIGINT PRIMARY KEY,
+      token TEXT, case_id TEXT, advisor_id TEXT,
+      created_at TEXT, expires_at TEXT, opened_at TEXT, accepted_at TEXT,
+      opens INTEGER DEFAULT 0, unique_visitors INTEGER DEFAULT 0, accepts INTEGER DEFAULT 0,
+      archived_at TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS share_stats (
+      token TEXT PRIMARY KEY,
+      opens INTEGER DEFAULT 0, unique_visitors INTEGER DEFAULT 0,
+      first_opened_at TEXT, last_opened_at TEXT,
+      accepts INTEGER DEFAULT 0, last_accepted_at TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS share_visitors (
+      token TEXT, visitor TEXT, first_seen TEXT,
+      PRIMARY KEY (token, visitor)
+    );
+
+    CREATE TABLE IF NOT EXISTS wallets (
+      advisor_id TEXT PRIMARY KEY, balance INTEGER DEFAULT 0, updated_at TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS credit_txns (
+      id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+      advisor_id TEXT, change INTEGER, reason TEXT, meta TEXT, created_at TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS otp_codes (
+      email TEXT PRIMARY KEY, code_hash TEXT, attempts INTEGER DEFAULT 0,
+      created_at DOUBLE PRECISION, expires_at DOUBLE PRECISION
+    );
+
+    CREATE TABLE IF NOT EXISTS auth_throttle (
+      key TEXT PRIMARY KEY, tokens DOUBLE PRECISION, updated_at DOUBLE PRECISION,
+      locked_until DOUBLE PRECISION DEFAULT 0, expires_at DOUBLE PRECISION
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_otp_expiry ON otp_codes(expires_at);
+    CREATE INDEX IF NOT EXISTS idx_throttle_expiry ON auth_throttle(expires_at);
+    CREATE INDEX IF NOT EXISTS idx_slots_open ON booking_slots(starts_at) WHERE booked < capacity;
+    CREATE INDEX IF NOT EXISTS idx_slots_open_adv ON booking_slots(advisor_id, starts_at) WHERE booked < capacity;
+    CREATE INDEX IF NOT EXISTS idx_slot_res_booking ON slot_reservations(booking_id);
+    CREATE INDEX IF NOT EXISTS idx_events_case ON events(case_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_shares_adv ON shares(advisor_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_shares_expiry ON shares(expires_at);
+    CREATE INDEX IF NOT EXISTS idx_shares_archive_adv ON shares_archive(advisor_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_txns_adv ON credit_txns(advisor_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_cases_upd ON cases(updated_at, id);
+    CREATE INDEX IF NOT EXISTS idx_cases_adv_upd ON cases(advisor_id, updated_at, id);
+    CREATE INDEX IF NOT EXISTS idx_cases_adv_status_upd ON cases(advisor_id, status, updated_at, id);
+    CREATE INDEX IF NOT EXISTS idx_cases_status_upd ON cases(status, updated_at, id);
+    CREATE INDEX IF NOT EXISTS idx_cases_rules ON cases(rules_version, has_spouse);
+    CREATE INDEX IF NOT EXISTS idx_cases_taxbase ON cases(taxable_base_wan);
+    CREATE INDEX IF NOT EXISTS idx_cases_search ON cases USING GIN (search_tsv);
+    CREATE INDEX IF NOT EXISTS idx_bookings_created ON bookings(created_at);
+    CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_bookings_case ON bookings(case_id, created_at);
+    """,
+    # 2. 轉換漏斗（對應 SQLite 版本 5）
+    """
+    CREATE TABLE IF NOT EXISTS case_funnel (
+      case_id TEXT PRIMARY KEY,
+      created_at TEXT, shared_at TEXT, opened_at TEXT, accepted_at TEXT, booked_at TEXT, unlocked_at TEXT,
+      updated_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_funnel_created ON case_funnel(created_at);
+    CREATE TABLE IF NOT EXISTS funnel_state (
+      name TEXT PRIMARY KEY,
+      last_event_id BIGINT NOT NULL DEFAULT 0,
+      updated_at TEXT
+    );
+    """,
+    # 3. 分享連結 keyset 索引帶上 id（對應 SQLite 版本 6）
+    """
+    DROP INDEX IF EXISTS idx_shares_adv;
+    CREATE INDEX idx_shares_adv ON shares(advisor_id, created_at, id);
+    """,
+    # 4. 預約 keyset 索引帶上 id（對應 SQLite 版本 7）
+    """
+    DROP INDEX IF EXISTS idx_bookings_created;
+    DROP INDEX IF EXISTS idx_bookings_status;
+    DROP INDEX IF EXISTS idx_bookings_case;
+    CREATE INDEX idx_bookings_created ON bookings(created_at, id);
+    CREATE INDEX idx_bookings_status ON bookings(status, created_at, id);
+    CREATE INDEX idx_bookings_case ON bookings(case_id, created_at, id);
+    """,
+    # 5. 取消預約時保留佔位列（對應 SQLite 版本 8）
+    """
+    ALTER TABLE slot_reservations ADD COLUMN IF NOT EXISTS released_at TEXT;
+    """,
+    # 6. payload_json 產生欄位容忍非法 JSON（與 SQLite 的 json_valid 判斷相同：取不到就是 NULL，不讓寫入失敗）
+    """
+    CREATE OR REPLACE FUNCTION safe_jsonb(t text) RETURNS jsonb LANGUAGE plpgsql IMMUTABLE AS $fn$
+    BEGIN
+      RETURN t::jsonb;
+    EXCEPTION WHEN others THEN
+      RETURN NULL;
+    END
+    $fn$;
+    -- 數值 / 布林轉成數字（同 json_extract：true → 1），其他型別為 NULL
+    CREATE OR REPLACE FUNCTION jsonb_number(v jsonb) RETURNS double precision LANGUAGE sql IMMUTABLE AS $fn$
+      SELECT CASE jsonb_typeof(v)
+               WHEN 'number' THEN (v #>> '{}')::double precision
+               WHEN 'boolean' THEN CASE WHEN v = 'true'::jsonb THEN 1 ELSE 0 END
+             END
+    $fn$;
+    ALTER TABLE cases
+      DROP COLUMN IF EXISTS rules_version,
+      DROP COLUMN IF EXISTS taxable_base_wan,
+      DROP COLUMN IF EXISTS has_spouse,
+      DROP COLUMN IF EXISTS adult_children;
+    ALTER TABLE cases
+      ADD COLUMN rules_version TEXT
+        GENERATED ALWAYS AS (safe_jsonb(payload_json) ->> 'rules_version') STORED,
+      ADD COLUMN taxable_base_wan DOUBLE PRECISION
+        GENERATED ALWAYS AS (jsonb_number(safe_jsonb(payload_json) -> 'taxable_base_wan')) STORED,
+      ADD COLUMN has_spouse INTEGER
+        GENERATED ALWAYS AS (jsonb_number(safe_jsonb(payload_json) #> '{params,has_spouse}')::int) STORED,
+      ADD COLUMN adult_children INTEGER
+        GENERATED ALWAYS AS (jsonb_number(safe_jsonb(payload_json) #> '{params,adult_children}')::int) STORED;
+    CREATE INDEX IF NOT EXISTS idx_cases_rules ON cases(rules_version, has_spouse);
+    CREATE INDEX IF NOT EXISTS idx_cases_taxbase ON cases(taxable_base_wan);
+    """,
+    # 7. 案件子字串搜尋（對應 SQLite 版本 9、11）：'simple' 斷詞把「王小明」存成一個詞元，「小明」查不到。
+    #    search_text 為案件碼、客戶代稱、顧問姓名與 payload 內所有字串值；以 ILIKE 做子字串比對，
+    #    有 pg_trgm 時建 GIN trigram 索引（沒有也能查，只是逐列比對）
+    """
+    ALTER TABLE cases ADD COLUMN IF NOT EXISTS search_text TEXT GENERATED ALWAYS AS (
+      coalesce(id, '') || ' ' || coalesce(client_alias, '') || ' ' || coalesce(advisor_name, '') || ' ' ||
+      coalesce(jsonb_path_query_array(safe_jsonb(payload_json), 'strict $.** ? (@.type() == "string")')::text, '')
+    ) STORED;
+    DO $do$
+    BEGIN
+      IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS idx_cases_search_trgm ON cases USING GIN (search_text gin_trgm_ops);
+      ELSE
+        RAISE NOTICE 'pg_trgm 不可用：案件搜尋改為逐列比對';
+      END IF;
+    EXCEPTION WHEN insufficient_privilege THEN
+      RAISE NOTICE '無權限建立 pg_trgm：案件搜尋改為逐列比對';
+    END
+    $do$;
+    """,
+]
+
+_LOCK_KEY = 0x6E7374  # pg_advisory_xact_lock 的固定 key
+
+
+def migrate(db: PgDatabase) -> int:
+    """schema 已是最新時只執行一次 SELECT；否則在 advisory lock 下依序套用"""
+    latest = len(PG_MIGRATIONS)
+    with db.pool.connection() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        row = conn.execute("SELECT max(version) FROM schema_version").fetchone()
+        if (row[0] or 0) >= latest:
+            return 0
+    applied = 0
+    with db.pool.connection() as conn:
+        with conn.transaction():
+            conn.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+            current = conn.execute("SELECT max(version) FROM schema_version").fetchone()[0] or 0
+            for version, sql in enumerate(PG_MIGRATIONS, start=1):
+                if version <= current:
+                    continue
+                conn.execute(sql)
+                conn.execute("INSERT INTO schema_version (version) VALUES (%s)", (version,))
+                applied += 1
+    return applied
+
+
+def connect(url: str, *, min_size: int = 1, max_size: int = 10) -> PgDatabase:
+    db = PgDatabase(url, min_size=min_size, max_size=max_size)
+    migrate(db)
+    return db
@@ -0,0 +1,70 @@
+"""SQLite 後端：單一共用連線（check_same_thread=False），schema 由 src.migrations 管理"""
+
+from __future__ import annotations
+from typing import Iterator
+import sqlite3
+
+from src import migrations
+
+RECLAIM_STEP = 1_000   # incremental_vacuum 每步截掉的頁數；步與步之間放開寫入鎖
+
+
+def _greatest(*args):
+    vals = [a for a in args if a is not None]
+    return max(vals) if vals else None
+
+
+def _least(*args):
+    vals = [a for a in args if a is not None]
+    return min(vals) if vals else None
+
+
+def connect(path: str) -> sqlite3.Connection:
+    # timeout：背景建索引期間寫入可能需要等鎖
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # 與 PostgreSQL 相同語意（忽略 NULL），讓 repo 的 SQL 兩邊通用
+    conn.create_function("greatest", -1, _greatest, deterministic=True)
+    conn.create_function("least", -1, _least, deterministic=True)
+    migrations.register(conn)         # schema 的 trigger 用到的函式
+    # 只對新建的資料庫生效；既有檔案由 migration 10 以 VACUUM 切換（見 src/migrations.py）。
+    # 刪除大量資料後可用 reclaim 歸還空間
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    migrations.migrate(conn)          # schema 已是最新時只讀一次 user_version
+    migrations.start_deferred(conn, path)
+    return conn
+
+
+def stream(conn: sqlite3.Connection, sql: str, args=(), *, batch: int = 500) -> Iterator[sqlite3.Row]:
+    cur = conn.execute(sql, args)
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            break
+        yield from rows
+
+
+def reclaim(path: str, *, max_pages: int = 10_000) -> int:
+    """
+    大量刪除後歸還空間，回傳釋放的頁數。用獨立的 autocommit 連線，不碰共用連線上進行中的交易。
+    auto_vacuum=INCREMENTAL 時每步截掉 RECLAIM_STEP 頁檔尾空頁，否則空頁留在 freelist
+    給之後的寫入重用；最後截斷 WAL 檔。
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        freed = 0
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            while free and freed < max_pages:
+                n = min(free, RECLAIM_STEP, max_pages - freed)
+                # 每釋放一頁 step 一次：fetchall 才會跑完整步
+                conn.execute(f"PRAGMA incremental_vacuum({int(n)})").fetchall()
+                left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if left >= free:
+                    break
+                freed += free - left
+                free = left
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return freed
+    finally:
+        conn.close()
@@ -0,0 +1,57 @@
+"""
+repo 測試共用設定：每個測試以 backend fixture 在 SQLite 與 PostgreSQL 各跑一次。
+- SQLite：每個測試一個暫存檔（完整跑過 src.migrations）
+- PostgreSQL：由環境變數 TEST_DATABASE_URL 指定（會清空資料表，請用專用的測試資料庫），例如
+    docker run --rm -e POSTGRES_PASSWORD=pw -p 5432:5432 postgres:16
+    TEST_DATABASE_URL=postgresql://postgres:pw@localhost:5432/postgres python -m pytest -q
+  未設定或未安裝 psycopg 時略過
+"""
+
+import os, sys, pathlib
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src import db
+from src.repos import case_repo
+
+
+@pytest.fixture(scope="session")
+def pg_database():
+    url = os.environ.get("TEST_DATABASE_URL", "")
+    if not url.startswith(("postgres://", "postgresql://")):
+        pytest.skip("未設定 TEST_DATABASE_URL")
+    from src.storage import postgres
+    if not postgres.HAS_PG:
+        pytest.skip("未安裝 psycopg / psycopg_pool")
+    pg = postgres.connect(url, min_size=1, max_size=8)
+    yield pg
+    pg.close()
+
+
+def _truncate_pg(pg):
+    rows = pg.execute(
+        "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename <> 'schema_version'"
+    ).fetchall()
+    if rows:
+        pg.execute("TRUNCATE " + ", ".join(r["tablename"] for r in rows) + " RESTART IDENTITY CASCADE")
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def backend(request, tmp_path, monkeypatch):
+    """把 src.db 的共用連線換成本測試的資料庫，回傳後端名稱"""
+    if request.param == "sqlite":
+        from src.storage import sqlite
+        conn = sqlite.connect((tmp_path / "app.db").as_posix())
+    else:
+        conn = request.getfixturevalue("pg_database")
+        _truncate_pg(conn)
+    monkeypatch.setattr(db, "_conn", conn)
+    monkeypatch.setattr(db, "DIALECT", request.param)
+    monkeypatch.setattr(case_repo, "DIALECT", request.param)
+    yield request.param
+    if request.param == "sqlite":
+        conn.close()
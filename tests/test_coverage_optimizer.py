@@ -0,0 +1,53 @@
+"""coverage_optimizer：與暴力列舉所有整數組合的結果比對"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from src.domain.tax_rules import TaxConstants
+from src.services import coverage_optimizer
+from src.services.coverage_optimizer import _normalize, evaluate, optimize
+
+
+def _brute_force(options, *, base_wan, target_gap, reduce, c):
+    opts = _normalize(options)
+    grid = np.array(list(itertools.product(
+        *[range(int(lo), int(hi) + 1) for lo, hi in zip(opts["min_units"], opts["max_units"])]
+    )), dtype=float)
+    res = evaluate(grid, opts, base_wan=base_wan, buffer=c.BUFFER_MULTIPLIER, c=c, premiums_reduce_estate=reduce)
+    ok = res["gap"] <= target_gap + 1e-6
+    return float(res["premium"][ok].min()) if ok.any() else None
+
+
+def _random_options(rng, n):
+    return [{"name": f"o{i}", "premium": int(rng.integers(1, 20)) * 100_000,
+             "sum_assured": int(rng.integers(1, 40)) * 100_000,
+             "min_units": int(rng.integers(0, 2)), "max_units": int(rng.integers(2, 8))} for i in range(n)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_optimize_matches_brute_force(seed):
+    c = TaxConstants()
+    rng = np.random.default_rng(seed)
+    for _ in range(100):
+        options = _random_options(rng, 3)
+        base_wan = float(rng.uniform(3_000, 40_000))
+        target_gap = float(rng.choice([0, 1_000_000, 5_000_000]))
+        reduce = bool(rng.integers(0, 2))
+        res = optimize(options, base_wan=base_wan, target_gap=target_gap, constants=c,
+                       premiums_reduce_estate=reduce)
+        cheapest = _brute_force(options, base_wan=base_wan, target_gap=target_gap, reduce=reduce, c=c)
+        assert res["exact"]
+        assert res["feasible"] == (cheapest is not None)
+        if cheapest is not None:
+            assert res["premium"] == pytest.approx(cheapest)
+            assert res["gap"] <= target_gap + 1e-6
+
+
+def test_optimize_falls_back_to_heuristic_over_budget(monkeypatch):
+    monkeypatch.setattr(coverage_optimizer, "SEARCH_BUDGET", 10)
+    options = _random_options(np.random.default_rng(7), 4)
+    res = optimize(options, base_wan=8_000.0, target_gap=1_000_000)
+    assert not res["exact"]
+    assert res["feasible"] and res["gap"] <= 1_000_000 + 1e-6
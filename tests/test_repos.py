@@ -0,0 +1,313 @@
+"""各 repo 在 SQLite / PostgreSQL 兩種後端上的行為（backend fixture 見 conftest.py）"""
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import db
+from src.repos.booking_repo import BookingRepo
+from src.repos.case_repo import CaseRepo
+from src.repos.event_repo import EventRepo
+from src.repos.funnel_repo import FunnelRepo
+from src.repos.otp_repo import OtpRepo
+from src.repos.share_repo import ShareRepo
+from src.repos.slot_repo import SlotRepo
+from src.repos.throttle_repo import ThrottleRepo
+
+pytestmark = pytest.mark.usefixtures("backend")
+
+
+def _case(case_id, advisor_id="a1", **kw):
+    payload = kw.pop("payload", {"rules_version": "v1", "taxable_base_wan": 100.0,
+                                 "params": {"has_spouse": True, "adult_children": 2}})
+    CaseRepo.upsert({"id": case_id, "advisor_id": advisor_id, "advisor_name": "林顧問",
+                     "client_alias": "未命名", "payload": payload, **kw})
+
+
+def _future_slot(days=2, hour=10):
+    return (datetime.now() + timedelta(days=days)).replace(hour=hour, minute=0).isoformat(timespec="minutes")
+
+
+def _pages(fetch):
+    """keyset 分頁逐頁取完，回傳所有 id"""
+    ids, cursor = [], None
+    while True:
+        rows, cursor = fetch(cursor)
+        ids += [r["id"] for r in rows]
+        if not cursor:
+            return ids
+
+
+# ---------- CaseRepo ----------
+
+def test_case_upsert_get_and_status():
+    _case("C1", client_alias="王小明")
+    _case("C1", client_alias="王大明", net_estate=123.0)
+    row = CaseRepo.get("C1")
+    assert row["client_alias"] == "王大明" and row["net_estate"] == 123.0
+    assert row["payload"]["params"]["adult_children"] == 2
+    CaseRepo.update_status("C1", "Won")
+    assert CaseRepo.get("C1")["status"] == "Won"
+    assert CaseRepo.get("missing") is None
+
+
+def test_case_keyset_lists():
+    for i in range(7):
+        _case(f"C{i}", advisor_id="a1" if i % 2 else "a2", status="Won" if i < 3 else "Prospect")
+    latest = CaseRepo.list_latest(limit=100)
+    assert [r["id"] for r in latest] == [f"C{i}" for i in reversed(range(7))]
+
+    def by_adv(after):
+        rows = CaseRepo.list_by_advisor("a1", limit=2, after=after)
+        return rows, (CaseRepo.cursor(rows[-1]) if len(rows) == 2 else None)
+    assert _pages(by_adv) == ["C5", "C3", "C1"]
+    assert [r["id"] for r in CaseRepo.list_by_status("Won")] == ["C2", "C1", "C0"]
+
+    since = CaseRepo.get("C4")["updated_at"]
+    first = CaseRepo.list_updated_since(since, limit=2)
+    rest = CaseRepo.list_updated_since(since, limit=10, after=CaseRepo.cursor(first[-1]))
+    assert [r["id"] for r in first + rest] == ["C4", "C5", "C6"]
+    assert {r["id"] for r in CaseRepo.iter_cases(advisor_id="a2", batch=2)} == {"C0", "C2", "C4", "C6"}
+
+
+def test_case_payload_columns():
+    _case("C1")
+    _case("C2", payload={"rules_version": "v1", "taxable_base_wan": 900.0, "params": {"has_spouse": False}})
+    _case("C3", payload={"rules_version": "v2"})
+    assert [r["id"] for r in CaseRepo.find_by_params(rules_version="v1", has_spouse=True)] == ["C1"]
+    assert [r["id"] for r in CaseRepo.find_by_params(min_taxable_base_wan=500)] == ["C2"]
+    stats = {(r["rules_version"], r["has_spouse"]): r["cases"] for r in CaseRepo.stats_by_rules()}
+    assert stats == {("v1", 0): 1, ("v1", 1): 1, ("v2", None): 1}
+
+
+def test_case_invalid_payload_json_does_not_break_writes():
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO cases (id, advisor_id, payload_json) VALUES ('BAD', 'a1', '{not json')")
+        conn.execute(
+            "INSERT INTO cases (id, advisor_id, payload_json) VALUES "
+            "('ODD', 'a1', '{\"taxable_base_wan\": \"abc\", \"params\": {\"adult_children\": 3}}')"
+        )
+    bad = CaseRepo.get("BAD")
+    assert bad["payload"] == {} and bad["rules_version"] is None and bad["taxable_base_wan"] is None
+    assert CaseRepo.get("ODD")["adult_children"] == 3
+
+
+def test_case_search(backend):
+    _case("AB12", client_alias="王小明", payload={"note": "家族企業接班"})
+    _case("CD34", advisor_id="a2", client_alias="Alice")
+    assert [r["id"] for r in CaseRepo.search("王小明")] == ["AB12"]
+    assert [r["id"] for r in CaseRepo.search("alice")] == ["CD34"]
+    assert CaseRepo.search("王小明", advisor_id="a2") == []
+    assert CaseRepo.search("   ") == []
+    # 中文子字串（SQLite：trigram / case_grams；PostgreSQL：search_text ILIKE），兩邊語意一致
+    assert [r["id"] for r in CaseRepo.search("小明")] == ["AB12"]
+    assert [r["id"] for r in CaseRepo.search("企業")] == ["AB12"]
+    assert [r["id"] for r in CaseRepo.search("明")] == ["AB12"]
+    assert [r["id"] for r in CaseRepo.search("王 家族企業")] == ["AB12"]
+    assert CaseRepo.search("明 Alice") == []
+    # 只有短詞時依更新時間（新的在前）
+    _case("EF56", client_alias="李小明")
+    assert [r["id"] for r in CaseRepo.search("小明")] == ["EF56", "AB12"]
+    _case("AB12", client_alias="王小明", payload={"note": "家族企業接班"})
+    assert [r["id"] for r in CaseRepo.search("小明")] == ["AB12", "EF56"]
+
+
+# ---------- EventRepo / FunnelRepo ----------
+
+def test_events_log_head_and_delete():
+    EventRepo.log("C1", "CASE_CREATED", {"source": "test"})
+    EventRepo.log_many([("C1", "SHARE_CREATED", None, "2026-01-02T00:00:00"),
+                        ("C2", "CASE_CREATED", {"x": 1}, "2026-01-03T00:00:00")])
+    rows = EventRepo.head(limit=10)
+    assert [r["event"] for r in rows] == ["CASE_CREATED", "SHARE_CREATED", "CASE_CREATED"]
+    assert EventRepo.head(after_id=rows[1]["id"])[0]["case_id"] == "C2"
+    assert EventRepo.delete_range(rows[0]["id"], rows[1]["id"]) == 2
+    assert [r["case_id"] for r in EventRepo.head()] == ["C2"]
+
+
+def test_reclaim_space_after_delete(backend):
+    if backend != "sqlite":
+        pytest.skip("PostgreSQL 交給 autovacuum")
+    EventRepo.log_many([("C1", "CASE_CREATED", {"pad": "x" * 2000}, "2026-01-01T00:00:00")] * 500)
+    rows = EventRepo.head(limit=1000)
+    EventRepo.delete_range(rows[0]["id"], rows[-1]["id"])
+    conn = db.get_conn()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert db.reclaim_space() > 0
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_funnel_apply_range_is_idempotent():
+    _case("C1")
+    EventRepo.log_many([
+        ("C1", "CASE_CREATED", None, "2026-01-01T00:00:00"),
+        ("C1", "SHARE_CREATED", None, "2026-01-02T00:00:00"),
+        ("C1", "SHARE_CREATED", None, "2026-01-05T00:00:00"),
+        ("C1", "SHARE_OPENED", None, "2026-01-03T00:00:00"),
+        ("N/A", "CASE_CREATED", None, "2026-01-01T00:00:00"),
+    ])
+    top = FunnelRepo.max_event_id()
+    FunnelRepo.apply_range(0, top)
+    FunnelRepo.apply_range(0, top)
+    assert FunnelRepo.last_event_id() == top
+    rows = FunnelRepo.cohort("2026-01-01", "2026-02-01", advisor_id="a1")
+    assert len(rows) == 1
+    assert (rows[0]["shared_at"], rows[0]["opened_at"]) == ("2026-01-02T00:00:00", "2026-01-03T00:00:00")
+    FunnelRepo.reset()
+    assert FunnelRepo.last_event_id() == 0 and FunnelRepo.cohort("2026-01-01", "2026-02-01") == []
+
+
+def test_funnel_rebuild_replays_archived_events(tmp_path, monkeypatch):
+    from src.services import event_retention, funnel
+    monkeypatch.setattr(event_retention, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(event_retention, "reclaim_space", lambda: 0)
+    _case("C1")
+    EventRepo.log_many([
+        ("C1", "CASE_CREATED", None, "2020-01-01T00:00:00"),
+        ("C1", "SHARE_CREATED", None, "2020-01-02T00:00:00"),
+    ])
+    assert event_retention.archive_once(retention_days=30) == 2
+    EventRepo.log("C1", "SHARE_OPENED")
+    funnel.rebuild()
+    rows = FunnelRepo.cohort("2020-01-01", "2020-02-01")
+    assert [(r["case_id"], r["shared_at"]) for r in rows] == [("C1", "2020-01-02T00:00:00")]
+    assert rows[0]["opened_at"] is not None
+
+
+# ---------- OtpRepo / ThrottleRepo ----------
+
+def test_otp_lifecycle():
+    OtpRepo.put("a@x.com", "h1", 60, now=1000)
+    assert OtpRepo.get_active("a@x.com", now=1030)["code_hash"] == "h1"
+    assert OtpRepo.get_active("a@x.com", now=1061) is None
+    assert [OtpRepo.add_failure("a@x.com") for _ in range(3)] == [1, 2, 3]
+    OtpRepo.put("a@x.com", "h2", 60, now=1100)
+    assert OtpRepo.get_active("a@x.com", now=1100)["attempts"] == 0
+    OtpRepo.put("b@x.com", "h3", 10, now=1000)
+    assert OtpRepo.sweep(now=1050) == 1
+    OtpRepo.delete("a@x.com")
+    assert OtpRepo.get_active("a@x.com", now=1100) is None
+    assert OtpRepo.add_failure("nobody@x.com") == 0
+
+
+def test_throttle_bucket_and_lock():
+    assert [ThrottleRepo.take("k", 2, 60, now=1000) for _ in range(3)] == [True, True, False]
+    assert ThrottleRepo.take("k", 2, 60, now=1030)          # 30 秒補回 1 個
+    ThrottleRepo.lock("lock:a", 600, now=1000)
+    assert ThrottleRepo.locked_for("lock:a", now=1100) == 500
+    ThrottleRepo.unlock("lock:a")
+    assert ThrottleRepo.locked_for("lock:a", now=1100) == 0
+    assert ThrottleRepo.sweep(now=10_000) == 2
+
+
+def test_throttle_take_all_rolls_back_on_denial():
+    assert ThrottleRepo.take("ip:1", 1, 60, now=1000)
+    denied = ThrottleRepo.take_all([("email:a", 1, 60), ("ip:1", 1, 60)], now=1000)
+    assert denied == "ip:1"
+    # email 的額度沒有被扣
+    assert ThrottleRepo.take_all([("email:a", 1, 60)], now=1000) is None
+
+
+# ---------- ShareRepo ----------
+
+def test_share_create_lookup_and_page():
+    _case("C1")
+    tokens = [ShareRepo.create("C1", "a1")["token"] for _ in range(5)]
+    expired = ShareRepo.create("C1", "a1", days_valid=-1)["token"]
+    assert ShareRepo.get_by_token(tokens[0])["case_id"] == "C1"
+    assert ShareRepo.get_by_token(expired) is None
+    assert ShareRepo.get_by_token(expired, include_expired=True) is not None
+    assert len(ShareRepo.list_by_advisor("a1")) == 5
+
+    seen = _pages(lambda after: ShareRepo.page_by_advisor("a1", after=after, limit=2))
+    assert seen == sorted(seen, reverse=True) and len(seen) == 5
+    rows, _ = ShareRepo.page_by_advisor("a1", expiry="expired")
+    assert [r["token"] for r in rows] == [expired]
+    assert ShareRepo.page_by_advisor("a1", status="Won")[0] == []
+
+
+def test_share_counters_archive_and_delete():
+    _case("C1")
+    tok = ShareRepo.create("C1", "a1")["token"]
+    old = ShareRepo.create("C1", "a1", days_valid=-60)["token"]
+    row = {"token": tok, "opens": 2, "accepts": 1, "visitors": ["v1", "v2"],
+           "first_opened_at": "2026-01-01T00:00:00", "last_opened_at": "2026-01-02T00:00:00",
+           "last_accepted_at": "2026-01-02T00:00:00"}
+    ShareRepo.apply_counters([row])
+    ShareRepo.apply_counters([{**row, "opens": 1, "accepts": 0, "visitors": ["v1"]}])
+    stats = ShareRepo.list_by_advisor("a1")[0]
+    assert (stats["opens"], stats["unique_visitors"], stats["accepts"]) == (3, 2, 1)
+    ShareRepo.mark_opened(tok, "2025-12-31T00:00:00")
+    assert ShareRepo.get_by_token(tok)["opened_at"] == "2026-01-01T00:00:00"   # 只記第一次
+    ShareRepo.mark_accepted(tok, "2026-01-05T00:00:00")
+    assert ShareRepo.get_by_token(tok)["accepted_at"] == "2026-01-02T00:00:00"
+
+    before = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    assert ShareRepo.archive_expired(before=before) == 1
+    assert ShareRepo.get_by_token(old, include_expired=True) is None
+    assert ShareRepo.archive_expired(before=before) == 0
+
+    ShareRepo.apply_counters([{**row, "token": "gone"}])
+    assert ShareRepo.purge_orphan_stats() == 1
+    assert ShareRepo.delete_by_token(tok) and not ShareRepo.delete_by_token(tok)
+
+
+# ---------- SlotRepo / BookingRepo ----------
+
+def test_slots_reserve_respects_capacity():
+    t1, t2 = _future_slot(hour=10), _future_slot(hour=11)
+    assert SlotRepo.upsert_slots("a1", [(t1, t1, 1), (t2, t2, 2)]) == 2
+    s1, s2 = (s["id"] for s in SlotRepo.list_by_advisor("a1"))
+    assert SlotRepo.reserve(s1, {"case_id": "C1"})
+    assert SlotRepo.reserve(s1, {"case_id": "C2"}) is None
+    assert [s["id"] for s in SlotRepo.open_slots(advisor_id="a1")] == [s2]
+    SlotRepo.upsert_slots("a1", [(t1, t1, 0)])              # 容量不會低於已預約數
+    assert SlotRepo.get(s1)["capacity"] == 1
+    assert not SlotRepo.delete_unbooked(s1, "a1")
+    assert SlotRepo.delete_unbooked(s2, "a1") and SlotRepo.get(s2) is None
+
+
+def test_slots_concurrent_reserve_never_overbooks():
+    t = _future_slot()
+    SlotRepo.upsert_slots("a1", [(t, t, 3)])
+    sid = SlotRepo.list_by_advisor("a1")[0]["id"]
+    results = []
+    def grab(i):
+        results.append(SlotRepo.reserve(sid, {"case_id": f"C{i}"}))
+    threads = [threading.Thread(target=grab, args=(i,)) for i in range(12)]
+    for th in threads: th.start()
+    for th in threads: th.join()
+    assert len([r for r in results if r]) == 3
+    assert SlotRepo.get(sid)["booked"] == 3
+
+
+def test_bookings_page_and_counts():
+    ids = [BookingRepo.create({"case_id": "C1" if i % 2 else "C2", "name": f"n{i}"}) for i in range(6)]
+    assert BookingRepo.get(ids[0])["status"] == "Pending"
+    assert _pages(lambda after: BookingRepo.page(after=after, limit=4)) == list(reversed(ids))
+    assert _pages(lambda after: BookingRepo.page(case_id="C1", after=after, limit=2)) == ids[5::-2]
+    BookingRepo.bulk_set_status(ids[:2], "Confirmed")
+    assert BookingRepo.count_by_status() == {"Pending": 4, "Confirmed": 2}
+    assert [r["id"] for r in BookingRepo.page(status="Confirmed")[0]] == [ids[1], ids[0]]
+    with pytest.raises(ValueError):
+        BookingRepo.bulk_set_status(ids, "Bogus")
+
+
+def test_booking_cancel_and_reopen_keep_slot_capacity():
+    t = _future_slot()
+    SlotRepo.upsert_slots("a1", [(t, t, 1)])
+    sid = SlotRepo.list_by_advisor("a1")[0]["id"]
+    b1 = SlotRepo.reserve(sid, {"case_id": "C1"})
+    assert [c["id"] for c in BookingRepo.bulk_set_status([b1], "Cancelled")] == [b1]
+    assert SlotRepo.get(sid)["booked"] == 0
+    b2 = SlotRepo.reserve(sid, {"case_id": "C2"})
+    # 原時段已被別人訂走：不可重新開啟
+    assert BookingRepo.bulk_set_status([b1], "Pending") == []
+    assert BookingRepo.get(b1)["status"] == "Cancelled" and SlotRepo.get(sid)["booked"] == 1
+    BookingRepo.bulk_set_status([b2], "Cancelled")
+    assert [c["id"] for c in BookingRepo.bulk_set_status([b1], "Pending")] == [b1]
+    assert SlotRepo.get(sid)["booked"] == 1
+    # 沒綁時段的預約照常轉換
+    free = BookingRepo.create({"case_id": "C3", "status": "Cancelled"})
+    assert [c["id"] for c in BookingRepo.bulk_set_status([free], "Pending")] == [free]